@@ -1,268 +1,292 @@
 
 
 
+from functools import lru_cache
 from urllib import request
 
 from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
 
+from notificacao.utils import resumo_notificacoes
 from vendas.models import Loja
 
 
-def menu_items(request):
-    items = [
-        {
-            "label": "Menu Principal",
-            "url_name": "vendas:index",
-            "icon": "bx bx-home-circle",
-            "permission": "vendas.view_loja",
-            "section": "Início",
-        },
-        {
-            "label": "Produtos",
-            "icon": "bx bx-mobile",
-            "permission": "produtos.view_produto",
-            "section": "Produtos",
-            "sub_items": [
-                {
-                    "label": "Produtos",
-                    "url_name": "produtos:produtos",
-                    "permission": "produtos.view_produto",
-                },
+MENU_ITEMS = [
+    {
+        "label": "Menu Principal",
+        "url_name": "vendas:index",
+        "icon": "bx bx-home-circle",
+        "permission": "vendas.view_loja",
+        "section": "Início",
+    },
+    {
+        "label": "Produtos",
+        "icon": "bx bx-mobile",
+        "permission": "produtos.view_produto",
+        "section": "Produtos",
+        "sub_items": [
+            {
+                "label": "Produtos",
+                "url_name": "produtos:produtos",
+                "permission": "produtos.view_produto",
+            },
 
-                {
-                    "label": "Tipo",
-                    "url_name": "produtos:tipos",
-                    "permission": "produtos.view_tipoproduto",
-                },
-            ]
-        },
-        {          
-            "label": "Caixa",
-            "icon": "bx bx-cart",
-            "permission": "vendas.view_caixa",
-            "url_name": "vendas:caixa_list",
-            "section": "Vendas"
-        },
-        {          
-            "label": "Gráfico",
-            "icon": "bx bx-chart",
-            "permission": "vendas.can_view_all_dashboard",
-            "url_name": "vendas:grafico",
-            "section": "Gráfico"
-        },
-        {
-            "label": "Estoque",
-            "icon": "bx bx-box",
-            "permission": "estoque.view_estoque",
-            "sub_items": [
-                {
-                    "label": "Ver Estoque",
-                    "url_name": "estoque:estoque_list",
-                    "permission": "estoque.view_estoque"
-                },
-                {
-                    "label": "Estoque",
-                    "url_name": "estoque:estoque_imei_list",
-                    "permission": "estoque.view_estoqueimei"  
-                },
-                {
-                    "label": "Ver Entradas",
-                    "url_name": "estoque:entrada_list",
-                    "permission": "estoque.view_entradaestoque"
-                },
-                {
-                    "label": "Adicionar Entrada",
-                    "url_name": "estoque:estoque_entrada",
-                    "permission": "estoque.add_entradaestoque"
-                },
-                {
-                    "label": "Fornecedores",
-                    "url_name": "estoque:fornecedores",
-                    "permission": "estoque.view_fornecedor"
-                }
-            ],
-            "section": "Estoque"
-        },   
-        {
-            "label": "Vendas",
-            "icon": "bx bx-box",
-            "permission": "vendas.view_vendas",
-            "section": "Vendas",
-            "sub_items": [
-                {
-                    "label": "Vendas",
-                    "url_name": "vendas:venda_list",
-                    "permission": "vendas.view_venda"
-                },
-                {
-                    "label": "Produtos Vendidos",
-                    "url_name": "vendas:produto_vendido_list",
-                    "permission": "vendas.can_view_produtos_vendidos"
-                },
-                {
-                    "label": "Solicitações de Venda",
-                    "url_name": "vendas:cliente_list",
-                    "permission": "vendas.view_cliente"
-                },
-                {
-                    "label": "Tipo pagamento",
-                    "url_name": "vendas:tipos_pagamento",
-                    "permission": "vendas.view_tipopagamento"
-                },
-            ],
-        },
-        {
-            "label": "Financeiro",
-            "icon": "bx bx-dollar-circle",
-            "permission": "financeiro.view_caixamensal",
-            "section": "Financeiro",
-            "sub_items": [
-                {
-                    "label": "Caixa",
-                    "url_name": "vendas:caixa_list",
-                    "permission": "auth.view_user"
-                },
-                {
-                    "label": "Caixa Total",
-                    "url_name": "vendas:caixa_total",
-                    "permission": "vendas.view_caixa"
-                },
-                {
-                    "label": "Relatório de Solicitações",
-                    "url_name": "vendas:form_solicitacao_relatorio",
-                    "permission": "vendas.can_generate_report_sale"
-                },
-                {
-                    "label": "Relatório de Vendas",
-                    "url_name": "vendas:venda_relatorio",
-                    "permission": "vendas.can_generate_report_sale"
-                },
-                {
-                    "label": "Relatório de Saidas",
-                    "url_name": "financeiro:relatorio_saidas",
-                    "permission": "vendas.can_generate_report_sale"
-                },
-                {
-                    "label": "Contas a Receber",
-                    "url_name": "financeiro:contas_a_receber_list",
-                    "permission": "vendas.view_pagamento"
-                },
-                {
-                    "label": "Relatório Contas a Receber",
-                    "url_name": "financeiro:relatorio_contas_a_receber",
-                    "permission": "vendas.view_pagamento"
-                },
-                {
-                    "label": "Fechamentos Mensais",
-                    "url_name": "financeiro:caixa_mensal_list",
-                    "permission": "financeiro.view_caixamensal"
-                },
-                {
-                    "label": "Gastos Fixos",
-                    "url_name": "financeiro:gasto_fixo_list",
-                    "permission": "financeiro.view_gastofixo"
-                }
-            ]
-        },
-        {
-            "label": "Assistência",
-            "icon": "bx bx-wrench",
-            "permission": "assistencia.view_assistencia",
-            "section": "Assistência",
-            "sub_items": [
-                {
-                    "label": "Caixa Assistência",
-                    "url_name": "assistencia:caixa_assistencia_list",
-                    "permission": "assistencia.view_assistencia"
-                },
-                {
-                    "label": "Ordens de Serviço",
-                    "url_name": "assistencia:ordem_servico_list",
-                    "permission": "assistencia.view_ordemservico"
-                }
-            ]
-        },
-        {
-            "label": "Usuários",
-            "icon": "bx bx-user",
-            "permission": "auth.view_user",
-            "section": "Configurações",
-            "sub_items": [
-                {
-                    "label": "Usuários",
-                    "url_name": "accounts:user_list",
-                    "permission": "accounts.view_user"
-                },
-                {
-                    "label": "Grupos",
-                    "url_name": "accounts:group_list",
-                    "permission": "auth.view_group"
-                },
-                {
-                    "label": "Permissões",
-                    "url_name": "accounts:permissions_list",
-                    "permission": "auth.view_permission"
-                },
-            ]
-        },
-        {
-            "label": "Lojas",
-            "url_name": "vendas:loja_list",
-            "icon": "bx bx-store",
-            "permission": "vendas.view_loja",
-            "section": "Configurações",
-        },
-        {
-            "label": "Meu Perfil",
-            "url_name": "accounts:my_profile_update",
-            "icon": "bx bx-user",
-            "permission": "accounts.view_own_user",
-            "section": "Configurações",
-        }, 
+            {
+                "label": "Tipo",
+                "url_name": "produtos:tipos",
+                "permission": "produtos.view_tipoproduto",
+            },
+        ]
+    },
+    {          
+        "label": "Caixa",
+        "icon": "bx bx-cart",
+        "permission": "vendas.view_caixa",
+        "url_name": "vendas:caixa_list",
+        "section": "Vendas"
+    },
+    {          
+        "label": "Gráfico",
+        "icon": "bx bx-chart",
+        "permission": "vendas.can_view_all_dashboard",
+        "url_name": "vendas:grafico",
+        "section": "Gráfico"
+    },
+    {
+        "label": "Estoque",
+        "icon": "bx bx-box",
+        "permission": "estoque.view_estoque",
+        "sub_items": [
+            {
+                "label": "Ver Estoque",
+                "url_name": "estoque:estoque_list",
+                "permission": "estoque.view_estoque"
+            },
+            {
+                "label": "Estoque",
+                "url_name": "estoque:estoque_imei_list",
+                "permission": "estoque.view_estoqueimei"  
+            },
+            {
+                "label": "Ver Entradas",
+                "url_name": "estoque:entrada_list",
+                "permission": "estoque.view_entradaestoque"
+            },
+            {
+                "label": "Adicionar Entrada",
+                "url_name": "estoque:estoque_entrada",
+                "permission": "estoque.add_entradaestoque"
+            },
+            {
+                "label": "Fornecedores",
+                "url_name": "estoque:fornecedores",
+                "permission": "estoque.view_fornecedor"
+            }
+        ],
+        "section": "Estoque"
+    },   
+    {
+        "label": "Vendas",
+        "icon": "bx bx-box",
+        "permission": "vendas.view_vendas",
+        "section": "Vendas",
+        "sub_items": [
+            {
+                "label": "Vendas",
+                "url_name": "vendas:venda_list",
+                "permission": "vendas.view_venda"
+            },
+            {
+                "label": "Produtos Vendidos",
+                "url_name": "vendas:produto_vendido_list",
+                "permission": "vendas.can_view_produtos_vendidos"
+            },
+            {
+                "label": "Solicitações de Venda",
+                "url_name": "vendas:cliente_list",
+                "permission": "vendas.view_cliente"
+            },
+            {
+                "label": "Tipo pagamento",
+                "url_name": "vendas:tipos_pagamento",
+                "permission": "vendas.view_tipopagamento"
+            },
+        ],
+    },
+    {
+        "label": "Financeiro",
+        "icon": "bx bx-dollar-circle",
+        "permission": "financeiro.view_caixamensal",
+        "section": "Financeiro",
+        "sub_items": [
+            {
+                "label": "Caixa",
+                "url_name": "vendas:caixa_list",
+                "permission": "auth.view_user"
+            },
+            {
+                "label": "Caixa Total",
+                "url_name": "vendas:caixa_total",
+                "permission": "vendas.view_caixa"
+            },
+            {
+                "label": "Relatório de Solicitações",
+                "url_name": "vendas:form_solicitacao_relatorio",
+                "permission": "vendas.can_generate_report_sale"
+            },
+            {
+                "label": "Relatório de Vendas",
+                "url_name": "vendas:venda_relatorio",
+                "permission": "vendas.can_generate_report_sale"
+            },
+            {
+                "label": "Relatório de Saidas",
+                "url_name": "financeiro:relatorio_saidas",
+                "permission": "vendas.can_generate_report_sale"
+            },
+            {
+                "label": "Contas a Receber",
+                "url_name": "financeiro:contas_a_receber_list",
+                "permission": "vendas.view_pagamento"
+            },
+            {
+                "label": "Relatório Contas a Receber",
+                "url_name": "financeiro:relatorio_contas_a_receber",
+                "permission": "vendas.view_pagamento"
+            },
+            {
+                "label": "Relatórios em Segundo Plano",
+                "url_name": "vendas:relatorio_job_list",
+                "permission": "vendas.can_generate_report_sale"
+            },
+            {
+                "label": "Fechamentos Mensais",
+                "url_name": "financeiro:caixa_mensal_list",
+                "permission": "financeiro.view_caixamensal"
+            },
+            {
+                "label": "Gastos Fixos",
+                "url_name": "financeiro:gasto_fixo_list",
+                "permission": "financeiro.view_gastofixo"
+            }
+        ]
+    },
+    {
+        "label": "Assistência",
+        "icon": "bx bx-wrench",
+        "permission": "assistencia.view_assistencia",
+        "section": "Assistência",
+        "sub_items": [
+            {
+                "label": "Caixa Assistência",
+                "url_name": "assistencia:caixa_assistencia_list",
+                "permission": "assistencia.view_assistencia"
+            },
+            {
+                "label": "Ordens de Serviço",
+                "url_name": "assistencia:ordem_servico_list",
+                "permission": "assistencia.view_ordemservico"
+            }
+        ]
+    },
+    {
+        "label": "Usuários",
+        "icon": "bx bx-user",
+        "permission": "auth.view_user",
+        "section": "Configurações",
+        "sub_items": [
+            {
+                "label": "Usuários",
+                "url_name": "accounts:user_list",
+                "permission": "accounts.view_user"
+            },
+            {
+                "label": "Grupos",
+                "url_name": "accounts:group_list",
+                "permission": "auth.view_group"
+            },
+            {
+                "label": "Permissões",
+                "url_name": "accounts:permissions_list",
+                "permission": "auth.view_permission"
+            },
+        ]
+    },
+    {
+        "label": "Lojas",
+        "url_name": "vendas:loja_list",
+        "icon": "bx bx-store",
+        "permission": "vendas.view_loja",
+        "section": "Configurações",
+    },
+    {
+        "label": "Meu Perfil",
+        "url_name": "accounts:my_profile_update",
+        "icon": "bx bx-user",
+        "permission": "accounts.view_own_user",
+        "section": "Configurações",
+    }, 
 
-    ]
-  
+]
 
-    current_path = request.path
 
+@lru_cache(maxsize=None)
+def _menu_compilado():
+    """MENU_ITEMS com as URLs já resolvidas; montado uma vez por processo, no primeiro request."""
+    compilado = []
+    for item in MENU_ITEMS:
+        if 'sub_items' in item:
+            item = dict(item, sub_items=[dict(sub, url=reverse(sub['url_name'])) for sub in item['sub_items']])
+        else:
+            item = dict(item, url=reverse(item['url_name']) if 'url_name' in item else None)
+        compilado.append(item)
+    return compilado
 
-    filtered_items = []
-    sections = {}
 
-    for item in items:
-        item['active'] = False
+@lru_cache(maxsize=64)
+def _menu_por_permissoes(permissoes):
+    """
+    Menu visível para um conjunto de permissões (frozenset), agrupado por seção, e o índice
+    caminho -> [(item, sub_item)] usado para marcar o item ativo sem percorrer o menu.
+    """
+    secoes = {}
+    por_caminho = {}
+    for item in _menu_compilado():
         if 'sub_items' in item:
-            visible_sub_items = []
-            for sub_item in item['sub_items']:
-                sub_item['url'] = reverse(sub_item['url_name'])
-                if sub_item.get('permission') in request.user.get_all_permissions():
-                    visible_sub_items.append(sub_item)
-                    if sub_item['url'] == current_path:
-                        item['active'] = True
-                        sub_item['active'] = True
-                    else:
-                        sub_item['active'] = False
-            item['sub_items'] = visible_sub_items
-            if visible_sub_items:
-                filtered_items.append(item)
+            visiveis = [dict(sub, active=False) for sub in item['sub_items'] if sub.get('permission') in permissoes]
+            if not visiveis:
+                continue
+            item = dict(item, sub_items=visiveis, active=False)
+            for sub in visiveis:
+                por_caminho.setdefault(sub['url'], []).append((item, sub))
+        elif item.get('permission') in permissoes:
+            item = dict(item, active=False)
+            por_caminho.setdefault(item['url'], []).append((item, None))
+        elif 'header' in item:
+            item = dict(item, active=False)
         else:
-            item['url'] = reverse(item['url_name']) if 'url_name' in item else None
-            if item.get('permission') in request.user.get_all_permissions():
-                filtered_items.append(item)
-                if item['url'] == current_path:
-                    item['active'] = True
-            elif 'header' in item:
-                filtered_items.append(item)
+            continue
+        secoes.setdefault(item['section'], []).append(item)
+    return secoes, por_caminho
 
 
-    for item in filtered_items:
-        section = item['section']
-        if section not in sections:
-            sections[section] = []
-        sections[section].append(item)
+def _marcar_ativos(secoes, ativos):
+    # copia só os itens ativos; o restante continua compartilhado com o menu em cache
+    substitutos = {}
+    for item, sub in ativos:
+        novo = substitutos.get(id(item)) or dict(item, active=True)
+        if sub is not None:
+            novo['sub_items'] = [dict(s, active=True) if s is sub else s for s in novo['sub_items']]
+        substitutos[id(item)] = novo
+    return {secao: [substitutos.get(id(item), item) for item in itens] for secao, itens in secoes.items()}
 
 
-    return {'menu_items': sections}
+def menu_items(request):
+    secoes, por_caminho = _menu_por_permissoes(frozenset(request.user.get_all_permissions()))
+    ativos = por_caminho.get(request.path)
+    if ativos:
+        secoes = _marcar_ativos(secoes, ativos)
+    return {'menu_items': secoes}
 
 
 def loja(request):
@@ -276,7 +300,10 @@ def loja(request):
 
 def notificacoes_usuario(request):
     if request.user.is_authenticated:
+        # preguiçoso: páginas que não mostram o sino não tocam no cache nem no banco
+        resumo = SimpleLazyObject(lambda: resumo_notificacoes(request.user))
         return {
-            "notificacoes_nao_lidas": request.user.notifications.unread()[:5]
+            "notificacoes_nao_lidas": SimpleLazyObject(lambda: resumo['ultimas']),
+            "total_notificacoes_nao_lidas": SimpleLazyObject(lambda: resumo['total']),
         }
     return {}
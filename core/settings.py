@@ -79,6 +79,23 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Com REDIS_URL (ex.: redis://redis:6379/0) o channel layer passa a ser compartilhado entre os processos do daphne
+# e os workers; sem ela continua em memória (um processo só, como no desenvolvimento e nos testes).
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CHANNEL_LAYERS['default'] = {
+        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "CONFIG": {
+            "hosts": [REDIS_URL],
+            # mensagens por canal antes de descartar (conexão lenta não acumula sem limite)
+            "capacity": int(os.environ.get('CHANNEL_LAYER_CAPACITY', 100)),
+            # segundos que uma mensagem não lida fica no Redis
+            "expiry": int(os.environ.get('CHANNEL_LAYER_EXPIRY', 60)),
+            # segundos de validade da inscrição em grupo; o consumer renova antes de expirar
+            "group_expiry": int(os.environ.get('CHANNEL_LAYER_GROUP_EXPIRY', 3600)),
+        },
+    }
+
 # Tell select2 which cache configuration to use:
 SELECT2_CACHE_BACKEND = "select2"
 
@@ -127,6 +144,16 @@ CACHES = {
     }
 }
 
+# os caches de notificações, destinatários e dados da geração de venda precisam valer para todos os processos
+if REDIS_URL:
+    CACHES['default'] = {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": os.environ.get('CACHE_REDIS_URL', REDIS_URL),
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+        },
+    }
+
 SELECT2_CACHE_BACKEND = "select2"
 
 DATA_UPLOAD_MAX_MEMORY_SIZE = 52428800
@@ -260,4 +287,8 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
\ No newline at end of file
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+# Relatórios em segundo plano: pedidos idênticos dentro desta janela reaproveitam o arquivo gerado
+RELATORIO_CACHE_SEGUNDOS = int(os.environ.get('RELATORIO_CACHE_SEGUNDOS', 600))
+# Jobs em processamento há mais tempo que isso são dados como perdidos (worker caiu) e reenfileirados
+RELATORIO_TEMPO_MAXIMO_SEGUNDOS = int(os.environ.get('RELATORIO_TEMPO_MAXIMO_SEGUNDOS', 1800))
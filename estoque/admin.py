@@ -23,7 +23,7 @@ class EntradaEstoqueAdmin(AdminBase):
 
 @admin.register(Estoque)
 class EstoqueAdmin(AdminBase):
-  list_display = ('produto', 'quantidade_disponivel') + AdminBase.list_display
+  list_display = ('produto', 'quantidade_disponivel', 'custo_medio_ponderado', 'preco_medio_ponderado') + AdminBase.list_display
   search_fields = ('produto__nome',)
   list_filter = ('produto',)
   actions = ['trocar_para_credfacil']
@@ -100,4 +100,11 @@ class EstoqueImeiAdmin(AdminBase):
           entrada.save()
       self.message_user(request, "Produtos trocados para CredFácil com sucesso.")
   trocar_para_credfacil.short_description = "Trocar produto para loja CredFácil"
-  
\ No newline at end of file
+  
+
+@admin.register(CustoProduto)
+class CustoProdutoAdmin(AdminBase):
+  list_display = ('produto', 'ultimo_custo', 'custo_medio', 'quantidade_entradas') + AdminBase.list_display
+  search_fields = ('produto__nome',)
+  list_filter = ('loja',)
+  readonly_fields = ('produto', 'ultimo_custo', 'custo_medio', 'quantidade_entradas', 'ultima_entrada') + AdminBase.readonly_fields
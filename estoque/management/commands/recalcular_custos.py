@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from estoque.models import CustoProduto, Estoque
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstrói a base de custo dos produtos (CustoProduto) e as médias ponderadas de custo '
+        'e preço dos estoques a partir das entradas de estoque.'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            produtos = CustoProduto.reconstruir()
+            estoques = Estoque.recalcular_valores()
+        self.stdout.write(self.style.SUCCESS(
+            f'Base de custo recalculada para {produtos} produto(s) e médias de {estoques} estoque(s).'
+        ))
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0034_alter_estoqueimei_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='estoqueimei',
+            index=models.Index(fields=['loja', 'vendido', 'cancelado', 'produto'], name='estoqueimei_loja_status_idx'),
+        ),
+    ]
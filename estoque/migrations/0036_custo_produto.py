@@ -0,0 +1,39 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('produtos', '0021_add_parcelamento_4x_6x_8x'),
+        ('vendas', '0125_indices_filtros'),
+        ('estoque', '0035_indices_filtros'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustoProduto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('modificado_em', models.DateTimeField(auto_now=True)),
+                ('ultimo_custo', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Custo da Última Entrada')),
+                ('custo_medio', models.DecimalField(decimal_places=4, default=0, max_digits=12, verbose_name='Custo Médio Ponderado')),
+                ('quantidade_entradas', models.PositiveIntegerField(default=0, verbose_name='Quantidade com Custo')),
+                ('criado_por', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)s_criadas', to=settings.AUTH_USER_MODEL)),
+                ('loja', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)s_loja', to='vendas.loja')),
+                ('modificado_por', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)s_modificadas', to=settings.AUTH_USER_MODEL)),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='custos', to='produtos.produto')),
+                ('ultima_entrada', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='estoque.produtoentrada')),
+            ],
+            options={
+                'verbose_name': 'Custo do Produto',
+                'verbose_name_plural': 'Custos dos Produtos',
+                'unique_together': {('loja', 'produto')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0036_custo_produto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='estoque',
+            name='custo_medio_ponderado',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Custo Médio'),
+        ),
+        migrations.AddField(
+            model_name='estoque',
+            name='preco_medio_ponderado',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Preço Médio'),
+        ),
+        migrations.AddField(
+            model_name='estoque',
+            name='quantidade_valorizada',
+            field=models.IntegerField(default=0, verbose_name='Quantidade das Entradas'),
+        ),
+        migrations.AddField(
+            model_name='estoque',
+            name='valor_total_custo',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Custo Total das Entradas'),
+        ),
+        migrations.AddField(
+            model_name='estoque',
+            name='valor_total_venda',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Venda Total das Entradas'),
+        ),
+    ]
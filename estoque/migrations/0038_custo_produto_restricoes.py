@@ -0,0 +1,63 @@
+# Generated by Django 4.2.16 on 2026-10-18 16:05
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, Sum
+
+
+def preencher_custos(apps, schema_editor):
+    """Refaz CustoProduto a partir das entradas já gravadas (mesmo cálculo de CustoProduto.recalcular)."""
+    CustoProduto = apps.get_model('estoque', 'CustoProduto')
+    ProdutoEntrada = apps.get_model('estoque', 'ProdutoEntrada')
+
+    CustoProduto.objects.all().delete()
+    pares = ProdutoEntrada.objects.order_by().values_list('produto_id', 'loja_id').distinct()
+    escopos = set()
+    for produto_id, loja_id in pares:
+        escopos.add((produto_id, None))
+        if loja_id:
+            escopos.add((produto_id, loja_id))
+
+    custos = []
+    for produto_id, loja_id in escopos:
+        entradas = ProdutoEntrada.objects.filter(produto_id=produto_id)
+        if loja_id:
+            entradas = entradas.filter(loja_id=loja_id)
+        ultima = entradas.order_by('-entrada__data_entrada', '-pk').values_list('pk', 'custo_unitario').first()
+        totais = entradas.filter(custo_unitario__isnull=False).aggregate(
+            qtd=Sum('quantidade'),
+            total=Sum(F('custo_unitario') * F('quantidade'), output_field=DecimalField(max_digits=16, decimal_places=2)),
+        )
+        quantidade = totais['qtd'] or 0
+        custos.append(CustoProduto(
+            produto_id=produto_id,
+            loja_id=loja_id,
+            ultima_entrada_id=ultima[0],
+            ultimo_custo=ultima[1] or 0,
+            custo_medio=totais['total'] / quantidade if quantidade else 0,
+            quantidade_entradas=quantidade,
+        ))
+    CustoProduto.objects.bulk_create(custos, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0037_estoque_medias_ponderadas'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='custoproduto',
+            unique_together=set(),
+        ),
+        # preenche antes das restrições: remove também linhas consolidadas repetidas
+        migrations.RunPython(preencher_custos, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='custoproduto',
+            constraint=models.UniqueConstraint(fields=('loja', 'produto'), name='custo_produto_loja_unico'),
+        ),
+        migrations.AddConstraint(
+            model_name='custoproduto',
+            constraint=models.UniqueConstraint(condition=models.Q(('loja__isnull', True)), fields=('produto',), name='custo_produto_consolidado_unico'),
+        ),
+    ]
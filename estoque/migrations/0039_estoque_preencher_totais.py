@@ -0,0 +1,49 @@
+# Generated by Django 4.2.16 on 2026-10-18 16:09
+
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def preencher_totais(apps, schema_editor):
+    """Totais e médias ponderadas dos estoques a partir das entradas (mesmo cálculo de Estoque.recalcular_valores)."""
+    Estoque = apps.get_model('estoque', 'Estoque')
+    ProdutoEntrada = apps.get_model('estoque', 'ProdutoEntrada')
+
+    valor = DecimalField(max_digits=14, decimal_places=2)
+    totais = {
+        (linha['produto_id'], linha['loja_id']): linha
+        for linha in ProdutoEntrada.objects.order_by().values('produto_id', 'loja_id').annotate(
+            qtd=Sum('quantidade'),
+            custo=Sum(Coalesce(F('custo_unitario'), Value(Decimal('0'))) * F('quantidade'), output_field=valor),
+            venda=Sum(Coalesce(F('venda_unitaria'), Value(Decimal('0'))) * F('quantidade'), output_field=valor),
+        )
+    }
+    estoques = list(Estoque.objects.all())
+    for estoque in estoques:
+        linha = totais.get((estoque.produto_id, estoque.loja_id), {})
+        estoque.quantidade_valorizada = linha.get('qtd') or 0
+        estoque.valor_total_custo = linha.get('custo') or Decimal('0.00')
+        estoque.valor_total_venda = linha.get('venda') or Decimal('0.00')
+        if estoque.quantidade_valorizada > 0:
+            estoque.custo_medio_ponderado = (estoque.valor_total_custo / estoque.quantidade_valorizada).quantize(Decimal('0.01'))
+            estoque.preco_medio_ponderado = (estoque.valor_total_venda / estoque.quantidade_valorizada).quantize(Decimal('0.01'))
+        else:
+            estoque.custo_medio_ponderado = estoque.preco_medio_ponderado = Decimal('0.00')
+    Estoque.objects.bulk_update(estoques, [
+        'quantidade_valorizada', 'valor_total_custo', 'valor_total_venda',
+        'custo_medio_ponderado', 'preco_medio_ponderado',
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0038_custo_produto_restricoes'),
+    ]
+
+    operations = [
+        migrations.RunPython(preencher_totais, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.16 on 2026-10-18 16:55
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, Q, Sum
+
+
+def preencher_quantidade_custo(apps, schema_editor):
+    """Custo médio só das entradas com custo (mesmo cálculo de Estoque.recalcular_valores e de CustoProduto)."""
+    Estoque = apps.get_model('estoque', 'Estoque')
+    ProdutoEntrada = apps.get_model('estoque', 'ProdutoEntrada')
+
+    totais = {
+        (linha['produto_id'], linha['loja_id']): linha
+        for linha in ProdutoEntrada.objects.order_by().values('produto_id', 'loja_id').annotate(
+            qtd_custo=Sum('quantidade', filter=Q(custo_unitario__isnull=False)),
+            custo=Sum(F('custo_unitario') * F('quantidade'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+        )
+    }
+    estoques = list(Estoque.objects.all())
+    for estoque in estoques:
+        linha = totais.get((estoque.produto_id, estoque.loja_id), {})
+        estoque.quantidade_custo = linha.get('qtd_custo') or 0
+        estoque.valor_total_custo = linha.get('custo') or Decimal('0.00')
+        if estoque.quantidade_custo > 0:
+            estoque.custo_medio_ponderado = (estoque.valor_total_custo / estoque.quantidade_custo).quantize(Decimal('0.01'))
+        else:
+            estoque.custo_medio_ponderado = Decimal('0.00')
+    Estoque.objects.bulk_update(estoques, ['quantidade_custo', 'valor_total_custo', 'custo_medio_ponderado'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0039_estoque_preencher_totais'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='estoque',
+            name='quantidade_custo',
+            field=models.IntegerField(default=0, verbose_name='Quantidade das Entradas com Custo'),
+        ),
+        migrations.RunPython(preencher_quantidade_custo, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,8 @@
-from django.db import models
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from produtos.models import Produto
 from vendas.models import Base
 from django.urls import reverse
 import datetime
@@ -100,6 +104,77 @@ class ProdutoEntrada(Base):
         ordering = ['entrada__data_entrada']
         
 
+class CustoProduto(Base):
+    """
+    Base de custo atual do produto, mantida pelos sinais de ProdutoEntrada: custo da última
+    entrada e custo médio ponderado pela quantidade. A linha com loja vazia consolida todas as
+    lojas (é a usada no custo e no lucro das vendas); as demais são por loja.
+    """
+    produto = models.ForeignKey('produtos.Produto', on_delete=models.CASCADE, related_name='custos')
+    ultimo_custo = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Custo da Última Entrada')
+    custo_medio = models.DecimalField(max_digits=12, decimal_places=4, default=0, verbose_name='Custo Médio Ponderado')
+    quantidade_entradas = models.PositiveIntegerField(default=0, verbose_name='Quantidade com Custo')
+    ultima_entrada = models.ForeignKey(ProdutoEntrada, on_delete=models.SET_NULL, related_name='+', blank=True, null=True)
+
+    @classmethod
+    def recalcular(cls, produto_id, loja_id=None):
+        """
+        Recalcula a linha consolidada do produto e, se informada, a da loja.
+
+        O produto é travado durante o recálculo: no MySQL a restrição da linha consolidada (loja
+        vazia) não é criada, e duas entradas simultâneas do mesmo produto gravariam duas linhas.
+        """
+        with transaction.atomic():
+            list(Produto.objects.select_for_update().filter(pk=produto_id).values_list('pk', flat=True))
+            entradas = ProdutoEntrada.objects.filter(produto_id=produto_id)
+            escopos = [(None, entradas)]
+            if loja_id:
+                escopos.append((loja_id, entradas.filter(loja_id=loja_id)))
+
+            for loja, queryset in escopos:
+                ultima = queryset.order_by('-entrada__data_entrada', '-pk').values_list('pk', 'custo_unitario').first()
+                if not ultima:
+                    cls.objects.filter(produto_id=produto_id, loja_id=loja).delete()
+                    continue
+                totais = queryset.filter(custo_unitario__isnull=False).aggregate(
+                    qtd=Sum('quantidade'),
+                    total=Sum(F('custo_unitario') * F('quantidade'), output_field=DecimalField(max_digits=16, decimal_places=2)),
+                )
+                quantidade = totais['qtd'] or 0
+                cls.objects.update_or_create(
+                    produto_id=produto_id, loja_id=loja,
+                    defaults={
+                        'ultima_entrada_id': ultima[0],
+                        'ultimo_custo': ultima[1] or 0,
+                        'custo_medio': totais['total'] / quantidade if quantidade else 0,
+                        'quantidade_entradas': quantidade,
+                    },
+                )
+
+    @classmethod
+    def reconstruir(cls):
+        """Refaz a tabela a partir de todas as entradas; retorna quantos produtos foram calculados."""
+        pares = ProdutoEntrada.objects.order_by().values_list('produto_id', 'loja_id').distinct()
+        cls.objects.all().delete()
+        produtos = set()
+        for produto_id, loja_id in pares:
+            cls.recalcular(produto_id, loja_id)
+            produtos.add(produto_id)
+        return len(produtos)
+
+    def __str__(self):
+        return f"Custo de {self.produto.nome}: {self.ultimo_custo}"
+
+    class Meta:
+        # a linha consolidada tem loja vazia, que não conta como repetida num único (loja, produto)
+        constraints = [
+            models.UniqueConstraint(fields=['loja', 'produto'], name='custo_produto_loja_unico'),
+            models.UniqueConstraint(fields=['produto'], condition=models.Q(loja__isnull=True), name='custo_produto_consolidado_unico'),
+        ]
+        verbose_name = 'Custo do Produto'
+        verbose_name_plural = 'Custos dos Produtos'
+
+
 class EstoqueImei(Base):
     produto = models.ForeignKey('produtos.Produto', on_delete=models.CASCADE, related_name='estoque_imei')
     renavam = models.CharField(max_length=20, verbose_name='RENAVAM')
@@ -137,11 +212,25 @@ class EstoqueImei(Base):
         permissions = (
             ('can_view_all_renavam', 'Pode visualizar todos os RENAVAM'),
         )
+        # buscas por renavam usam o índice do unique_together (renavam, produto, loja)
+        indexes = [
+            models.Index(fields=['loja', 'vendido', 'cancelado', 'produto'], name='estoqueimei_loja_status_idx'),
+        ]
 
 
 class Estoque(Base):
     produto = models.ForeignKey('produtos.Produto', on_delete=models.CASCADE, related_name='estoque_atual')
     quantidade_disponivel = models.PositiveIntegerField(default=0)
+    # totais das entradas da loja, mantidos pelos sinais de ProdutoEntrada
+    quantidade_valorizada = models.IntegerField(default=0, verbose_name='Quantidade das Entradas')
+    # entradas sem custo informado ficam fora do custo médio, como em CustoProduto.custo_medio
+    quantidade_custo = models.IntegerField(default=0, verbose_name='Quantidade das Entradas com Custo')
+    valor_total_custo = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Custo Total das Entradas')
+    valor_total_venda = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Venda Total das Entradas')
+    custo_medio_ponderado = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Custo Médio')
+    preco_medio_ponderado = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name='Preço Médio')
+
+    CAMPOS_TOTAIS = ('quantidade_valorizada', 'quantidade_custo', 'valor_total_custo', 'valor_total_venda')
 
     def quantidade(self):
         # busca todas unidades do produto no estoque dessa loja
@@ -156,34 +245,69 @@ class Estoque(Base):
         return self.produto.entradas_estoque.last()
     
     def preco_medio(self):
-        qtd_entradas = self.produto.entradas_estoque.count()
-        total = 0
-        for entrada in self.produto.entradas_estoque.all():
-            if entrada.venda_unitaria is not None:
-                total += entrada.venda_unitaria or 0
-            else:
-                total += 0
+        return self.preco_medio_ponderado
 
-        if qtd_entradas > 0:
-            preco_medio = total / qtd_entradas
-            preco_formatado = f"{preco_medio:.2f}"
-            return preco_formatado
-        return 0
-    
     def preco_medio_custo(self):
-        qtd_entradas = self.produto.entradas_estoque.count()
-        total = 0
-        for entrada in self.produto.entradas_estoque.all():
-            if entrada.custo_unitario is not None:
-                total += entrada.custo_unitario or 0
-            else:
-                total += 0
-        
-        if qtd_entradas > 0:
-            preco_medio = total / qtd_entradas
-            preco_formatado = f"{preco_medio:.2f}"
-            return preco_formatado
-        return 0
+        return self.custo_medio_ponderado
+
+    def registrar_valores_entrada(self, quantidade, custo_unitario, venda_unitaria):
+        """
+        Soma uma entrada (ou a retira, com quantidade negativa) nos totais do estoque e
+        atualiza as médias ponderadas pela quantidade, sem percorrer as outras entradas.
+
+        A linha é travada e relida antes da soma, para que entradas gravadas ao mesmo tempo
+        na mesma loja não sobrescrevam os totais uma da outra.
+        """
+        with transaction.atomic():
+            atuais = type(self).objects.select_for_update().values(*self.CAMPOS_TOTAIS).get(pk=self.pk)
+            for campo, valor in atuais.items():
+                setattr(self, campo, valor)
+            self.quantidade_valorizada += quantidade
+            if custo_unitario is not None:
+                self.quantidade_custo += quantidade
+                self.valor_total_custo += custo_unitario * quantidade
+            self.valor_total_venda += (venda_unitaria or 0) * quantidade
+            self.atualizar_medias()
+            self.save(update_fields=[
+                *self.CAMPOS_TOTAIS, 'custo_medio_ponderado', 'preco_medio_ponderado', 'modificado_em',
+            ])
+
+    def atualizar_medias(self):
+        # o custo médio considera só as entradas com custo; no preço médio a entrada sem preço conta como zero
+        if self.quantidade_custo > 0:
+            self.custo_medio_ponderado = (self.valor_total_custo / self.quantidade_custo).quantize(Decimal('0.01'))
+        else:
+            self.custo_medio_ponderado = Decimal('0.00')
+        if self.quantidade_valorizada > 0:
+            self.preco_medio_ponderado = (self.valor_total_venda / self.quantidade_valorizada).quantize(Decimal('0.01'))
+        else:
+            self.preco_medio_ponderado = Decimal('0.00')
+
+    @classmethod
+    def recalcular_valores(cls):
+        """Refaz totais e médias de todos os estoques a partir das entradas; retorna quantos foram atualizados."""
+        valor = DecimalField(max_digits=14, decimal_places=2)
+        totais = {
+            (linha['produto_id'], linha['loja_id']): linha
+            for linha in ProdutoEntrada.objects.order_by().values('produto_id', 'loja_id').annotate(
+                qtd=Sum('quantidade'),
+                qtd_custo=Sum('quantidade', filter=Q(custo_unitario__isnull=False)),
+                custo=Sum(F('custo_unitario') * F('quantidade'), output_field=valor),
+                venda=Sum(Coalesce(F('venda_unitaria'), Value(Decimal('0'))) * F('quantidade'), output_field=valor),
+            )
+        }
+        estoques = list(cls.objects.all())
+        for estoque in estoques:
+            linha = totais.get((estoque.produto_id, estoque.loja_id), {})
+            estoque.quantidade_valorizada = linha.get('qtd') or 0
+            estoque.quantidade_custo = linha.get('qtd_custo') or 0
+            estoque.valor_total_custo = linha.get('custo') or Decimal('0.00')
+            estoque.valor_total_venda = linha.get('venda') or Decimal('0.00')
+            estoque.atualizar_medias()
+        cls.objects.bulk_update(estoques, [
+            *cls.CAMPOS_TOTAIS, 'custo_medio_ponderado', 'preco_medio_ponderado',
+        ], batch_size=500)
+        return len(estoques)
     
     def adicionar_estoque(self, quantidade):
         self.quantidade_disponivel += quantidade
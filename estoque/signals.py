@@ -2,7 +2,7 @@ from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
 from notificacao.utils import enviar_ws_para_usuario
-from .models import Estoque, EntradaEstoque, ProdutoEntrada, EstoqueImei
+from .models import CustoProduto, Estoque, EntradaEstoque, ProdutoEntrada, EstoqueImei
 from vendas.models import ProdutoVenda, Venda
 from django.db import transaction
 from django.contrib.auth.models import Group
@@ -44,6 +44,49 @@ def atualizar_estoque_deletar_entrada(sender, instance, **kwargs):
     estoque = Estoque.objects.filter(produto=instance.produto, loja=instance.loja).first()
     estoque.remover_estoque(instance.quantidade)
 
+# --- BASE DE CUSTO (CustoProduto) E MÉDIAS PONDERADAS DO ESTOQUE ---
+
+@receiver(pre_save, sender=ProdutoEntrada)
+def guardar_entrada_anterior(instance, **kwargs):
+    instance._entrada_anterior = (
+        ProdutoEntrada.objects.filter(pk=instance.pk).values(
+            'produto_id', 'loja_id', 'quantidade', 'custo_unitario', 'venda_unitaria'
+        ).first()
+        if instance.pk else None
+    )
+
+
+def _registrar_valores_entrada(produto_id, loja_id, quantidade, custo_unitario, venda_unitaria):
+    estoque, _ = Estoque.objects.get_or_create(produto_id=produto_id, loja_id=loja_id)
+    estoque.registrar_valores_entrada(quantidade, custo_unitario, venda_unitaria)
+
+
+@receiver(post_save, sender=ProdutoEntrada)
+def atualizar_custo_produto_entrada(instance, **kwargs):
+    anterior = getattr(instance, '_entrada_anterior', None)
+    if anterior:
+        _registrar_valores_entrada(
+            anterior['produto_id'], anterior['loja_id'], -anterior['quantidade'],
+            anterior['custo_unitario'], anterior['venda_unitaria'],
+        )
+    _registrar_valores_entrada(
+        instance.produto_id, instance.loja_id, instance.quantidade, instance.custo_unitario, instance.venda_unitaria
+    )
+
+    CustoProduto.recalcular(instance.produto_id, instance.loja_id)
+    if anterior and (anterior['produto_id'], anterior['loja_id']) != (instance.produto_id, instance.loja_id):
+        # a entrada mudou de produto ou de loja: o custo antigo também muda
+        CustoProduto.recalcular(anterior['produto_id'], anterior['loja_id'])
+
+
+@receiver(post_delete, sender=ProdutoEntrada)
+def atualizar_custo_produto_deletar_entrada(sender, instance, **kwargs):
+    _registrar_valores_entrada(
+        instance.produto_id, instance.loja_id, -instance.quantidade, instance.custo_unitario, instance.venda_unitaria
+    )
+    CustoProduto.recalcular(instance.produto_id, instance.loja_id)
+
+
 @receiver(post_delete, sender=ProdutoVenda)
 def atualizar_estoque_deletar_venda(sender, instance, **kwargs):
     estoque = Estoque.objects.filter(produto__nome=instance.produto.nome, loja=instance.loja)
@@ -1,3 +1,151 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
 from django.test import TestCase
 
-# Create your tests here.
+from estoque.models import CustoProduto, EntradaEstoque, Estoque, ProdutoEntrada
+from produtos.models import Produto
+from vendas.models import Loja, ProdutoVenda, Venda
+from vendas.tests_utils import DadosBaseMixin
+
+
+class EntradasTestMixin(DadosBaseMixin):
+    def setUp(self):
+        super().setUp()
+        self.outra_loja = Loja.objects.create(nome='Outra Loja')
+        self.produto = Produto.objects.create(
+            nome='Moto', valor_repasse_logista=Decimal('9000'), entrada_cliente=Decimal('1000')
+        )
+
+    def entrada(self, custo, quantidade=1, loja=None, venda=None):
+        entrada = EntradaEstoque(loja=loja or self.loja)
+        entrada.save(user=self.usuario)
+        return ProdutoEntrada.objects.create(
+            entrada=entrada, produto=self.produto, custo_unitario=custo, venda_unitaria=venda,
+            quantidade=quantidade, loja=entrada.loja,
+        )
+
+
+class CustoProdutoTest(EntradasTestMixin, TestCase):
+    def custo(self, loja=None):
+        return CustoProduto.objects.get(produto=self.produto, loja=loja)
+
+    def test_sinais_mantem_ultimo_custo_e_media_ponderada(self):
+        self.entrada(Decimal('7000'), quantidade=3)
+        ultima = self.entrada(Decimal('8000'), quantidade=1, loja=self.outra_loja)
+
+        consolidado = self.custo()
+        self.assertEqual(consolidado.ultimo_custo, Decimal('8000'))
+        self.assertEqual(consolidado.custo_medio, Decimal('7250'))
+        self.assertEqual(consolidado.quantidade_entradas, 4)
+        self.assertEqual(self.custo(self.loja).ultimo_custo, Decimal('7000'))
+
+        ultima.custo_unitario = Decimal('9000')
+        ultima.save()
+        self.assertEqual(self.custo().custo_medio, Decimal('7500'))
+
+        ultima.delete()
+        self.assertEqual(self.custo().ultimo_custo, Decimal('7000'))
+        self.assertFalse(CustoProduto.objects.filter(loja=self.outra_loja).exists())
+
+    def test_custo_e_lucro_da_venda(self):
+        self.entrada(Decimal('7000'), quantidade=2)
+        self.entrada(Decimal('7500'))
+        venda = Venda.objects.create(
+            loja=self.loja, cliente=self.cliente, vendedor=self.usuario, caixa=self.caixa, repasse_logista=Decimal('9000')
+        )
+        ProdutoVenda.objects.bulk_create([
+            ProdutoVenda(venda=venda, produto=self.produto, valor_unitario=Decimal('12000'), quantidade=2),
+        ])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(venda.custo_total, Decimal('15000'))
+        with self.assertNumQueries(1):
+            self.assertEqual(venda.lucro_venda, Decimal('5000'))
+
+        item = ProdutoVenda.objects.com_custo().get(venda=venda)
+        with self.assertNumQueries(0):
+            self.assertEqual(item.custo(), Decimal('15000'))
+            self.assertEqual(item.lucro(), Decimal('5000'))
+        self.assertEqual(ProdutoVenda.objects.get(venda=venda).custo(), Decimal('15000'))
+
+    def test_reconstruir(self):
+        self.entrada(Decimal('7000'))
+        CustoProduto.objects.all().delete()
+        self.assertEqual(CustoProduto.reconstruir(), 1)
+        self.assertEqual(self.custo().ultimo_custo, Decimal('7000'))
+        self.assertEqual(self.custo(self.loja).ultimo_custo, Decimal('7000'))
+
+    def test_uma_linha_consolidada_por_produto(self):
+        self.entrada(Decimal('7000'))
+        for loja in (None, self.loja):
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                CustoProduto.objects.create(produto=self.produto, loja=loja)
+
+
+class EstoqueMediasPonderadasTest(EntradasTestMixin, TestCase):
+    def estoque(self):
+        return Estoque.objects.get(produto=self.produto, loja=self.loja)
+
+    def test_medias_atualizadas_a_cada_entrada(self):
+        self.entrada(Decimal('7000'), quantidade=3, venda=Decimal('10000'))
+        segunda = self.entrada(Decimal('8000'), quantidade=1, venda=Decimal('12000'))
+        self.entrada(Decimal('1'), quantidade=5, loja=self.outra_loja, venda=Decimal('1'))
+
+        estoque = self.estoque()
+        self.assertEqual(estoque.preco_medio_custo(), Decimal('7250.00'))
+        self.assertEqual(estoque.preco_medio(), Decimal('10500.00'))
+
+        segunda.quantidade = 3
+        segunda.venda_unitaria = None
+        segunda.save()
+        estoque = self.estoque()
+        self.assertEqual(estoque.preco_medio_custo(), Decimal('7500.00'))
+        self.assertEqual(estoque.preco_medio(), Decimal('5000.00'))
+
+        segunda.delete()
+        estoque = self.estoque()
+        self.assertEqual(estoque.preco_medio_custo(), Decimal('7000.00'))
+        self.assertEqual(estoque.preco_medio(), Decimal('10000.00'))
+
+    def test_recalcular_valores_igual_ao_incremental(self):
+        self.entrada(Decimal('7000'), quantidade=3, venda=Decimal('10000'))
+        self.entrada(Decimal('8333.33'), quantidade=2, venda=Decimal('11999.99'))
+        incremental = self.estoque()
+
+        Estoque.objects.update(custo_medio_ponderado=0, preco_medio_ponderado=0, valor_total_custo=0)
+        Estoque.recalcular_valores()
+        recalculado = self.estoque()
+        for campo in ('quantidade_valorizada', 'quantidade_custo', 'valor_total_custo', 'valor_total_venda',
+                      'custo_medio_ponderado', 'preco_medio_ponderado'):
+            self.assertEqual(getattr(recalculado, campo), getattr(incremental, campo), campo)
+
+    def test_registrar_valores_com_copia_desatualizada(self):
+        self.entrada(Decimal('7000'), quantidade=1, venda=Decimal('10000'))
+        # duas cópias carregadas antes de qualquer uma gravar, como em requisições simultâneas
+        primeira, segunda = self.estoque(), self.estoque()
+        primeira.registrar_valores_entrada(1, Decimal('8000'), Decimal('12000'))
+        segunda.registrar_valores_entrada(2, Decimal('9000'), Decimal('14000'))
+
+        estoque = self.estoque()
+        self.assertEqual(estoque.quantidade_valorizada, 4)
+        self.assertEqual(estoque.valor_total_custo, Decimal('33000'))
+        self.assertEqual(estoque.preco_medio_custo(), Decimal('8250.00'))
+        self.assertEqual(estoque.preco_medio(), Decimal('12500.00'))
+
+    def test_entrada_sem_custo_fora_do_custo_medio(self):
+        self.entrada(Decimal('7000'), quantidade=2, venda=Decimal('10000'))
+        sem_custo = self.entrada(None, quantidade=2, venda=Decimal('12000'))
+
+        estoque = self.estoque()
+        self.assertEqual((estoque.quantidade_valorizada, estoque.quantidade_custo), (4, 2))
+        self.assertEqual(estoque.preco_medio_custo(), Decimal('7000.00'))
+        self.assertEqual(estoque.preco_medio(), Decimal('11000.00'))
+        self.assertEqual(estoque.preco_medio_custo(), CustoProduto.objects.get(produto=self.produto, loja=self.loja).custo_medio)
+
+        Estoque.recalcular_valores()
+        self.assertEqual(self.estoque().preco_medio_custo(), Decimal('7000.00'))
+
+        sem_custo.custo_unitario = Decimal('8000')
+        sem_custo.save()
+        self.assertEqual(self.estoque().preco_medio_custo(), Decimal('7500.00'))
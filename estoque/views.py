@@ -18,6 +18,10 @@ from vendas.models import Venda
 from produtos.models import TipoProduto
 from .models import Fornecedor
 from django.db.models import Sum
+from django.db.models import Case, CharField, Count, DecimalField, F, Value, When
+from django.db.models.functions import Coalesce
+from decimal import Decimal
+from vendas.exportacao import exportar_queryset, formato_exportacao, sim_nao
 
 
 class EstoqueListView(BaseView, PermissionRequiredMixin, ListView):
@@ -422,20 +426,19 @@ def inventario_estoque_pdf (request):
     if tipo:
         produtos = produtos.filter(produto__tipo_id=tipo)
     
-    quantidade_total = produtos.aggregate(total=Sum('quantidade_disponivel'))['total']
-    custo_medio_total = 0
-    preco_medio_total = 0
-
-    for produto in produtos:
-        preco_medio_total += float(produto.preco_medio()) * produto.quantidade_disponivel
-        custo_medio_total  += float(produto.preco_medio_custo()) * produto.quantidade_disponivel
+    valor = DecimalField(max_digits=16, decimal_places=2)
+    totais = produtos.aggregate(
+        quantidade=Sum('quantidade_disponivel'),
+        custo=Sum(F('custo_medio_ponderado') * F('quantidade_disponivel'), output_field=valor),
+        preco=Sum(F('preco_medio_ponderado') * F('quantidade_disponivel'), output_field=valor),
+    )
 
     context = {
-        'produtos': produtos,
+        'produtos': produtos.select_related('produto'),
         'loja': loja,
-        'quantidade_total': quantidade_total,
-        'custo_medio_total': f'{custo_medio_total:.2f}',
-        'preco_medio_total': f'{preco_medio_total:.2f}',
+        'quantidade_total': totais['quantidade'],
+        'custo_medio_total': f"{totais['custo'] or 0:.2f}",
+        'preco_medio_total': f"{totais['preco'] or 0:.2f}",
     }
 
     return render(request, "estoque/folha_estoque.html", context)
@@ -453,219 +456,94 @@ def inventario_estoque_imei_pdf (request):
     return render(request, "estoque/folha_estoque_imei.html", context)
 
 def inventario_estoque_imei_excel(request):
-    """Gera relatório Excel do estoque de IMEI com métricas financeiras e estratégicas"""
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-    from openpyxl.utils import get_column_letter
-    from django.http import HttpResponse
-    from decimal import Decimal
-    
+    """Exporta o estoque de RENAVAM da loja (XLSX por padrão, ?formato=csv) com as métricas numa aba de resumo"""
     loja = get_object_or_404(Loja, pk=request.session.get('loja_id'))
-    
-    # Buscar todos os IMEIs da loja
-    imeis = EstoqueImei.objects.filter(loja=loja).select_related(
-        'produto', 'produto_entrada', 'produto_entrada__entrada'
-    ).prefetch_related('produto__tipo')
-    
-    # Criar workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Estoque IMEI"
-    
-    # Estilos
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    title_font = Font(bold=True, size=14)
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+    formato = formato_exportacao(request) or 'xlsx'
+    zero = Value(Decimal('0.00'))
+    moeda = DecimalField(max_digits=10, decimal_places=2)
+
+    imeis = EstoqueImei.objects.filter(loja=loja).annotate(
+        custo_unitario_anotado=Coalesce('produto_entrada__custo_unitario', zero, output_field=moeda),
+        preco_venda_anotado=Coalesce('produto__valor_repasse_logista', zero, output_field=moeda),
+    ).annotate(
+        margem_anotada=Case(
+            When(custo_unitario_anotado__gt=0, preco_venda_anotado__gt=0,
+                 then=F('preco_venda_anotado') - F('custo_unitario_anotado')),
+            default=zero,
+            output_field=moeda,
+        ),
+        status_anotado=Case(
+            When(cancelado=True, then=Value('Cancelado')),
+            When(vendido=True, then=Value('Vendido')),
+            default=Value('Disponível'),
+            output_field=CharField(),
+        ),
+    ).order_by('pk')
+
+    # Métricas calculadas em uma única agregação
+    disponivel = Q(cancelado=False, vendido=False)
+    metricas = imeis.aggregate(
+        total=Count('pk'),
+        disponiveis=Count('pk', filter=disponivel),
+        vendidos=Count('pk', filter=Q(cancelado=False, vendido=True)),
+        cancelados=Count('pk', filter=Q(cancelado=True)),
+        total_custo=Sum('custo_unitario_anotado', filter=disponivel),
+        total_venda=Sum('preco_venda_anotado', filter=disponivel),
+        total_margem=Sum('margem_anotada', filter=disponivel),
     )
-    center_alignment = Alignment(horizontal='center', vertical='center')
-    
-    # Título
-    ws.merge_cells('A1:N1')
-    ws['A1'] = f"RELATÓRIO DE ESTOQUE IMEI - {loja.nome}"
-    ws['A1'].font = title_font
-    ws['A1'].alignment = center_alignment
-    
-    # Data do relatório
-    ws.merge_cells('A2:N2')
-    ws['A2'] = f"Data de geração: {datetime.datetime.now().strftime('%d/%m/%Y %H:%M')}"
-    ws['A2'].alignment = center_alignment
-    
-    # Cabeçalhos da tabela
-    headers = [
-        'ID', 'Produto', 'IMEI', 'Tipo Produto', 'Vendido', 'App Instalado', 
-        'Cancelado', 'Data Venda', 'ID Venda', 'Número Nota', 'Custo Unitário',
-        'Preço Venda', 'Margem', 'Status'
+    total_imeis = metricas['total']
+    total_custo = metricas['total_custo'] or Decimal('0.00')
+    total_venda = metricas['total_venda'] or Decimal('0.00')
+    total_margem = metricas['total_margem'] or Decimal('0.00')
+
+    def percentual(quantidade):
+        return f"{(quantidade / total_imeis * 100):.1f}%" if total_imeis > 0 else "0%"
+
+    def por_disponivel(valor):
+        return valor / metricas['disponiveis'] if metricas['disponiveis'] > 0 else 0
+
+    resumo = [
+        [f"RELATÓRIO DE ESTOQUE RENAVAM - {loja.nome}"],
+        [f"Data de geração: {datetime.datetime.now().strftime('%d/%m/%Y %H:%M')}"],
+        [],
+        ["QUANTITATIVAS", "Valor", "Percentual"],
+        ["Total de RENAVAMs", total_imeis, "100%"],
+        ["RENAVAMs Disponíveis", metricas['disponiveis'], percentual(metricas['disponiveis'])],
+        ["RENAVAMs Vendidos", metricas['vendidos'], percentual(metricas['vendidos'])],
+        ["RENAVAMs Cancelados", metricas['cancelados'], percentual(metricas['cancelados'])],
+        [],
+        ["FINANCEIRAS", "Valor (R$)"],
+        ["Valor Total em Estoque (Custo)", total_custo],
+        ["Valor Total em Estoque (Venda)", total_venda],
+        ["Margem Total Potencial", total_margem],
+        ["Margem Percentual Média", f"{(total_margem / total_venda * 100) if total_venda > 0 else 0:.1f}%"],
+        [],
+        ["ESTRATÉGICAS", "Valor"],
+        ["Taxa de Conversão (Vendidos/Total)", percentual(metricas['vendidos'])],
+        ["Taxa de Cancelamento", percentual(metricas['cancelados'])],
+        ["Valor Médio por RENAVAM Disponível", f"R$ {por_disponivel(total_venda):.2f}"],
+        ["Margem Média por RENAVAM Disponível", f"R$ {por_disponivel(total_margem):.2f}"],
     ]
-    
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=4, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.border = border
-        cell.alignment = center_alignment
-    
-    # Dados dos IMEIs
-    row = 5
-    total_custo = Decimal('0.00')
-    total_venda = Decimal('0.00')
-    total_margem = Decimal('0.00')
-    imeis_vendidos = 0
-    imeis_disponiveis = 0
-    imeis_cancelados = 0
-    
-    for imei in imeis:
-        # Calcular custo e preço
-        custo_unitario = Decimal('0.00')
-        preco_venda = Decimal('0.00')
-        
-        if imei.produto_entrada and imei.produto_entrada.custo_unitario:
-            custo_unitario = imei.produto_entrada.custo_unitario
-        
-        if imei.produto.valor_repasse_logista:
-            preco_venda = imei.produto.valor_repasse_logista
-        
-        margem = preco_venda - custo_unitario if preco_venda > 0 and custo_unitario > 0 else Decimal('0.00')
-        
-        # Status do IMEI
-        if imei.cancelado:
-            status = "Cancelado"
-            imeis_cancelados += 1
-        elif imei.vendido:
-            status = "Vendido"
-            imeis_vendidos += 1
-        else:
-            status = "Disponível"
-            imeis_disponiveis += 1
-            total_custo += custo_unitario
-            total_venda += preco_venda
-            total_margem += margem
-        
-        # Preencher linha
-        ws.cell(row=row, column=1, value=imei.id).border = border
-        ws.cell(row=row, column=2, value=imei.produto.nome).border = border
-        ws.cell(row=row, column=3, value=imei.imei).border = border
-        ws.cell(row=row, column=4, value=imei.produto.tipo.nome if imei.produto.tipo else "-").border = border
-        ws.cell(row=row, column=5, value="Sim" if imei.vendido else "Não").border = border
-        ws.cell(row=row, column=6, value="Sim" if imei.aplicativo_instalado else "Não").border = border
-        ws.cell(row=row, column=7, value="Sim" if imei.cancelado else "Não").border = border
-        ws.cell(row=row, column=8, value=imei.data_venda.strftime('%d/%m/%Y') if imei.data_venda else "-").border = border
-        ws.cell(row=row, column=9, value=imei.id_venda or "-").border = border
-        ws.cell(row=row, column=10, value=imei.numero_nota or "-").border = border
-        ws.cell(row=row, column=11, value=float(custo_unitario)).border = border
-        ws.cell(row=row, column=12, value=float(preco_venda)).border = border
-        ws.cell(row=row, column=13, value=float(margem)).border = border
-        ws.cell(row=row, column=14, value=status).border = border
-        
-        row += 1
-    
-    # Métricas Financeiras e Estratégicas
-    row_metrics = row + 2
-    
-    # Título das métricas
-    ws.merge_cells(f'A{row_metrics}:N{row_metrics}')
-    ws[f'A{row_metrics}'] = "MÉTRICAS FINANCEIRAS E ESTRATÉGICAS"
-    ws[f'A{row_metrics}'].font = title_font
-    ws[f'A{row_metrics}'].alignment = center_alignment
-    
-    row_metrics += 2
-    
-    # Métricas de Quantidade
-    ws.cell(row=row_metrics, column=1, value="QUANTITATIVAS").font = Font(bold=True)
-    ws.cell(row=row_metrics, column=2, value="Valor").font = Font(bold=True)
-    ws.cell(row=row_metrics, column=3, value="Percentual").font = Font(bold=True)
-    
-    total_imeis = imeis.count()
-    row_metrics += 1
-    
-    ws.cell(row=row_metrics, column=1, value="Total de IMEIs")
-    ws.cell(row=row_metrics, column=2, value=total_imeis)
-    ws.cell(row=row_metrics, column=3, value="100%")
-    
-    row_metrics += 1
-    ws.cell(row=row_metrics, column=1, value="IMEIs Disponíveis")
-    ws.cell(row=row_metrics, column=2, value=imeis_disponiveis)
-    ws.cell(row=row_metrics, column=3, value=f"{(imeis_disponiveis/total_imeis*100):.1f}%" if total_imeis > 0 else "0%")
-    
-    row_metrics += 1
-    ws.cell(row=row_metrics, column=1, value="IMEIs Vendidos")
-    ws.cell(row=row_metrics, column=2, value=imeis_vendidos)
-    ws.cell(row=row_metrics, column=3, value=f"{(imeis_vendidos/total_imeis*100):.1f}%" if total_imeis > 0 else "0%")
-    
-    row_metrics += 1
-    ws.cell(row=row_metrics, column=1, value="IMEIs Cancelados")
-    ws.cell(row=row_metrics, column=2, value=imeis_cancelados)
-    ws.cell(row=row_metrics, column=3, value=f"{(imeis_cancelados/total_imeis*100):.1f}%" if total_imeis > 0 else "0%")
-    
-    row_metrics += 2
-    
-    # Métricas Financeiras
-    ws.cell(row=row_metrics, column=1, value="FINANCEIRAS").font = Font(bold=True)
-    ws.cell(row=row_metrics, column=2, value="Valor (R$)").font = Font(bold=True)
-    
-    row_metrics += 1
-    ws.cell(row=row_metrics, column=1, value="Valor Total em Estoque (Custo)")
-    ws.cell(row=row_metrics, column=2, value=float(total_custo))
-    
-    row_metrics += 1
-    ws.cell(row=row_metrics, column=1, value="Valor Total em Estoque (Venda)")
-    ws.cell(row=row_metrics, column=2, value=float(total_venda))
-    
-    row_metrics += 1
-    ws.cell(row=row_metrics, column=1, value="Margem Total Potencial")
-    ws.cell(row=row_metrics, column=2, value=float(total_margem))
-    
-    row_metrics += 1
-    margem_percentual = (total_margem / total_venda * 100) if total_venda > 0 else 0
-    ws.cell(row=row_metrics, column=1, value="Margem Percentual Média")
-    ws.cell(row=row_metrics, column=2, value=f"{margem_percentual:.1f}%")
-    
-    row_metrics += 2
-    
-    # Métricas Estratégicas
-    ws.cell(row=row_metrics, column=1, value="ESTRATÉGICAS").font = Font(bold=True)
-    ws.cell(row=row_metrics, column=2, value="Valor").font = Font(bold=True)
-    
-    row_metrics += 1
-    # Taxa de conversão (vendidos / total)
-    taxa_conversao = (imeis_vendidos / total_imeis * 100) if total_imeis > 0 else 0
-    ws.cell(row=row_metrics, column=1, value="Taxa de Conversão (Vendidos/Total)")
-    ws.cell(row=row_metrics, column=2, value=f"{taxa_conversao:.1f}%")
-    
-    row_metrics += 1
-    # Taxa de cancelamento
-    taxa_cancelamento = (imeis_cancelados / total_imeis * 100) if total_imeis > 0 else 0
-    ws.cell(row=row_metrics, column=1, value="Taxa de Cancelamento")
-    ws.cell(row=row_metrics, column=2, value=f"{taxa_cancelamento:.1f}%")
-    
-    row_metrics += 1
-    # Valor médio por IMEI
-    valor_medio_imei = total_venda / imeis_disponiveis if imeis_disponiveis > 0 else 0
-    ws.cell(row=row_metrics, column=1, value="Valor Médio por IMEI Disponível")
-    ws.cell(row=row_metrics, column=2, value=f"R$ {valor_medio_imei:.2f}")
-    
-    row_metrics += 1
-    # Margem média por IMEI
-    margem_media_imei = total_margem / imeis_disponiveis if imeis_disponiveis > 0 else 0
-    ws.cell(row=row_metrics, column=1, value="Margem Média por IMEI Disponível")
-    ws.cell(row=row_metrics, column=2, value=f"R$ {margem_media_imei:.2f}")
-    
-    # Ajustar largura das colunas
-    for col in range(1, len(headers) + 1):
-        ws.column_dimensions[get_column_letter(col)].width = 15
-    
-    # Configurar resposta HTTP
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+    colunas = (
+        ('ID', 'pk'),
+        ('Produto', 'produto__nome'),
+        ('RENAVAM', 'renavam'),
+        ('Placa', 'placa'),
+        ('Tipo Produto', 'produto__tipo__nome', lambda tipo: tipo or '-'),
+        ('Vendido', 'vendido', sim_nao),
+        ('App Instalado', 'aplicativo_instalado', sim_nao),
+        ('Cancelado', 'cancelado', sim_nao),
+        ('Data Venda', 'data_venda'),
+        ('Custo Unitário', 'custo_unitario_anotado'),
+        ('Preço Venda', 'preco_venda_anotado'),
+        ('Margem', 'margem_anotada'),
+        ('Status', 'status_anotado'),
+    )
+    return exportar_queryset(
+        imeis, colunas, f'relatorio_estoque_imei_{loja.nome}', formato,
+        resumo=resumo, titulo_planilha='Estoque RENAVAM',
     )
-    response['Content-Disposition'] = f'attachment; filename="relatorio_estoque_imei_{loja.nome}_{datetime.datetime.now().strftime("%Y%m%d_%H%M")}.xlsx"'
-    
-    wb.save(response)
-    return response
 
 class FolhaNotaEntradaView(View):
     def get(self, request, *args, **kwargs):
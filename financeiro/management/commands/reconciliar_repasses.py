@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from financeiro.models import Repasse
+
+
+class Command(BaseCommand):
+    help = ('Marca como parcial os repasses abaixo do valor calculado do ciclo e devolve aos completados '
+            'o status que tinham antes (status_anterior); parciais marcados à mão não são alterados.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loja', type=int, action='append', help='Id da loja (pode repetir). Padrão: todas.')
+
+    def handle(self, *args, **options):
+        repasses = Repasse.objects.all()
+        if options['loja']:
+            repasses = repasses.filter(loja_id__in=options['loja'])
+        total = repasses.reconciliar()
+        self.stdout.write(self.style.SUCCESS(f'Repasses reconciliados: {total} alterado(s).'))
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0024_alter_caixamensal_criado_por_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='repasse',
+            index=models.Index(fields=['loja', 'data'], name='repasse_loja_data_idx'),
+        ),
+    ]
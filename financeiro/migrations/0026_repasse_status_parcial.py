@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0025_indices_filtros'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='repasse',
+            name='status',
+            field=models.CharField(choices=[('pendente', 'Pendente'), ('pago', 'Pago'), ('parcial', 'Parcial'), ('cancelado', 'Cancelado')], default='pendente', max_length=20),
+        ),
+    ]
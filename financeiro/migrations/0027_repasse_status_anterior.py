@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 16:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0026_repasse_status_parcial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repasse',
+            name='status_anterior',
+            field=models.CharField(blank=True, choices=[('pendente', 'Pendente'), ('pago', 'Pago'), ('parcial', 'Parcial'), ('cancelado', 'Cancelado')], editable=False, help_text="Status antes de a reconciliação marcar o repasse como 'parcial'", max_length=20, null=True),
+        ),
+    ]
@@ -1,6 +1,10 @@
 from datetime import datetime
+from decimal import Decimal
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import TruncDate
 from django.urls import reverse
+from django.utils import timezone
 from vendas.models import Base
 
 
@@ -102,11 +106,66 @@ class GastosAleatorios(Base):
 
 
 
+class RepasseQuerySet(models.QuerySet):
+    def reconciliar(self):
+        """
+        Compara cada repasse do queryset com o valor calculado do seu ciclo (vendas ativas
+        desde o repasse anterior): abaixo do calculado fica 'parcial'; um 'parcial' que passou
+        a cobrir o ciclo volta ao status que tinha antes (pendente, pago...). Idempotente; usa
+        update() (sem disparar sinais) e retorna quantos repasses mudaram de status.
+        """
+        from vendas.models import Loja, Venda
+
+        repasses = list(
+            self.exclude(status='cancelado').annotate(dia=TruncDate('data'))
+            .values_list('pk', 'loja_id', 'dia', 'valor', 'status')
+        )
+        ciclos = {}
+        for _, _, dia, _, _ in repasses:
+            ciclo = Loja.ciclo_do_repasse(dia)
+            if ciclo:
+                ciclos[dia] = (dia, *ciclo)
+        if not ciclos:
+            return 0
+
+        calculados = Venda.objects.filter(
+            loja_id__in={loja_id for _, loja_id, _, _, _ in repasses}
+        ).repasse_por_ciclo(ciclos.values())
+
+        parciais, cobertos = [], []
+        for pk, loja_id, dia, valor, status in repasses:
+            if dia not in ciclos:
+                continue
+            _, calculado = calculados.get((loja_id, dia), (0, Decimal('0.00')))
+            if valor < calculado and status != 'parcial':
+                parciais.append(pk)
+            elif valor >= calculado and status == 'parcial':
+                cobertos.append(pk)
+
+        agora = timezone.now()
+        # o status de origem fica guardado para ser devolvido quando o ciclo for coberto;
+        # 'parcial' marcado à mão (sem status_anterior) não é alterado. A ordem das colunas
+        # importa: o MySQL aplica o SET da esquerda para a direita
+        alterados = Repasse.objects.filter(pk__in=parciais).update(
+            status_anterior=F('status'), status='parcial', atualizado_em=agora,
+        )
+        alterados += Repasse.objects.filter(pk__in=cobertos, status_anterior__isnull=False).update(
+            status=F('status_anterior'), status_anterior=None, atualizado_em=agora,
+        )
+        return alterados
+
+
 class Repasse(models.Model):
+    STATUS_CHOICES = [('pendente', 'Pendente'), ('pago', 'Pago'), ('parcial', 'Parcial'), ('cancelado', 'Cancelado')]
+
     loja = models.ForeignKey('vendas.Loja', on_delete=models.PROTECT, related_name='repasse')
     valor = models.DecimalField(max_digits=10, decimal_places=2)
     data = models.DateTimeField()
-    status = models.CharField(max_length=20, choices=[('pendente', 'Pendente'), ('pago', 'Pago'), ('cancelado', 'Cancelado')], default='pendente')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    status_anterior = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, null=True, blank=True, editable=False,
+        help_text="Status antes de a reconciliação marcar o repasse como 'parcial'",
+    )
     # Perguntar
     # dias_repasse = models.CharField(max_length=10, choices=[('1', '1 dia'), ('10', '10 dias'), ('20', '20 dias')])
     observacao = models.TextField(blank=True, null=True)
@@ -114,6 +173,8 @@ class Repasse(models.Model):
     criado_em = models.DateTimeField(auto_now_add=True)
     atualizado_por = models.ForeignKey('accounts.User', on_delete=models.PROTECT, related_name='repasse_atualizado_por')
     atualizado_em = models.DateTimeField(auto_now=True)
+
+    objects = RepasseQuerySet.as_manager()
     
     def __str__(self):
         return f'{self.loja} - {self.valor}'
@@ -121,4 +182,7 @@ class Repasse(models.Model):
     class Meta:
         verbose_name_plural = 'Repasse'
         verbose_name = 'Repasse'
-        ordering = ['-data']
\ No newline at end of file
+        ordering = ['-data']
+        indexes = [
+            models.Index(fields=['loja', 'data'], name='repasse_loja_data_idx'),
+        ]
@@ -0,0 +1,184 @@
+"""
+Consulta e contexto do relatório de contas a receber.
+
+Usados pela FolhaRelatorioContasAReceberView e pelo worker de relatórios em segundo plano
+(vendas.relatorios), que recebem os mesmos filtros: o GET da página ou os parâmetros do job.
+"""
+from datetime import datetime, timedelta
+
+from django.db.models import DateField, OuterRef, Q, Subquery, Sum
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from vendas.models import Loja, Pagamento, Parcela, ProdutoVenda
+
+TEMPLATE_INICIO = 'contas_a_receber/folha_inicio.html'
+TEMPLATE_LINHAS = 'contas_a_receber/folha_linhas.html'
+TEMPLATE_FIM = 'contas_a_receber/folha_fim.html'
+TAMANHO_LOTE = 200
+
+COLUNAS_CONTAS_A_RECEBER = (
+    ('ID', 'pk'),
+    ('Loja', 'venda__loja__nome'),
+    ('Data Venda', 'venda__data_venda'),
+    ('Cliente', 'venda__cliente__nome'),
+    ('Telefone', 'venda__cliente__telefone'),
+    ('Produto', 'primeiro_produto_nome'),
+    ('RENAVAM', 'primeiro_item_renavam'),
+    ('Valor Atrasado', 'valor_atrasado_anotado'),
+    ('Primeiro Vencimento', 'ultimo_vencimento'),
+    ('Valor Pago', 'valor_pago_ultimo_anotado'),
+    ('Último Pagamento', 'ultimo_pagamento'),
+    ('Prox. Parcela', 'valor_atual_a_vencer_anotado'),
+    ('Valor a Vencer', 'valor_a_vencer_anotado'),
+    ('Próximo Vencimento', 'proximo_vencimento'),
+    ('Valor Total', 'valor_total_parcelas_anotado'),
+    ('Parcelas Totais', 'parcelas_totais_anotado'),
+    ('Parcelas Pagas', 'parcelas_pagas_anotado'),
+    ('Valor Quitado', 'valor_quitado_anotado'),
+)
+
+
+def filtrar_contas_a_receber(parametros):
+    """Pagamentos do período e das lojas/status de `parametros` (QueryDict), com os valores anotados."""
+    data_inicio = parametros.get('data_inicial')
+    data_fim = parametros.get('data_final')
+    lojas = parametros.getlist('lojas')
+    status_list = parametros.getlist('status')
+
+    if not (data_inicio and data_fim):
+        return Pagamento.objects.none()
+
+    lojas_qs = Loja.objects.filter(id__in=lojas)
+    data_inicio_dt = datetime.strptime(data_inicio, "%Y-%m-%d").date()
+    data_final_dt = datetime.strptime(data_fim, "%Y-%m-%d").date()
+    data_final_dt_plus = data_final_dt + timedelta(days=1)
+
+    # Subqueries para datas relevantes
+    proximo_vencimento_subquery = Subquery(
+        Parcela.objects.filter(
+            pagamento=OuterRef('pk'),
+            pago=False,
+            data_vencimento__gte=timezone.now()
+        ).order_by('data_vencimento').values('data_vencimento')[:1],
+        output_field=DateField()
+    )
+    ultimo_vencimento_subquery = Subquery(
+        Parcela.objects.filter(
+            pagamento=OuterRef('pk'),
+            pago=False,
+            data_vencimento__lt=timezone.now()
+        ).order_by('data_vencimento').values('data_vencimento')[:1],
+        output_field=DateField()
+    )
+    ultimo_pagamento_subquery = Subquery(
+        Parcela.objects.filter(
+            pagamento=OuterRef('pk'),
+            pago=True
+        ).order_by('data_pagamento').values('data_pagamento')[:1],
+        output_field=DateField()
+    )
+    primeiro_item = ProdutoVenda.objects.filter(venda=OuterRef('venda')).order_by('pk')
+
+    pagamentos_qs = Pagamento.objects.exclude(venda__is_deleted=True).exclude(desativado=True).with_status_flags().distinct()
+    pagamentos_qs = pagamentos_qs.with_financial_summary().select_related('venda__loja', 'venda__cliente').annotate(
+        proximo_vencimento=proximo_vencimento_subquery,
+        ultimo_vencimento=ultimo_vencimento_subquery,
+        ultimo_pagamento=ultimo_pagamento_subquery,
+        primeiro_produto_nome=Subquery(primeiro_item.values('produto__nome')[:1]),
+        primeiro_item_renavam=Subquery(primeiro_item.values('renavam')[:1]),
+    )
+
+    if lojas_qs:
+        pagamentos_qs = pagamentos_qs.filter(loja__in=lojas_qs)
+
+    # Filtro de status e datas
+    if status_list and 'todos' not in status_list:
+        q_status = None
+        date_filter = Q()
+        for status in status_list:
+            if status == 'pendente':
+                q = Q(com_pagamento_pendente=True)
+                date_q = Q(proximo_vencimento__isnull=False, proximo_vencimento__gte=data_inicio_dt, proximo_vencimento__lt=data_final_dt_plus)
+            elif status == 'pago':
+                q = Q()  # Não filtra por flag, só pela data do último pagamento
+                date_q = Q(ultimo_pagamento__isnull=False, ultimo_pagamento__gte=data_inicio_dt, ultimo_pagamento__lt=data_final_dt_plus)
+            elif status == 'atrasado':
+                q = Q(com_parcela_atrasada=True)
+                date_q = Q(ultimo_vencimento__isnull=False, ultimo_vencimento__gte=data_inicio_dt, ultimo_vencimento__lt=data_final_dt_plus)
+            else:
+                continue
+            q_status = q if q_status is None else q_status | q
+            date_filter = date_filter | date_q
+        if q_status is not None:
+            pagamentos_qs = pagamentos_qs.filter(q_status)
+        if date_filter:
+            pagamentos_qs = pagamentos_qs.filter(date_filter)
+    else:
+        # Se não filtrar por status, usar proximo_vencimento por padrão
+        pagamentos_qs = pagamentos_qs.filter(
+            proximo_vencimento__isnull=False,
+            proximo_vencimento__gte=data_inicio_dt,
+            proximo_vencimento__lt=data_final_dt_plus
+        )
+
+    return pagamentos_qs
+
+
+def exportacao_contas_a_receber(contas_a_receber):
+    return contas_a_receber.order_by('venda__data_venda', 'pk')
+
+
+def contexto_contas_a_receber(contas_a_receber, parametros):
+    """Cabeçalho e totais da folha; as linhas são lidas em lotes por partes_contas_a_receber()."""
+    data_inicio = parametros.get('data_inicial')
+    data_fim = parametros.get('data_final')
+
+    totais = contas_a_receber.aggregate(
+        total_atrasado=Sum('valor_atrasado_anotado'),
+        total_pago=Sum('valor_pago_ultimo_anotado'),
+        total_a_vencer=Sum('valor_a_vencer_anotado'),
+        total_proximo_vencimento=Sum('valor_atual_a_vencer_anotado'),
+        total=Sum('valor_total_parcelas_anotado'),
+        total_quitado=Sum('valor_quitado_anotado'),
+    )
+
+    contexto = {
+        'contas_a_receber': contas_a_receber,
+        'lojas': Loja.objects.filter(id__in=parametros.getlist('lojas')).values_list('nome', flat=True),
+        'status_list': parametros.getlist('status'),
+        'data_inicio': datetime.strptime(data_inicio, "%Y-%m-%d").date() if data_inicio else None,
+        'data_fim': datetime.strptime(data_fim, "%Y-%m-%d").date() if data_fim else None,
+    }
+    contexto.update({nome: valor or 0 for nome, valor in totais.items()})
+    return contexto
+
+
+def lotes_por_pk(queryset, tamanho_lote=TAMANHO_LOTE):
+    """
+    Lê o queryset em lotes de `tamanho_lote` pela chave primária (pk > último lido), em ordem de pk.
+    Com .iterator() o mysqlclient traz o resultado inteiro para a memória antes da primeira linha.
+    """
+    ultimo_pk = None
+    while True:
+        lote = queryset.order_by('pk')
+        if ultimo_pk is not None:
+            lote = lote.filter(pk__gt=ultimo_pk)
+        lote = list(lote[:tamanho_lote])
+        if not lote:
+            return
+        yield lote
+        if len(lote) < tamanho_lote:
+            return
+        ultimo_pk = lote[-1].pk
+
+
+def partes_contas_a_receber(contexto, request=None, tamanho_lote=TAMANHO_LOTE):
+    """Gera a folha em pedaços: cabeçalho, linhas em lotes de `tamanho_lote` (por pk) e rodapé."""
+    yield render_to_string(TEMPLATE_INICIO, contexto, request=request)
+    possui_registros = False
+    for lote in lotes_por_pk(contexto['contas_a_receber'], tamanho_lote):
+        yield render_to_string(TEMPLATE_LINHAS, {'contas_a_receber': lote})
+        possui_registros = True
+    contexto['possui_registros'] = possui_registros
+    yield render_to_string(TEMPLATE_FIM, contexto, request=request)
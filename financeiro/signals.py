@@ -1,6 +1,12 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Q
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import GastoFixo, CaixaMensal, CaixaMensalGastoFixo, CaixaMensalFuncionario
+from django.utils import timezone
+from vendas.models import Loja, Venda
+from .models import GastoFixo, CaixaMensal, CaixaMensalGastoFixo, CaixaMensalFuncionario, Repasse
 
 @receiver(post_save, sender=GastoFixo)
 def associar_gasto_fixo_a_caixas_mensais_abertos(sender, instance, created, **kwargs):
@@ -29,3 +35,39 @@ def desassociar_gasto_fixo_a_caixas_mensais(sender, instance, **kwargs):
         CaixaMensalGastoFixo.objects.filter(caixa_mensal=caixa_mensal, gasto_fixo=instance).delete()
 
 
+
+
+# --- RECONCILIAÇÃO DOS REPASSES ---
+# Só o ciclo afetado é recalculado; a conciliação completa fica no comando reconciliar_repasses.
+
+@receiver(post_save, sender=Repasse)
+def reconciliar_repasse_salvo(sender, instance, **kwargs):
+    Repasse.objects.filter(pk=instance.pk).reconciliar()
+
+
+def _ciclo_da_venda(loja_id, data_venda):
+    if not loja_id or not data_venda:
+        return None
+    dia = timezone.localdate(data_venda) if timezone.is_aware(data_venda) else data_venda.date()
+    return loja_id, Loja.data_repasse_da_venda(dia)
+
+
+def _reconciliar_ciclos(ciclos):
+    filtro = Q()
+    for loja_id, data_repasse in ciclos:
+        filtro |= Q(loja_id=loja_id, data__date=data_repasse)
+    Repasse.objects.filter(filtro).reconciliar()
+
+
+@receiver(post_save, sender=Venda)
+def reconciliar_repasse_da_venda(sender, instance, created, **kwargs):
+    """Só vendas novas ou que mudaram loja, data, repasse ou exclusão afetam o ciclo; roda após o commit."""
+    anterior = getattr(instance, '_anterior', {})
+    if not created and all(anterior.get(campo) == getattr(instance, campo) for campo in Venda.CAMPOS_MONITORADOS):
+        return
+    ciclos = {
+        _ciclo_da_venda(instance.loja_id, instance.data_venda),
+        _ciclo_da_venda(anterior.get('loja_id'), anterior.get('data_venda')),
+    } - {None}
+    if ciclos:
+        transaction.on_commit(partial(_reconciliar_ciclos, ciclos))
@@ -10,7 +10,8 @@ from vendas.forms import ContatoForm
 from vendas.views import BaseView
 from .models import CaixaMensal, CaixaMensalGastoFixo, CaixaMensalFuncionario, GastosAleatorios
 from financeiro.forms import RelatorioSaidaForm
-from vendas.models import Loja, Parcela
+from vendas.models import LancamentoCaixa, Loja, Parcela
+from vendas.exportacao import ExportacaoMixin, formato_exportacao
 from .models import CaixaMensal, CaixaMensalFuncionario, CaixaMensalGastoFixo, GastoFixo, GastosAleatorios
 from datetime import datetime, timedelta
 from django.db import transaction
@@ -19,6 +20,13 @@ from vendas.models import Pagamento
 from django.contrib.auth.mixins import PermissionRequiredMixin
 from django.contrib.auth.decorators import permission_required
 from django.db.models import OuterRef, Subquery, DateField
+from django.http import StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from .relatorios import (
+    COLUNAS_CONTAS_A_RECEBER, TAMANHO_LOTE, TEMPLATE_INICIO, contexto_contas_a_receber, exportacao_contas_a_receber,
+    filtrar_contas_a_receber, partes_contas_a_receber,
+)
 
 
 class CaixaMensalListView(BaseView, PermissionRequiredMixin, ListView):
@@ -376,7 +384,9 @@ class ContasAReceberListView(BaseView, PermissionRequiredMixin, ListView):
     def get_queryset(self):
         loja_id = self.request.session.get('loja_id')
         user = self.request.user
-        qs = Pagamento.objects.exclude(venda__is_deleted=True).with_status_flags()
+        qs = Pagamento.objects.exclude(venda__is_deleted=True).with_status_flags().with_financial_summary().select_related(
+            'venda__loja', 'venda__cliente'
+        )
         
         search = self.request.GET.get('search', '')
         if search:
@@ -424,23 +434,10 @@ class ContasAReceberListView(BaseView, PermissionRequiredMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        queryset = self.get_queryset()
-        for pagamento in queryset:
-            status = self.verificar_atraso_parcela(pagamento)
-            pagamento.atrasado = status
-        context['contas_a_receber'] = queryset
+        context['contas_a_receber'] = self.get_queryset()
         if self.request.user.has_perm('vendas.can_view_all_stores'):
             context['lojas'] = Loja.objects.all()
         return context
-
-    def verificar_atraso_parcela(self, pagamento):
-        data_atual = timezone.now().date()
-        parcela = pagamento.parcelas_pagamento.filter(pago=False).order_by('data_vencimento').first()
-        if parcela and parcela.data_vencimento < data_atual:
-            if parcela.valor_restante < parcela.valor:
-                return "Pago parcialmente"
-            return "Atrasado"
-        return "Em dia"
     
 
 
@@ -528,128 +525,50 @@ class RelatorioContasAReceberView(BaseView, PermissionRequiredMixin, TemplateVie
 
         return context
 
-class FolhaRelatorioContasAReceberView(BaseView, PermissionRequiredMixin, TemplateView):
-    template_name = 'contas_a_receber/folha.html'
+class FolhaRelatorioContasAReceberView(ExportacaoMixin, BaseView, PermissionRequiredMixin, TemplateView):
+    """
+    Relatório de contas a receber. Os totais saem de uma única agregação e as linhas são
+    renderizadas em lotes por uma resposta em streaming, sem carregar todo o período na memória.
+    """
+    template_name = TEMPLATE_INICIO
     permission_required = 'vendas.can_genarate_report_payments'
+    tamanho_lote = TAMANHO_LOTE
+    nome_exportacao = 'relatorio_contas_a_receber'
+    colunas_exportacao = COLUNAS_CONTAS_A_RECEBER
 
-    def get_context_data(self, **kwargs):
-        data_inicio = self.request.GET.get('data_inicial')
-        data_fim = self.request.GET.get('data_final')
-        lojas = self.request.GET.getlist('lojas')
-        status_list = self.request.GET.getlist('status')
-        contas_a_receber = []
-
-        if data_inicio and data_fim:
-            lojas_qs = Loja.objects.filter(id__in=lojas)
-            data_inicio_dt = datetime.strptime(data_inicio, "%Y-%m-%d").date()
-            data_final_dt = datetime.strptime(data_fim, "%Y-%m-%d").date()
-            data_final_dt_plus = data_final_dt + timedelta(days=1)
-
-            # Subqueries para datas relevantes
-            proximo_vencimento_subquery = Subquery(
-                Parcela.objects.filter(
-                    pagamento=OuterRef('pk'),
-                    pago=False,
-                    data_vencimento__gte=timezone.now()
-                ).order_by('data_vencimento').values('data_vencimento')[:1],
-                output_field=DateField()
-            )
-            ultimo_vencimento_subquery = Subquery(
-                Parcela.objects.filter(
-                    pagamento=OuterRef('pk'),
-                    pago=False,
-                    data_vencimento__lt=timezone.now()
-                ).order_by('data_vencimento').values('data_vencimento')[:1],
-                output_field=DateField()
-            )
-            ultimo_pagamento_subquery = Subquery(
-                Parcela.objects.filter(
-                    pagamento=OuterRef('pk'),
-                    pago=True
-                ).order_by('data_pagamento').values('data_pagamento')[:1],
-                output_field=DateField()
-            )
-
-            pagamentos_qs = Pagamento.objects.exclude(venda__is_deleted=True).exclude(desativado=True).with_status_flags().distinct()
-            pagamentos_qs = pagamentos_qs.annotate(
-                proximo_vencimento=proximo_vencimento_subquery,
-                ultimo_vencimento=ultimo_vencimento_subquery,
-                ultimo_pagamento=ultimo_pagamento_subquery
-            )
-
-            if lojas_qs:
-                pagamentos_qs = pagamentos_qs.filter(loja__in=lojas_qs)
-
-            # Filtro de status e datas
-            if status_list and 'todos' not in status_list:
-                q_status = None
-                date_filter = Q()
-                for status in status_list:
-                    if status == 'pendente':
-                        q = Q(com_pagamento_pendente=True)
-                        date_q = Q(proximo_vencimento__isnull=False, proximo_vencimento__gte=data_inicio_dt, proximo_vencimento__lt=data_final_dt_plus)
-                    elif status == 'pago':
-                        q = Q()  # Não filtra por flag, só pela data do último pagamento
-                        date_q = Q(ultimo_pagamento__isnull=False, ultimo_pagamento__gte=data_inicio_dt, ultimo_pagamento__lt=data_final_dt_plus)
-                    elif status == 'atrasado':
-                        q = Q(com_parcela_atrasada=True)
-                        date_q = Q(ultimo_vencimento__isnull=False, ultimo_vencimento__gte=data_inicio_dt, ultimo_vencimento__lt=data_final_dt_plus)
-                    else:
-                        continue
-                    q_status = q if q_status is None else q_status | q
-                    date_filter = date_filter | date_q
-                if q_status is not None:
-                    pagamentos_qs = pagamentos_qs.filter(q_status)
-                if date_filter:
-                    pagamentos_qs = pagamentos_qs.filter(date_filter)
-            else:
-                # Se não filtrar por status, usar proximo_vencimento por padrão
-                pagamentos_qs = pagamentos_qs.filter(
-                    proximo_vencimento__isnull=False,
-                    proximo_vencimento__gte=data_inicio_dt,
-                    proximo_vencimento__lt=data_final_dt_plus
-                )
-
-            contas_a_receber = list(pagamentos_qs)
+    def get(self, request, *args, **kwargs):
+        formato = formato_exportacao(request)
+        if formato:
+            return self.exportar(formato)
+        return super().get(request, *args, **kwargs)
 
-        total_atrasado = sum(
-            pagamento.total_atrasos() for pagamento in contas_a_receber if contas_a_receber
-        )
-        
-        total_pago = sum(
-            pagamento.valor_pago_ultimo() for pagamento in contas_a_receber if contas_a_receber
-        )
+    def get_queryset_exportacao(self):
+        return exportacao_contas_a_receber(self.get_pagamentos())
 
-        total_a_vencer = sum(
-            pagamento.valor_a_vencer() for pagamento in contas_a_receber if contas_a_receber
-        )
+    def get_pagamentos(self):
+        return filtrar_contas_a_receber(self.request.GET)
 
-        total_proximo_vencimento = sum(
-            pagamento.valor_atual_a_vencer() for pagamento in contas_a_receber if contas_a_receber
-        )
-
-        total = sum(
-            pagamento.valor_total_parcelas() for pagamento in contas_a_receber
-        )
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(contexto_contas_a_receber(self.get_pagamentos(), self.request.GET))
+        return context
 
-        total_quitado = sum(
-            pagamento.valor_quitado() for pagamento in contas_a_receber if contas_a_receber
-        )
+    def render_to_response(self, context, **response_kwargs):
+        partes = partes_contas_a_receber(context, self.request, self.tamanho_lote)
+        if isinstance(self.request, ASGIRequest):
+            partes = self.partes_assincronas(partes)
+        return StreamingHttpResponse(partes, content_type='text/html; charset=utf-8')
 
-        context = super().get_context_data(**kwargs)
-        context['contas_a_receber'] = contas_a_receber
-        context['lojas'] = Loja.objects.filter(id__in=lojas).values_list('nome', flat=True)
-        context['status_list'] = status_list
-        context['data_inicio'] = datetime.strptime(data_inicio, "%Y-%m-%d").date() if data_inicio else None
-        context['data_fim'] = datetime.strptime(data_fim, "%Y-%m-%d").date() if data_fim else None
-        context['total_atrasado'] = total_atrasado
-        context['total_pago'] = total_pago
-        context['total_a_vencer'] = total_a_vencer
-        context['total_proximo_vencimento'] = total_proximo_vencimento
-        context['total'] = total
-        context['total_quitado'] = total_quitado
+    @staticmethod
+    async def partes_assincronas(partes):
+        # No ASGI cada lote é consultado/renderizado fora do event loop, mantendo o streaming
+        proxima_parte = sync_to_async(next)
+        while True:
+            parte = await proxima_parte(partes, None)
+            if parte is None:
+                break
+            yield parte
 
-        return context
 
 class RelatorioSaidaView(BaseView, PermissionRequiredMixin, TemplateView):
     template_name = 'relatorio/relatorio_saida.html'
@@ -661,24 +580,51 @@ class RelatorioSaidaView(BaseView, PermissionRequiredMixin, TemplateView):
 
         return context
     
-class FolhaRelatorioSaidaView(BaseView, PermissionRequiredMixin, TemplateView):
+class FolhaRelatorioSaidaView(ExportacaoMixin, BaseView, PermissionRequiredMixin, TemplateView):
     template_name = 'relatorio/folha_relatorio_saida.html'
     permission_required = 'financeiro.view_caixamensal'
-
-    def get_context_data(self, **kwargs):
+    nome_exportacao = 'relatorio_saidas'
+    colunas_exportacao = (
+        ('ID', 'pk'),
+        ('Loja', 'caixa__loja__nome'),
+        ('Abertura do Caixa', 'caixa__data_abertura'),
+        ('Fechamento do Caixa', 'caixa__data_fechamento'),
+        ('Motivo', 'motivo'),
+        ('Valor', 'valor'),
+        ('Lançado por', 'criado_por__username'),
+        ('Lançado em', 'criado_em'),
+    )
+
+    def get_saidas(self):
         data_inicio = self.request.GET.get('data_inicial')
         data_fim = self.request.GET.get('data_final')
         lojas = self.request.GET.getlist('lojas')
-        saidas = []
 
-        if data_inicio and data_fim:
-            lojas = Loja.objects.filter(id__in=lojas)
-            data_final = datetime.strptime(data_fim, "%Y-%m-%d").date() + timedelta(days=1)
+        if not (data_inicio and data_fim):
+            return LancamentoCaixa.objects.none()
+
+        data_final = datetime.strptime(data_fim, "%Y-%m-%d").date() + timedelta(days=1)
+        return LancamentoCaixa.objects.filter(
+            caixa__loja__in=Loja.objects.filter(id__in=lojas),
+            caixa__data_abertura__range=[data_inicio, data_final],
+            caixa__data_fechamento__isnull=False,
+            tipo_lancamento='2',
+        )
+
+    def get(self, request, *args, **kwargs):
+        formato = formato_exportacao(request)
+        if formato:
+            return self.exportar(formato)
+        return super().get(request, *args, **kwargs)
 
-            for loja in lojas:
-                caixas = Caixa.objects.filter(loja=loja).filter(data_abertura__range=[data_inicio, data_final]).filter(data_fechamento__isnull=False)
-                for caixa in caixas:
-                    saidas += caixa.lancamentos_caixa.filter(tipo_lancamento='2')
+    def get_queryset_exportacao(self):
+        return self.get_saidas().order_by('caixa__loja__nome', 'caixa__data_abertura', 'pk')
+
+    def get_context_data(self, **kwargs):
+        data_inicio = self.request.GET.get('data_inicial')
+        data_fim = self.request.GET.get('data_final')
+        lojas = Loja.objects.filter(id__in=self.request.GET.getlist('lojas'))
+        saidas = list(self.get_saidas().select_related('caixa__loja').order_by('caixa__loja__nome', 'caixa__data_abertura', 'pk'))
 
         context = super().get_context_data(**kwargs)
         context['saidas'] = saidas
@@ -1,3 +1,5 @@
+import asyncio
+
 from channels.generic.websocket import AsyncWebsocketConsumer
 import json
 
@@ -6,14 +8,25 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         if self.scope["user"].is_authenticated:
             self.group_name = f"user_{self.scope['user'].id}"
             await self.channel_layer.group_add(self.group_name, self.channel_name)
+            # a inscrição no grupo expira (group_expiry); conexões longas renovam antes disso
+            self.renovacao = asyncio.ensure_future(self.renovar_grupo())
             await self.accept()
         else:
             await self.close()
 
     async def disconnect(self, code):
         if self.scope["user"].is_authenticated:
+            renovacao = getattr(self, 'renovacao', None)
+            if renovacao:
+                renovacao.cancel()
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
+    async def renovar_grupo(self):
+        intervalo = max(getattr(self.channel_layer, 'group_expiry', 86400) / 2, 1)
+        while True:
+            await asyncio.sleep(intervalo)
+            await self.channel_layer.group_add(self.group_name, self.channel_name)
+
     async def send_notification(self, event):
         await self.send(text_data=json.dumps({
             "verb": event["verb"],
@@ -22,4 +35,3 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             "timestamp": event["timestamp"],
             "notification_id": event["notification_id"],
         }))
-
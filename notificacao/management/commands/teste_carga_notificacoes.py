@@ -0,0 +1,101 @@
+import asyncio
+import random
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notificacao.utils import enviar_para_usuarios
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(int(len(ordenados) * p), len(ordenados) - 1)] if ordenados else 0
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga do envio de notificações pelo channel layer: inscreve canais em grupos user_<id>, '
+        'dispara lotes como o notificar_usuarios e mede tempo de envio, entregas e descartes. '
+        'Não grava nada no banco. Use --redis para apontar para um Redis local.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conexoes', type=int, default=200, help='Canais (abas abertas) simulados.')
+        parser.add_argument('--lotes', type=int, default=50, help='Quantidade de notificações em lote.')
+        parser.add_argument('--destinatarios', type=int, default=40, help='Destinatários por lote.')
+        parser.add_argument('--redis', help='URL de um Redis (ex.: redis://localhost:6379/9) no lugar do layer configurado.')
+        parser.add_argument('--espera', type=float, default=5, help='Segundos aguardando as entregas.')
+
+    def handle(self, *args, **options):
+        if options['redis']:
+            from channels_redis.core import RedisChannelLayer
+
+            config = dict(settings.CHANNEL_LAYERS['default'].get('CONFIG', {}), hosts=[options['redis']])
+            layer = RedisChannelLayer(**config)
+        else:
+            layer = get_channel_layer()
+        self.stdout.write(f'Channel layer: {layer.__class__.__module__}.{layer.__class__.__name__}')
+        async_to_sync(self.executar)(layer, options)
+
+    async def executar(self, layer, options):
+        usuarios = list(range(1, options['conexoes'] + 1))
+        canais = {}
+        for usuario_id in usuarios:
+            canais[usuario_id] = await layer.new_channel()
+            await layer.group_add(f'user_{usuario_id}', canais[usuario_id])
+
+        esperadas = dict.fromkeys(usuarios, 0)
+        tempos = []
+        try:
+            for lote in range(options['lotes']):
+                alvos = random.sample(usuarios, min(options['destinatarios'], len(usuarios)))
+                mensagens = {
+                    usuario_id: {
+                        'type': 'send_notification', 'verb': 'Teste de carga', 'description': f'Lote {lote}',
+                        'target_url': '/', 'timestamp': '', 'notification_id': lote, 'type_notification': None,
+                    }
+                    for usuario_id in alvos
+                }
+                inicio = time.perf_counter()
+                await enviar_para_usuarios(layer, mensagens)
+                tempos.append(time.perf_counter() - inicio)
+                for usuario_id in alvos:
+                    esperadas[usuario_id] += 1
+
+            recebidas = await self.receber(layer, canais, esperadas, options['espera'])
+        finally:
+            for usuario_id, canal in canais.items():
+                await layer.group_discard(f'user_{usuario_id}', canal)
+
+        total_esperado = sum(esperadas.values())
+        total_recebido = sum(recebidas.values())
+        self.stdout.write(
+            f'Lotes: {len(tempos)}  envio p50 {_percentil(tempos, .5) * 1000:.1f} ms  '
+            f'p95 {_percentil(tempos, .95) * 1000:.1f} ms  total {sum(tempos):.2f} s'
+        )
+        estilo = self.style.SUCCESS if total_recebido == total_esperado else self.style.WARNING
+        self.stdout.write(estilo(
+            f'Entregues {total_recebido}/{total_esperado}; descartadas (capacidade/expiração): '
+            f'{total_esperado - total_recebido}'
+        ))
+
+    async def receber(self, layer, canais, esperadas, espera):
+        recebidas = dict.fromkeys(canais, 0)
+        limite = time.monotonic() + espera
+
+        async def drenar(usuario_id, canal):
+            while recebidas[usuario_id] < esperadas[usuario_id]:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return
+                try:
+                    await asyncio.wait_for(layer.receive(canal), restante)
+                except asyncio.TimeoutError:
+                    return
+                recebidas[usuario_id] += 1
+
+        await asyncio.gather(*(drenar(usuario_id, canal) for usuario_id, canal in canais.items()))
+        return recebidas
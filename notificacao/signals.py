@@ -1,9 +1,9 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
 from vendas.models import AnaliseCreditoCliente, Cliente
 from django.contrib.auth import get_user_model
-from notifications.signals import notify
-from notificacao.utils import enviar_ws_para_usuario
+from django.contrib.auth.models import Group
+from notificacao.utils import destinatarios, limpar_destinatarios, notificar_usuarios
 from estoque.models import EntradaEstoque
 
 User = get_user_model()
@@ -26,33 +26,16 @@ def notificar_status_analise_credito(sender, instance, created, **kwargs):
         description = f'{renavam_info} da loja {instance.loja.nome.capitalize()}.'
         
         # Admins + analista que criou
-        usuarios_para_notificar = list(
-            User.objects.filter(groups__name__in=['ADMINISTRADOR', 'ANALISTA']).exclude(id=instance.criado_por_id)
+        usuarios_para_notificar = destinatarios('ADMINISTRADOR', 'ANALISTA', incluir=instance.criado_por_id)
+        notificar_usuarios(
+            usuarios_para_notificar,
+            instance,
+            verb=verb,
+            description=description,
+            target=instance.cliente,
+            target_url=instance.cliente.get_absolute_url(),
+            type_notification='analise_credito_cliente',
         )
-        if instance.criado_por:
-            usuarios_para_notificar.append(instance.criado_por)
-        
-        for user in usuarios_para_notificar:
-            notify.send(
-                instance,
-                recipient=user,
-                verb=verb,
-                description=description,
-                target=instance.cliente,
-            )
-
-            # WebSocket
-            ultima_notificacao = user.notifications.unread().order_by('-timestamp').first()
-            if ultima_notificacao:
-                enviar_ws_para_usuario(
-                    usuario=user,
-                    instance=instance,
-                    notification_id=ultima_notificacao.id,
-                    verb=verb,
-                    description=description,
-                    target_url=instance.cliente.get_absolute_url(),
-                    type_notification='analise_credito_cliente',
-                )
 
     if instance.status_aplicativo == 'A':
         verb = f'Cliente {cliente_nome.capitalize()} aguarda informações de RENAVAM e placa.'
@@ -60,35 +43,17 @@ def notificar_status_analise_credito(sender, instance, created, **kwargs):
         description = f'{renavam_info} da loja {instance.loja.nome.capitalize()}.'
 
         # Admins + analista que criou
-        usuarios_para_notificar = list(
-            User.objects.filter(groups__name__in=['ADMINISTRADOR', 'ANALISTA']).exclude(id=instance.criado_por_id)
+        usuarios_para_notificar = destinatarios('ADMINISTRADOR', 'ANALISTA', incluir=instance.criado_por_id)
+        notificar_usuarios(
+            usuarios_para_notificar,
+            instance,
+            verb=verb,
+            description=description,
+            target=instance.cliente,
+            target_url=instance.cliente.get_absolute_url(),
+            type_notification='analise_credito_cliente',
         )
 
-        if instance.criado_por:
-            usuarios_para_notificar.append(instance.criado_por)
-
-        for user in usuarios_para_notificar:
-            notify.send(
-                instance,
-                recipient=user,
-                verb=verb,
-                description=description,
-                target=instance.cliente,
-            )
-
-            # WebSocket
-            ultima_notificacao = user.notifications.unread().order_by('-timestamp').first()
-            if ultima_notificacao:
-                enviar_ws_para_usuario(
-                    usuario=user,
-                    instance=instance,
-                    notification_id=ultima_notificacao.id,
-                    verb=verb,
-                    description=description,
-                    target_url=instance.cliente.get_absolute_url(),
-                    type_notification='analise_credito_cliente',
-                )
-
     if not hasattr(instance, 'status_anterior'):
         instance.status_anterior = instance.status
         
@@ -105,29 +70,15 @@ def notificar_status_analise_credito(sender, instance, created, **kwargs):
             return
         
         # Somente o Criador
-        usuarios_para_notificar = [instance.criado_por]
-        
-        for user in usuarios_para_notificar:
-            notify.send(
-                instance,
-                recipient=user,
-                verb=verb,
-                description=description,
-                target=instance.cliente,
-            )
-
-            # WebSocket
-            ultima_notificacao = user.notifications.unread().order_by('-timestamp').first()
-            if ultima_notificacao:
-                enviar_ws_para_usuario(
-                    usuario=user,
-                    instance=instance,
-                    notification_id=ultima_notificacao.id,
-                    verb=verb,
-                    description=description,
-                    target_url=instance.cliente.get_absolute_url(),
-                    type_notification='analise_credito_cliente',
-                )
+        notificar_usuarios(
+            [instance.criado_por_id],
+            instance,
+            verb=verb,
+            description=description,
+            target=instance.cliente,
+            target_url=instance.cliente.get_absolute_url(),
+            type_notification='analise_credito_cliente',
+        )
                 
                 
 #     if created:
@@ -172,23 +123,37 @@ def notificar_administradores_entrada(sender, instance, created, **kwargs):
         loja_nome = instance.loja.nome.capitalize()
         criado_por = instance.criado_por.get_full_name()
         criado_por = criado_por.capitalize() if criado_por else instance.criado_por.username.capitalize()
-        admins = User.objects.filter(groups__name__icontains="ADMINISTRADOR").exclude(id=instance.criado_por_id)
-        for admin in admins:
-            notificacoes = notify.send(
-                instance,
-                recipient=admin,
-                verb=f'Nova entrada de estoque registrada na {loja_nome.capitalize()} por {criado_por.capitalize()}',
-                description=f'Entrada {instance.numero_nota}',
-                target=instance,
-            )
-
-            # Extrai a notificação criada
-            notification = admin.notifications.unread().order_by('-timestamp').first()
-
-            if notification:
-                enviar_ws_para_usuario(admin, instance, notification.id, 
-                verb=f'Nova entrada de estoque registrada na {loja_nome.capitalize()} por {criado_por.capitalize()}', 
-                description=f'Entrada {instance.numero_nota}',
-                target_url=instance.get_absolute_url(),
-                type_notification='entrada_estoque',
-                )
\ No newline at end of file
+        admins = destinatarios('ADMINISTRADOR', contem=True, excluir=instance.criado_por_id)
+        notificar_usuarios(
+            admins,
+            instance,
+            verb=f'Nova entrada de estoque registrada na {loja_nome.capitalize()} por {criado_por.capitalize()}',
+            description=f'Entrada {instance.numero_nota}',
+            target=instance,
+            target_url=instance.get_absolute_url(),
+            type_notification='entrada_estoque',
+        )
+
+
+# --- CACHE DE DESTINATÁRIOS POR GRUPO ---
+
+@receiver(m2m_changed, sender=User.groups.through)
+def limpar_destinatarios_grupos(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        limpar_destinatarios()
+
+
+@receiver(post_save, sender=User)
+def limpar_destinatarios_usuario(sender, instance, created, update_fields=None, **kwargs):
+    # login grava só last_login; qualquer outro save pode ter mudado is_active
+    if update_fields is not None and 'is_active' not in update_fields:
+        return
+    if not created:
+        limpar_destinatarios()
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def limpar_destinatarios_exclusao(sender, **kwargs):
+    limpar_destinatarios()
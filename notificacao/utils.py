@@ -1,7 +1,122 @@
+import asyncio
+from functools import partial
+
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
 from django.utils.timezone import localtime
 from django.contrib.humanize.templatetags.humanize import naturaltime
+from notifications.models import Notification
+
+# group_send simultâneos por lote; com Redis cada envio é um round-trip e não queremos abrir centenas de uma vez
+ENVIOS_SIMULTANEOS = 20
+
+CHAVE_DESTINATARIOS = 'notificacao:destinatarios_por_grupo'
+# limpo pelos sinais de grupos/usuários (notificacao/signals.py); o tempo cobre outros processos
+TEMPO_DESTINATARIOS = 600
+
+
+def _destinatarios_por_grupo():
+    """{nome do grupo: ids dos usuários ativos}, montado com uma consulta e guardado em cache."""
+    grupos = cache.get(CHAVE_DESTINATARIOS)
+    if grupos is None:
+        grupos = {}
+        relacoes = get_user_model().groups.through.objects.filter(
+            user__is_active=True
+        ).values_list('group__name', 'user_id')
+        for nome, usuario_id in relacoes:
+            grupos.setdefault(nome, set()).add(usuario_id)
+        cache.set(CHAVE_DESTINATARIOS, grupos, TEMPO_DESTINATARIOS)
+    return grupos
+
+
+def destinatarios(*grupos, contem=False, excluir=None, incluir=None):
+    """
+    Ids dos usuários ativos dos grupos informados, sem consultar o banco quando o cache está válido.
+
+    `contem=True` compara os nomes por trecho (como groups__name__icontains); `excluir` e `incluir`
+    recebem ids avulsos (ex.: quem fez a ação, o criador do registro).
+    """
+    ids = set()
+    nomes = [grupo.upper() for grupo in grupos]
+    for nome, usuarios in _destinatarios_por_grupo().items():
+        if any(g in nome.upper() for g in nomes) if contem else nome in grupos:
+            ids |= usuarios
+    if incluir:
+        ids.add(incluir)
+    ids.discard(excluir)
+    return ids
+
+
+def limpar_destinatarios():
+    cache.delete(CHAVE_DESTINATARIOS)
+
+
+# --- RESUMO DE NÃO LIDAS (sino do menu) ---
+
+LIMITE_RESUMO = 5
+# a chave é apagada a cada criação/leitura e remontada na próxima página; o tempo só limita a
+# deriva se algo escapar desses caminhos
+TEMPO_RESUMO = 600
+
+
+def _chave_resumo(usuario_id):
+    return f'notificacao:resumo:{usuario_id}'
+
+
+def resumo_notificacoes(usuario):
+    """{'total': não lidas, 'ultimas': até LIMITE_RESUMO dicts (id, verb, description, timestamp, url)}."""
+    chave = _chave_resumo(usuario.pk)
+    resumo = cache.get(chave)
+    if resumo is None:
+        nao_lidas = usuario.notifications.unread()
+        total = nao_lidas.count()
+        resumo = {
+            'total': total,
+            'ultimas': [
+                _item_resumo(n.pk, n.verb, n.description, n.timestamp, n.target.get_absolute_url() if n.target else '')
+                for n in nao_lidas.prefetch_related('target')[:LIMITE_RESUMO]
+            ] if total else [],
+        }
+        cache.set(chave, resumo, TEMPO_RESUMO)
+    return resumo
+
+
+def _item_resumo(pk, verb, description, timestamp, url):
+    return {'id': pk, 'verb': verb, 'description': description, 'timestamp': timestamp, 'url': url}
+
+
+def limpar_resumo(*usuario_ids):
+    """
+    Descarta o resumo dos usuários. Apagar (em vez de ajustar o valor em cache) não perde
+    alterações quando dois processos mudam as notificações do mesmo usuário ao mesmo tempo.
+    """
+    cache.delete_many([_chave_resumo(usuario_id) for usuario_id in usuario_ids])
+
+
+def marcar_lida(notificacao):
+    if notificacao.unread:
+        notificacao.mark_as_read()
+        limpar_resumo(notificacao.recipient_id)
+
+
+def marcar_lidas(usuario, notificacoes):
+    """Marca como lidas as não lidas do queryset (do próprio usuário)."""
+    ids = list(notificacoes.filter(recipient=usuario, unread=True).values_list('pk', flat=True))
+    if ids:
+        Notification.objects.filter(pk__in=ids, unread=True).update(unread=False)
+        limpar_resumo(usuario.pk)
+
+
+def marcar_todas_lidas(usuario):
+    usuario.notifications.mark_all_as_read()
+    limpar_resumo(usuario.pk)
+
 
 def enviar_ws_para_usuario(usuario, instance, notification_id, verb, description, target_url, type_notification=None):
     channel_layer = get_channel_layer()
@@ -19,3 +134,73 @@ def enviar_ws_para_usuario(usuario, instance, notification_id, verb, description
             "type_notification": type_notification,
         }
     )
+
+
+def notificar_usuarios(usuarios, instance, verb, description, target, target_url=None, type_notification=None):
+    """
+    Notifica vários usuários de uma vez, depois do commit da transação atual.
+
+    `usuarios` pode ser um queryset de User (avaliado só no envio) ou uma lista de usuários/ids.
+    As notificações são gravadas com um único bulk_create e os grupos user_<id> recebem os envios
+    em paralelo, numa só chamada ao channel layer.
+    """
+    envio = {
+        'actor_content_type_id': ContentType.objects.get_for_model(instance).pk,
+        'actor_object_id': str(instance.pk),
+        'target_content_type_id': ContentType.objects.get_for_model(target).pk,
+        'target_object_id': str(target.pk),
+        'verb': str(verb),
+        'description': description,
+    }
+    mensagem = {
+        "type": "send_notification",
+        "verb": str(verb),
+        "description": description,
+        "target_url": target_url or instance.get_absolute_url(),
+        "timestamp": localtime(instance.criado_em).strftime('%d/%m %H:%M'),
+        "type_notification": type_notification,
+    }
+    transaction.on_commit(partial(_enviar_lote, usuarios, envio, mensagem))
+
+
+def _ids_usuarios(usuarios):
+    if isinstance(usuarios, QuerySet):
+        return set(usuarios.values_list('pk', flat=True))
+    return {getattr(usuario, 'pk', usuario) for usuario in usuarios if usuario}
+
+
+async def enviar_para_usuarios(channel_layer, mensagens):
+    """Envia {usuario_id: mensagem} aos grupos user_<id>, com no máximo ENVIOS_SIMULTANEOS em andamento."""
+    limite = asyncio.Semaphore(ENVIOS_SIMULTANEOS)
+
+    async def enviar(usuario_id, mensagem):
+        async with limite:
+            await channel_layer.group_send(f"user_{usuario_id}", mensagem)
+
+    await asyncio.gather(*(enviar(usuario_id, mensagem) for usuario_id, mensagem in mensagens.items()))
+
+
+def _enviar_lote(usuarios, envio, mensagem):
+    ids = _ids_usuarios(usuarios)
+    if not ids:
+        return
+
+    timestamp = timezone.now()
+    notificacoes = Notification.objects.bulk_create([
+        Notification(recipient_id=usuario_id, timestamp=timestamp, **envio) for usuario_id in ids
+    ])
+    por_usuario = {n.recipient_id: n.pk for n in notificacoes if n.pk}
+    if len(por_usuario) < len(ids):
+        # bancos sem RETURNING (MySQL) não devolvem os ids do bulk_create
+        por_usuario = dict(Notification.objects.filter(
+            recipient_id__in=ids, timestamp=timestamp, verb=envio['verb'],
+            actor_content_type_id=envio['actor_content_type_id'], actor_object_id=envio['actor_object_id'],
+        ).values_list('recipient_id', 'pk'))
+
+    limpar_resumo(*ids)
+
+    # uma passagem pelo event loop para todos os destinatários
+    async_to_sync(enviar_para_usuarios)(get_channel_layer(), {
+        usuario_id: dict(mensagem, notification_id=notification_id)
+        for usuario_id, notification_id in por_usuario.items()
+    })
@@ -9,17 +9,18 @@ from django.views.generic import ListView
 from django.db.models import Q
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import RedirectView
+from .utils import marcar_lida, marcar_lidas, marcar_todas_lidas
 
 @login_required
 def marcar_como_lida(request, pk):
     notif = get_object_or_404(Notification, pk=pk, recipient=request.user)
-    notif.mark_as_read()
+    marcar_lida(notif)
     return redirect(notif.target.get_absolute_url() if notif.target else '/')
 
 
 @login_required
 def marcar_todas_como_lidas(request):
-    request.user.notifications.mark_all_as_read()
+    marcar_todas_lidas(request.user)
     return redirect('vendas:index')
 
 
@@ -27,7 +28,7 @@ def marcar_todas_como_lidas(request):
 class MarcarNotificacaoComoLidaView(View):
     def post(self, request, pk):
         notificacao = get_object_or_404(Notification, pk=pk, recipient=request.user)
-        notificacao.mark_as_read()
+        marcar_lida(notificacao)
         return JsonResponse({'status': 'ok'})
 
 
@@ -55,13 +56,7 @@ class NotificacaoListView(LoginRequiredMixin, ListView):
         ids = request.POST.getlist('selected_notifications')
         if ids:
             # Apenas as do usuário e que estejam não lidas
-            notifs = Notification.objects.filter(
-                recipient=request.user,
-                id__in=ids,
-                unread=True
-            )
-            # marca todas como lidas
-            notifs.update(unread=False)
+            marcar_lidas(request.user, Notification.objects.filter(id__in=ids))
         # volta pra mesma página, preservando filtros de GET
         params = request.GET.urlencode()
         url = request.path
@@ -84,7 +79,7 @@ class MarcarNotificacaoComoLidaRedirectView(LoginRequiredMixin, RedirectView):
     def get_redirect_url(self, *args, **kwargs):
         pk = kwargs['pk']
         notif = get_object_or_404(Notification, pk=pk, recipient=self.request.user)
-        notif.mark_as_read()  # marca como lida
+        marcar_lida(notif)  # marca como lida
         # pega o destino: parâmetro next ou o próprio target
         destino = self.request.GET.get('next') or notif.target.get_absolute_url()
         return destino
@@ -97,7 +92,7 @@ def marcar_selecionadas(request):
         ids = request.POST.getlist('selected_notifications')
         if ids:
             # marca apenas as não-lidas dentre as selecionadas
-            request.user.notifications.unread().filter(id__in=ids).mark_all_as_read()
+            marcar_lidas(request.user, request.user.notifications.filter(id__in=ids))
     next_url = (
         request.GET.get('next')
         or request.POST.get('next')
@@ -110,7 +105,7 @@ def marcar_selecionadas(request):
 @login_required
 def ler_todas(request):
     if request.method == 'POST':
-        request.user.notifications.unread().mark_all_as_read()
+        marcar_todas_lidas(request.user)
     next_url = request.GET.get('next') \
                or request.POST.get('next') \
                or request.META.get('HTTP_REFERER') \
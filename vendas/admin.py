@@ -46,7 +46,15 @@ class TipoPagamentoAdmin(AdminBase):
     
 @admin.register(Caixa)
 class CaixaAdmin(AdminBase):
-    list_display = ('data_abertura', 'data_fechamento')
+    list_display = ('data_abertura', 'data_fechamento', 'saldos_congelados_em')
+    actions = ['recalcular_saldos_congelados']
+
+    @admin.action(description='Recalcular saldos congelados dos caixas fechados')
+    def recalcular_saldos_congelados(self, request, queryset):
+        caixas = queryset.filter(data_fechamento__isnull=False)
+        for caixa in caixas:
+            caixa.congelar_saldos(user=request.user)
+        self.message_user(request, f"Saldos recalculados para {caixas.count()} caixa(s) fechado(s).")
     
 @admin.register(ProdutoVenda)
 class ProdutoVendaAdmin(admin.ModelAdmin):
@@ -89,4 +97,10 @@ class AnaliseCreditoClienteAdmin(AdminBase):
     list_display = ('cliente', 'status')
     list_filter = ('status',)
     search_fields = ('cliente__nome',)
-    list_editable = ('status',)
\ No newline at end of file
+    list_editable = ('status',)
+
+@admin.register(RelatorioJob)
+class RelatorioJobAdmin(AdminBase):
+    list_display = ('tipo', 'formato', 'status', 'criado_por', 'criado_em', 'concluido_em')
+    list_filter = ('tipo', 'status', 'formato')
+    readonly_fields = AdminBase.readonly_fields + ('chave', 'iniciado_em', 'concluido_em')
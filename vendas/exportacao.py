@@ -0,0 +1,165 @@
+"""
+Exportação de relatórios em CSV ou XLSX.
+
+As linhas são lidas do banco em lotes com values_list() e gravadas em um arquivo temporário
+(em memória até TAMANHO_MEMORIA, depois em disco), servido com FileResponse. Assim o relatório
+nunca é montado inteiro na memória do processo, independentemente do número de linhas.
+"""
+import codecs
+import csv
+import io
+from datetime import date, datetime
+from decimal import Decimal
+from tempfile import SpooledTemporaryFile
+
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse
+from django.utils import timezone
+
+FORMATOS_EXPORTACAO = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+TAMANHO_LOTE = 2000
+TAMANHO_MEMORIA = 5 * 1024 * 1024
+
+
+def formato_exportacao(request):
+    """Retorna o formato pedido em ?formato= ou None quando a página HTML deve ser renderizada."""
+    formato = (request.GET.get('formato') or '').lower()
+    return formato if formato in FORMATOS_EXPORTACAO else None
+
+
+def sim_nao(valor):
+    return 'Sim' if valor else 'Não'
+
+
+def _valor_xlsx(valor):
+    # o Excel não aceita datas com fuso horário
+    if isinstance(valor, datetime) and timezone.is_aware(valor):
+        return timezone.localtime(valor).replace(tzinfo=None)
+    return valor
+
+
+def _valor_csv(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        if timezone.is_aware(valor):
+            valor = timezone.localtime(valor)
+        return valor.strftime('%d/%m/%Y %H:%M')
+    if isinstance(valor, date):
+        return valor.strftime('%d/%m/%Y')
+    if isinstance(valor, (Decimal, float)):
+        return str(valor).replace('.', ',')
+    return valor
+
+
+def _escrever_csv(arquivo, titulos, linhas):
+    # utf-8-sig e ';' para o Excel em pt-BR abrir o arquivo com acentos e colunas corretas.
+    # O arquivo continua binário: TextIOWrapper sobre SpooledTemporaryFile falha no Python 3.10
+    # (sem readable()), então as linhas são montadas num StringIO e gravadas já codificadas, em lotes.
+    texto = io.StringIO()
+    escritor = csv.writer(texto, delimiter=';')
+
+    def descarregar():
+        arquivo.write(texto.getvalue().encode('utf-8'))
+        texto.seek(0)
+        texto.truncate()
+
+    arquivo.write(codecs.BOM_UTF8)
+    escritor.writerow(titulos)
+    for numero, linha in enumerate(linhas, 1):
+        escritor.writerow([_valor_csv(valor) for valor in linha])
+        if numero % TAMANHO_LOTE == 0:
+            descarregar()
+    descarregar()
+
+
+def _escrever_xlsx(arquivo, titulos, linhas, resumo, titulo_planilha):
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(titulo_planilha[:31])
+    fonte = Font(bold=True, color="FFFFFF")
+    preenchimento = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+
+    cabecalho = []
+    for titulo in titulos:
+        celula = WriteOnlyCell(ws, value=titulo)
+        celula.font = fonte
+        celula.fill = preenchimento
+        cabecalho.append(celula)
+    ws.append(cabecalho)
+    for linha in linhas:
+        ws.append([_valor_xlsx(valor) for valor in linha])
+
+    if resumo:
+        ws_resumo = wb.create_sheet('Resumo')
+        for linha in resumo:
+            ws_resumo.append([_valor_xlsx(valor) for valor in linha])
+
+    wb.save(arquivo)
+
+
+def gerar_arquivo(queryset, colunas, formato, resumo=None, titulo_planilha='Relatório'):
+    """
+    Grava o queryset em um arquivo temporário CSV ou XLSX, já posicionado no início.
+
+    `colunas` é uma sequência de (título, campo) ou (título, campo, conversor), onde campo é
+    qualquer caminho aceito por values_list() (inclusive anotações). `resumo` são linhas extras
+    gravadas numa aba separada no XLSX (o CSV fica só com as colunas).
+    """
+    titulos = [coluna[0] for coluna in colunas]
+    campos = [coluna[1] for coluna in colunas]
+    conversores = [coluna[2] if len(coluna) > 2 else None for coluna in colunas]
+
+    def linhas():
+        for linha in queryset.values_list(*campos).iterator(chunk_size=TAMANHO_LOTE):
+            yield [
+                conversor(valor) if conversor else valor
+                for conversor, valor in zip(conversores, linha)
+            ]
+
+    arquivo = SpooledTemporaryFile(max_size=TAMANHO_MEMORIA)
+    if formato == 'csv':
+        _escrever_csv(arquivo, titulos, linhas())
+    else:
+        _escrever_xlsx(arquivo, titulos, linhas(), resumo, titulo_planilha)
+    arquivo.seek(0)
+    return arquivo
+
+
+def exportar_queryset(queryset, colunas, nome_arquivo, formato, resumo=None, titulo_planilha='Relatório'):
+    """Resposta de download do arquivo gerado por gerar_arquivo()."""
+    arquivo = gerar_arquivo(queryset, colunas, formato, resumo, titulo_planilha)
+    nome = f"{nome_arquivo}_{timezone.localtime().strftime('%Y%m%d_%H%M')}.{formato}"
+    return FileResponse(arquivo, as_attachment=True, filename=nome, content_type=FORMATOS_EXPORTACAO[formato])
+
+
+class ExportacaoMixin:
+    """
+    Mixin para as views de relatório: com ?formato=csv|xlsx a view devolve o arquivo
+    gerado a partir de get_queryset_exportacao(), reaproveitando os filtros da própria view.
+    Por padrão exporta o get_queryset() da view (ListView); views sem ele sobrescrevem o método.
+    """
+    colunas_exportacao = ()
+    nome_exportacao = 'relatorio'
+
+    def get_queryset_exportacao(self):
+        if not hasattr(self, 'get_queryset'):
+            raise ImproperlyConfigured(
+                f'{self.__class__.__name__} precisa definir get_queryset() ou get_queryset_exportacao().'
+            )
+        return self.get_queryset()
+
+    def get_resumo_exportacao(self):
+        return None
+
+    def exportar(self, formato):
+        return exportar_queryset(
+            self.get_queryset_exportacao(), self.colunas_exportacao, self.nome_exportacao, formato,
+            resumo=self.get_resumo_exportacao(),
+        )
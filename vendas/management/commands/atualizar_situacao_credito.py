@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from vendas.models import SituacaoCreditoCpf
+
+
+class Command(BaseCommand):
+    help = (
+        'Atualiza as parcelas em atraso da situação de crédito por CPF (executar diariamente após a meia-noite). '
+        'Com --completo reconstrói a tabela inteira.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true', help='Reconstrói a situação de todos os CPFs.')
+
+    def handle(self, *args, **options):
+        if options['completo']:
+            total = SituacaoCreditoCpf.reconstruir()
+            self.stdout.write(self.style.SUCCESS(f'Situação de crédito reconstruída: {total} CPF(s).'))
+        else:
+            total = SituacaoCreditoCpf.atualizar_referencia()
+            self.stdout.write(self.style.SUCCESS(f'Situação de crédito atualizada: {total} CPF(s).'))
@@ -0,0 +1,71 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+
+from vendas.models import RelatorioJob
+from vendas.relatorios import executar_relatorio_job
+
+
+def _inicializar_processo():
+    # com o método spawn o processo filho começa sem o Django configurado
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = 'Processa os relatórios pendentes (RelatorioJob) em um pool de processos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Número de processos.')
+        parser.add_argument('--continuo', action='store_true', help='Fica aguardando novos relatórios.')
+        parser.add_argument('--intervalo', type=int, default=5, help='Segundos entre as verificações no modo contínuo.')
+
+    def reservar_jobs(self, limite):
+        """Marca até `limite` jobs pendentes como processando; o update condicional evita que dois workers peguem o mesmo job."""
+        reenfileirados, abandonados = RelatorioJob.recuperar_travados()
+        if reenfileirados or abandonados:
+            self.stdout.write(self.style.WARNING(
+                f'Relatórios travados em processamento: {reenfileirados} reenfileirado(s), {abandonados} com erro.'
+            ))
+        reservados = []
+        pendentes = RelatorioJob.objects.filter(status='pendente').order_by('criado_em').values_list('pk', flat=True)[:limite]
+        for pk in pendentes:
+            if RelatorioJob.objects.filter(pk=pk, status='pendente').update(
+                status='processando', iniciado_em=timezone.now(), tentativas=F('tentativas') + 1,
+            ):
+                reservados.append(pk)
+        return reservados
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        contexto = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+
+        while True:
+            jobs = self.reservar_jobs(workers * 2)
+            if jobs:
+                # as conexões não podem ser herdadas pelos processos filhos
+                connections.close_all()
+                with ProcessPoolExecutor(max_workers=workers, mp_context=contexto, initializer=_inicializar_processo) as pool:
+                    futuros = {pool.submit(executar_relatorio_job, pk): pk for pk in jobs}
+                    for futuro in as_completed(futuros):
+                        pk = futuros[futuro]
+                        try:
+                            status = futuro.result()
+                        except Exception as erro:
+                            RelatorioJob.objects.filter(pk=pk).update(
+                                status='erro', erro=f'Erro inesperado: {erro}', concluido_em=timezone.now()
+                            )
+                            status = 'erro'
+                        estilo = self.style.SUCCESS if status == 'concluido' else self.style.ERROR
+                        self.stdout.write(estilo(f'Relatório {pk}: {status}'))
+                continue
+
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
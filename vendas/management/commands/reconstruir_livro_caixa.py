@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from vendas.models import Loja, MovimentoCaixaLoja
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstrói o livro do caixa total (movimentos e checkpoints) a partir dos caixas fechados e lançamentos. '
+        'Com --novas monta apenas o livro das lojas que ainda não têm nenhum (executado no deploy).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loja', type=int, help='ID da loja (padrão: todas)')
+        parser.add_argument('--novas', action='store_true', help='Só as lojas com histórico e sem livro.')
+
+    def handle(self, *args, **options):
+        lojas = Loja.objects.all()
+        if options['loja']:
+            lojas = lojas.filter(pk=options['loja'])
+        for loja in lojas:
+            if options['novas']:
+                total = MovimentoCaixaLoja.inicializar_se_necessario(loja)
+                if not total:
+                    continue
+            else:
+                total = MovimentoCaixaLoja.reconstruir(loja)
+            self.stdout.write(f'{loja}: {total} movimentos, saldo R$ {MovimentoCaixaLoja.saldo_atual(loja)}')
+        self.stdout.write(self.style.SUCCESS('Livro do caixa total reconstruído.'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from vendas.models import ResumoRecebiveisMensal
+
+
+class Command(BaseCommand):
+    help = (
+        'Atualiza o resumo mensal de recebíveis CREDFÁCIL por loja, separando as parcelas que venceram desde o '
+        'último cálculo (executar diariamente após a meia-noite). Com --completo reconstrói a tabela inteira.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true', help='Reconstrói o resumo de todas as lojas e meses.')
+
+    def handle(self, *args, **options):
+        if options['completo']:
+            total = ResumoRecebiveisMensal.reconstruir()
+            self.stdout.write(self.style.SUCCESS(f'Resumo de recebíveis reconstruído: {total} linhas.'))
+        else:
+            total = ResumoRecebiveisMensal.atualizar_referencia()
+            self.stdout.write(self.style.SUCCESS(f'Resumo de recebíveis atualizado: {total} linhas.'))
@@ -0,0 +1,91 @@
+import json
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from estoque.models import EstoqueImei
+from financeiro.models import Repasse
+from vendas.models import AnaliseCreditoCliente, Caixa, Cliente, Parcela, ProdutoVenda, Venda
+
+
+def consultas_principais():
+    """Filtros mais usados pelas listagens e relatórios, com a tabela que precisa usar índice."""
+    hoje = timezone.now()
+    inicio = hoje - timedelta(days=30)
+    return [
+        ('Vendas da loja no período', Venda._meta.db_table,
+         Venda.objects.filter(loja_id=1, is_deleted=False, data_venda__range=(inicio, hoje))),
+        ('Parcelas em aberto do pagamento', Parcela._meta.db_table,
+         Parcela.objects.filter(pagamento_id=1, pago=False, data_vencimento__lt=hoje.date())),
+        ('RENAVAMs disponíveis da loja', EstoqueImei._meta.db_table,
+         EstoqueImei.objects.filter(loja_id=1, vendido=False, cancelado=False, produto_id=1)),
+        ('Busca de RENAVAM no estoque', EstoqueImei._meta.db_table,
+         EstoqueImei.objects.filter(renavam='00000000000')),
+        ('Busca de RENAVAM vendido', ProdutoVenda._meta.db_table,
+         ProdutoVenda.objects.filter(renavam='00000000000')),
+        ('Cliente por CPF', Cliente._meta.db_table,
+         Cliente.objects.filter(cpf='00000000000')),
+        ('Repasses da loja no período', Repasse._meta.db_table,
+         Repasse.objects.filter(loja_id=1, data__range=(inicio, hoje))),
+        ('Análises de crédito por status', AnaliseCreditoCliente._meta.db_table,
+         AnaliseCreditoCliente.objects.filter(loja_id=1, status='EA')),
+        ('Caixa aberto da loja', Caixa._meta.db_table,
+         Caixa.objects.filter(loja_id=1, data_fechamento__isnull=True)),
+    ]
+
+
+def _tabelas_sem_indice_sqlite(plano):
+    # "SCAN tabela" sem "USING INDEX" é leitura da tabela inteira
+    return {
+        m.group(1) for m in re.finditer(r'SCAN (?:TABLE )?(\w+)(?! USING (?:COVERING )?INDEX)(?:\s|$)', plano)
+    }
+
+
+def _tabelas_sem_indice_mysql(plano):
+    tabelas = set()
+
+    def percorrer(no):
+        if isinstance(no, dict):
+            if no.get('access_type') == 'ALL' and 'table_name' in no:
+                tabelas.add(no['table_name'])
+            for valor in no.values():
+                percorrer(valor)
+        elif isinstance(no, list):
+            for valor in no:
+                percorrer(valor)
+
+    percorrer(json.loads(plano))
+    return tabelas
+
+
+class Command(BaseCommand):
+    help = (
+        'Executa EXPLAIN nas consultas principais e falha se alguma ler a tabela inteira '
+        '(rode em uma base com volume real; com tabelas vazias o MySQL pode preferir o full scan).'
+    )
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor == 'sqlite':
+            explicar, sem_indice = (lambda qs: qs.explain()), _tabelas_sem_indice_sqlite
+        elif vendor == 'mysql':
+            explicar, sem_indice = (lambda qs: qs.explain(format='json')), _tabelas_sem_indice_mysql
+        else:
+            raise CommandError(f'Banco {vendor} não suportado por este comando.')
+
+        falhas = []
+        for descricao, tabela, queryset in consultas_principais():
+            plano = explicar(queryset)
+            if tabela in sem_indice(plano):
+                falhas.append(descricao)
+                self.stdout.write(self.style.ERROR(f'FULL SCAN  {descricao} ({tabela})'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'OK         {descricao}'))
+            if options['verbosity'] > 1:
+                self.stdout.write(plano)
+
+        if falhas:
+            raise CommandError(f'{len(falhas)} consulta(s) sem índice: {", ".join(falhas)}')
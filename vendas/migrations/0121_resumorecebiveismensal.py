@@ -0,0 +1,35 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas', '0120_add_porcentagem_desconto_4x_6x_8x'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoRecebiveisMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField()),
+                ('estado', models.CharField(choices=[('pago', 'Pago'), ('vencido', 'Vencido'), ('a_vencer', 'A vencer'), ('informado', 'Pagamento informado'), ('desativado_vencido', 'Desativado vencido'), ('desativado_a_vencer', 'Desativado a vencer')], max_length=20)),
+                ('quantidade', models.PositiveIntegerField(default=0)),
+                ('valor', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('data_referencia', models.DateField(help_text='Dia usado para separar parcelas vencidas e a vencer')),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('loja', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumos_recebiveis', to='vendas.loja')),
+            ],
+            options={
+                'verbose_name': 'Resumo de Recebíveis Mensal',
+                'verbose_name_plural': 'Resumos de Recebíveis Mensais',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resumorecebiveismensal',
+            constraint=models.UniqueConstraint(fields=('loja', 'mes', 'estado'), name='resumo_recebiveis_unico'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas', '0121_resumorecebiveismensal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='caixa',
+            name='entradas_fechamento',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='caixa',
+            name='quantidade_vendas_fechamento',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='caixa',
+            name='saidas_fechamento',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='caixa',
+            name='saldo_dinheiro_fechamento',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='caixa',
+            name='saldo_total_fechamento',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='caixa',
+            name='saldos_congelados_em',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='caixa',
+            name='totais_por_tipo_pagamento',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
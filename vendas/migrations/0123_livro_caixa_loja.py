@@ -0,0 +1,59 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('vendas', '0122_caixa_saldos_congelados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimentoCaixaLoja',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequencia', models.PositiveIntegerField()),
+                ('data', models.DateTimeField(default=django.utils.timezone.now)),
+                ('tipo_movimento', models.CharField(choices=[('1', 'Crédito'), ('2', 'Débito')], max_length=1)),
+                ('origem', models.CharField(choices=[('lancamento', 'Lançamento no caixa total'), ('caixa', 'Fechamento de caixa'), ('ajuste', 'Ajuste / estorno')], max_length=20)),
+                ('descricao', models.CharField(blank=True, max_length=200)),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('saldo', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('caixa', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimentos_loja', to='vendas.caixa')),
+                ('criado_por', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimentos_caixa_criados', to=settings.AUTH_USER_MODEL)),
+                ('lancamento', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimentos', to='vendas.lancamentocaixatotal')),
+                ('loja', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimentos_caixa', to='vendas.loja')),
+            ],
+            options={
+                'verbose_name': 'Movimento do Caixa Total',
+                'verbose_name_plural': 'Movimentos do Caixa Total',
+            },
+        ),
+        migrations.CreateModel(
+            name='CheckpointCaixaLoja',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequencia', models.PositiveIntegerField()),
+                ('data', models.DateTimeField()),
+                ('saldo', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('total_creditos', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('total_debitos', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('loja', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints_caixa', to='vendas.loja')),
+                ('movimento', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoint', to='vendas.movimentocaixaloja')),
+            ],
+            options={
+                'verbose_name': 'Checkpoint do Caixa Total',
+                'verbose_name_plural': 'Checkpoints do Caixa Total',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='movimentocaixaloja',
+            constraint=models.UniqueConstraint(fields=('loja', 'sequencia'), name='movimento_caixa_loja_sequencia_unica'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('vendas', '0123_livro_caixa_loja'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatorioJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('modificado_em', models.DateTimeField(auto_now=True)),
+                ('tipo', models.CharField(choices=[('vendas', 'Relatório de Vendas'), ('solicitacoes', 'Relatório de Solicitações'), ('contas_a_receber', 'Relatório de Contas a Receber'), ('graficos', 'Gráficos')], max_length=30)),
+                ('formato', models.CharField(choices=[('html', 'Página'), ('csv', 'CSV'), ('xlsx', 'Excel')], default='html', max_length=10)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('chave', models.CharField(db_index=True, max_length=64)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluido', 'Concluído'), ('erro', 'Erro')], default='pendente', max_length=20)),
+                ('arquivo', models.FileField(blank=True, null=True, upload_to='relatorios/%Y/%m/')),
+                ('erro', models.TextField(blank=True, null=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+                ('criado_por', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)s_criadas', to=settings.AUTH_USER_MODEL)),
+                ('loja', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)s_loja', to='vendas.loja')),
+                ('modificado_por', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)s_modificadas', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Relatório em Segundo Plano',
+                'verbose_name_plural': 'Relatórios em Segundo Plano',
+                'ordering': ['-criado_em'],
+            },
+        ),
+    ]
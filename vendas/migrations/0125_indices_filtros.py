@@ -0,0 +1,37 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas', '0124_relatoriojob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='analisecreditocliente',
+            index=models.Index(fields=['loja', 'status'], name='analise_loja_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caixa',
+            index=models.Index(fields=['loja', 'data_fechamento'], name='caixa_loja_fechamento_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['cpf'], name='cliente_cpf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parcela',
+            index=models.Index(fields=['pagamento', 'pago', 'data_vencimento'], name='parcela_pag_pago_venc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produtovenda',
+            index=models.Index(fields=['renavam'], name='produtovenda_renavam_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['loja', 'is_deleted', 'data_venda'], name='venda_loja_deleted_data_idx'),
+        ),
+    ]
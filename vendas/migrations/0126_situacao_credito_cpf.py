@@ -0,0 +1,30 @@
+# Generated by Django 4.2.16 on 2026-10-18 15:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas', '0125_indices_filtros'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SituacaoCreditoCpf',
+            fields=[
+                ('cpf', models.CharField(max_length=14, primary_key=True, serialize=False)),
+                ('vendas', models.PositiveIntegerField(default=0)),
+                ('vendas_em_aberto', models.PositiveIntegerField(default=0, help_text='Vendas com parcela CREDFACIL em aberto')),
+                ('menor_parcelas_pagas', models.PositiveIntegerField(blank=True, help_text='Menor número de parcelas pagas entre as vendas', null=True)),
+                ('parcelas_em_atraso', models.PositiveIntegerField(default=0)),
+                ('primeiro_vencimento_em_aberto', models.DateField(blank=True, null=True)),
+                ('data_referencia', models.DateField(help_text='Dia usado para contar as parcelas em atraso')),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Situação de Crédito por CPF',
+                'verbose_name_plural': 'Situações de Crédito por CPF',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 15:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas', '0126_situacao_credito_cpf'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='relatoriojob',
+            name='tentativas',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -1,9 +1,17 @@
 from django.db import models
 from django.utils import timezone
-from datetime import date, timedelta
+from datetime import date, datetime, time, timedelta
 from decimal import Decimal
 from django.utils.functional import cached_property
-from django.db.models import Count, Q, Case, When, Value, IntegerField, BooleanField, F, Min
+from django.db.models import Count, Q, Case, When, Value, IntegerField, BooleanField, F, Min, Sum, Window, OuterRef, Subquery, DecimalField, ExpressionWrapper, FilteredRelation, Exists
+from django.db.models.functions import RowNumber, TruncDate, TruncMonth, Coalesce, NullIf
+from bisect import bisect_left
+from django.db import transaction
+import calendar
+import threading
+import hashlib
+import json
+from django.conf import settings
 from datetime import date, timedelta
 from django.db import models
 from django.utils import timezone
@@ -29,20 +37,110 @@ class Base(models.Model):
         abstract = True
 
 
+def _soma_subquery(queryset, campo, agrupador):
+    """Soma `campo` do queryset correlacionado como subquery, retornando 0 quando vazio."""
+    total = queryset.order_by().values(agrupador).annotate(total=Sum(campo)).values('total')
+    return Coalesce(Subquery(total), Value(Decimal('0')), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+class CaixaQuerySet(models.QuerySet):
+    def with_saldos(self, usar_congelados=True):
+        """
+        Anota os saldos de cada caixa em uma única consulta (subqueries correlacionadas),
+        evitando as consultas por linha das propriedades do modelo.
+        Com usar_congelados=False recalcula também os caixas já congelados.
+        """
+        pagamentos = Pagamento.objects.filter(
+            venda__caixa=OuterRef('pk'),
+            venda__loja=OuterRef('loja'),
+            venda__is_deleted=False,
+        )
+        lancamentos = LancamentoCaixa.objects.filter(caixa=OuterRef('pk'))
+        vendas = Venda.objects.filter(caixa=OuterRef('pk'), loja=OuterRef('loja'), is_deleted=False)
+        congelado = Q(saldos_congelados_em__isnull=False)
+
+        def congelado_ou(campo, expressao):
+            # caixas fechados usam os totais gravados no fechamento
+            if not usar_congelados:
+                return expressao
+            return Case(When(congelado, then=F(campo)), default=expressao, output_field=expressao.output_field)
+
+        return self.annotate(
+            saldo_total_anotado=congelado_ou('saldo_total_fechamento', _soma_subquery(
+                pagamentos.filter(tipo_pagamento__nao_contabilizar=False), 'valor', 'venda__caixa'
+            )),
+            saldo_dinheiro_anotado=congelado_ou('saldo_dinheiro_fechamento', _soma_subquery(
+                pagamentos.filter(tipo_pagamento__caixa=True), 'valor', 'venda__caixa'
+            )),
+            entradas_anotadas=congelado_ou(
+                'entradas_fechamento', _soma_subquery(lancamentos.filter(tipo_lancamento='1'), 'valor', 'caixa')
+            ),
+            saidas_anotadas=congelado_ou(
+                'saidas_fechamento', _soma_subquery(lancamentos.filter(tipo_lancamento='2'), 'valor', 'caixa')
+            ),
+            quantidade_vendas_anotada=congelado_ou('quantidade_vendas_fechamento', Coalesce(
+                Subquery(vendas.order_by().values('caixa').annotate(qtd=Count('id')).values('qtd')),
+                Value(0),
+            )),
+        )
+
+    def saldo_acumulado(self):
+        """
+        Soma vendas em dinheiro, entradas e saídas dos caixas: os fechados pelos totais
+        congelados e os ainda abertos calculados na hora.
+        """
+        campos = {
+            'vendas': ('saldo_dinheiro_fechamento', 'saldo_dinheiro_anotado'),
+            'entradas': ('entradas_fechamento', 'entradas_anotadas'),
+            'saidas': ('saidas_fechamento', 'saidas_anotadas'),
+        }
+        congelados = self.filter(saldos_congelados_em__isnull=False).aggregate(
+            **{nome: Sum(congelado) for nome, (congelado, _) in campos.items()}
+        )
+        abertos = self.filter(saldos_congelados_em__isnull=True).with_saldos().aggregate(
+            **{nome: Sum(anotado) for nome, (_, anotado) in campos.items()}
+        )
+        return {nome: (congelados[nome] or 0) + (abertos[nome] or 0) for nome in campos}
+
+
 class Caixa(Base):
     data_abertura = models.DateField(default=timezone.now)
     data_fechamento = models.DateField(null=True, blank=True)
-    
+    # Totais gravados no fechamento do caixa (ver congelar_saldos)
+    saldo_total_fechamento = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, editable=False)
+    saldo_dinheiro_fechamento = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, editable=False)
+    entradas_fechamento = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, editable=False)
+    saidas_fechamento = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, editable=False)
+    quantidade_vendas_fechamento = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    totais_por_tipo_pagamento = models.JSONField(default=dict, blank=True, editable=False)
+    saldos_congelados_em = models.DateTimeField(null=True, blank=True, editable=False)
+    objects = CaixaQuerySet.as_manager()
+
+    # As propriedades abaixo usam os valores de CaixaQuerySet.with_saldos() quando presentes
+    # e, nos caixas fechados, os totais congelados
+
     @property
     def saldo_total(self):
+        if hasattr(self, 'saldo_total_anotado'):
+            return self.saldo_total_anotado
+        if self.saldos_congelados:
+            return self.saldo_total_fechamento
         return sum(venda.pagamentos_valor_total for venda in self.vendas.filter(is_deleted=False).filter(loja=self.loja).filter(caixa=self))
     
     def saldo_caixa(self):
+        if hasattr(self, 'saldo_dinheiro_anotado'):
+            return self.saldo_dinheiro_anotado
+        if self.saldos_congelados:
+            return self.saldo_dinheiro_fechamento
         return sum(venda.valor_caixa for venda in self.vendas.filter(is_deleted=False).filter(loja=self.loja).filter(caixa=self))
     
     @property
     def saldo_total_dinheiro(self):
-        total = sum(venda.pagamentos_valor_total_dinheiro for venda in self.vendas.filter(is_deleted=False, pagamentos__tipo_pagamento__caixa=True).filter(loja=self.loja).filter(caixa=self))
+        if hasattr(self, 'saldo_dinheiro_anotado'):
+            return self.saldo_dinheiro_anotado
+        if self.saldos_congelados:
+            return self.saldo_dinheiro_fechamento
+        total = sum(venda.pagamentos_valor_total_dinheiro for venda in self.vendas.filter(is_deleted=False, pagamentos__tipo_pagamento__caixa=True).filter(loja=self.loja).filter(caixa=self).distinct())
         return total if total else 0
     
     def saldo_final(self):
@@ -50,16 +148,73 @@ class Caixa(Base):
 
     @property
     def saidas(self):
+        if hasattr(self, 'saidas_anotadas'):
+            return self.saidas_anotadas
+        if self.saldos_congelados:
+            return self.saidas_fechamento
         return sum(lancamento.valor for lancamento in self.lancamentos_caixa.filter(tipo_lancamento='2'))
     
     @property
     def entradas(self):
+        if hasattr(self, 'entradas_anotadas'):
+            return self.entradas_anotadas
+        if self.saldos_congelados:
+            return self.entradas_fechamento
         return sum(lancamento.valor for lancamento in self.lancamentos_caixa.filter(tipo_lancamento='1'))
     
     @property
     def quantidade_vendas(self):
+        if hasattr(self, 'quantidade_vendas_anotada'):
+            return self.quantidade_vendas_anotada
+        if self.saldos_congelados:
+            return self.quantidade_vendas_fechamento
         return self.vendas.filter(is_deleted=False).filter(loja=self.loja).filter(caixa=self).count()
     
+    @property
+    def saldos_congelados(self):
+        return self.saldos_congelados_em is not None
+
+    def calcular_totais_por_tipo_pagamento(self):
+        """Vendas em dinheiro contabilizáveis do caixa, agrupadas por tipo de pagamento."""
+        totais = Pagamento.objects.filter(
+            venda__caixa=self,
+            venda__is_deleted=False,
+            tipo_pagamento__caixa=True,
+            tipo_pagamento__nao_contabilizar=False,
+        ).values('tipo_pagamento__nome').annotate(total=Sum('valor')).order_by('tipo_pagamento__nome')
+        return {item['tipo_pagamento__nome']: item['total'] for item in totais}
+
+    def valores_por_tipo_pagamento(self):
+        if self.saldos_congelados:
+            return {nome: Decimal(valor) for nome, valor in self.totais_por_tipo_pagamento.items()}
+        return self.calcular_totais_por_tipo_pagamento()
+
+    def congelar_saldos(self, user=None, registrar_movimento=True):
+        """
+        Grava os totais do caixa fechado e lança o saldo final no livro do caixa total.
+        Também usado pela ação de recálculo do admin para corrigir um caixa já congelado.
+        """
+        caixa = Caixa.objects.filter(pk=self.pk).with_saldos(usar_congelados=False).get()
+        self.saldo_total_fechamento = caixa.saldo_total_anotado
+        self.saldo_dinheiro_fechamento = caixa.saldo_dinheiro_anotado
+        self.entradas_fechamento = caixa.entradas_anotadas
+        self.saidas_fechamento = caixa.saidas_anotadas
+        self.quantidade_vendas_fechamento = caixa.quantidade_vendas_anotada
+        self.totais_por_tipo_pagamento = {
+            nome: str(valor) for nome, valor in self.calcular_totais_por_tipo_pagamento().items()
+        }
+        self.saldos_congelados_em = timezone.now()
+        # o movimento é lançado logo abaixo (ou não, na reconstrução do livro), não pelo sinal de post_save
+        self._sincronizar_livro = False
+        try:
+            self.save(user=user)
+        finally:
+            del self._sincronizar_livro
+        if registrar_movimento and self.data_fechamento:
+            MovimentoCaixaLoja.sincronizar(
+                self.loja_id, self.saldo_final(), 'caixa', f'Fechamento do {self}', user=user, caixa=self
+            )
+
     @property
     def caixa_fechado(self):
         if self.data_fechamento:
@@ -77,6 +232,9 @@ class Caixa(Base):
     class Meta:
         verbose_name_plural = 'Caixas'
         ordering = ['-data_abertura']
+        indexes = [
+            models.Index(fields=['loja', 'data_fechamento'], name='caixa_loja_fechamento_idx'),
+        ]
 
 class LancamentoCaixaTotal(Base):
     tipo_lancamento_opcoes = (
@@ -112,6 +270,194 @@ class LancamentoCaixa(Base):
         verbose_name_plural = 'Lancamentos Caixa'
 
 
+class MovimentoCaixaLoja(models.Model):
+    """
+    Livro do caixa total da loja: somente inclusão, uma linha por movimento com o saldo
+    acumulado após ele. Alterações e exclusões de lançamentos geram estornos/ajustes.
+    """
+    tipo_movimento_opcoes = (
+        ('1', 'Crédito'),
+        ('2', 'Débito'),
+    )
+    origem_opcoes = (
+        ('lancamento', 'Lançamento no caixa total'),
+        ('caixa', 'Fechamento de caixa'),
+        ('ajuste', 'Ajuste / estorno'),
+    )
+    INTERVALO_CHECKPOINT = 100
+
+    loja = models.ForeignKey('vendas.Loja', on_delete=models.CASCADE, related_name='movimentos_caixa')
+    sequencia = models.PositiveIntegerField()
+    data = models.DateTimeField(default=timezone.now)
+    tipo_movimento = models.CharField(max_length=1, choices=tipo_movimento_opcoes)
+    origem = models.CharField(max_length=20, choices=origem_opcoes)
+    descricao = models.CharField(max_length=200, blank=True)
+    valor = models.DecimalField(max_digits=12, decimal_places=2)
+    saldo = models.DecimalField(max_digits=14, decimal_places=2)
+    lancamento = models.ForeignKey('vendas.LancamentoCaixaTotal', on_delete=models.SET_NULL, null=True, blank=True, related_name='movimentos')
+    caixa = models.ForeignKey('vendas.Caixa', on_delete=models.SET_NULL, null=True, blank=True, related_name='movimentos_loja')
+    criado_por = models.ForeignKey('accounts.User', on_delete=models.SET_NULL, null=True, blank=True, related_name='movimentos_caixa_criados', editable=False)
+
+    def __str__(self):
+        return f"{self.loja} #{self.sequencia} {self.get_tipo_movimento_display()} R$ {self.valor}"
+
+    @property
+    def valor_assinado(self):
+        return self.valor if self.tipo_movimento == '1' else -self.valor
+
+    @classmethod
+    def registrar(cls, loja_id, valor_assinado, origem, descricao='', lancamento=None, caixa=None, user=None, data=None):
+        """Acrescenta um movimento ao livro da loja, atualizando saldo e checkpoint."""
+        if not loja_id or not valor_assinado:
+            return None
+        with transaction.atomic():
+            # trava a loja para que o saldo acumulado seja sequencial
+            list(Loja.objects.select_for_update().filter(pk=loja_id).values_list('pk', flat=True))
+            ultimo = cls.objects.filter(loja_id=loja_id).order_by('-sequencia').first()
+            saldo_anterior = ultimo.saldo if ultimo else Decimal('0')
+            movimento = cls.objects.create(
+                loja_id=loja_id,
+                sequencia=(ultimo.sequencia + 1) if ultimo else 1,
+                data=data or timezone.now(),
+                tipo_movimento='1' if valor_assinado > 0 else '2',
+                origem=origem,
+                descricao=descricao[:200],
+                valor=abs(valor_assinado),
+                saldo=saldo_anterior + valor_assinado,
+                lancamento=lancamento,
+                caixa=caixa,
+                criado_por=user,
+            )
+            if movimento.sequencia % cls.INTERVALO_CHECKPOINT == 0:
+                CheckpointCaixaLoja.criar(movimento)
+        return movimento
+
+    @classmethod
+    def sincronizar(cls, loja_id, valor_assinado_atual, origem, descricao='', user=None, **referencia):
+        """
+        Garante que os movimentos ligados a um lançamento ou caixa somem `valor_assinado_atual`,
+        registrando apenas a diferença.
+        """
+        cls.inicializar_se_necessario(loja_id)
+        movimentos = cls.objects.filter(**referencia)
+        ja_registrado = movimentos.aggregate(total=Sum(
+            Case(When(tipo_movimento='1', then=F('valor')), default=-F('valor'))
+        ))['total'] or Decimal('0')
+        diferenca = Decimal(valor_assinado_atual) - ja_registrado
+        if ja_registrado and diferenca:
+            origem = 'ajuste'
+        return cls.registrar(loja_id, diferenca, origem, descricao, user=user, **referencia)
+
+    @classmethod
+    def inicializar_se_necessario(cls, loja):
+        """
+        Monta o livro de lojas que já tinham histórico antes dele existir (comando
+        reconstruir_livro_caixa --novas). Retorna o número de movimentos gravados.
+        """
+        if not loja or cls.objects.filter(loja=loja).exists():
+            return 0
+        if Caixa.objects.filter(loja=loja, data_fechamento__isnull=False).exists() or \
+                LancamentoCaixaTotal.objects.filter(loja=loja).exists():
+            return cls.reconstruir(loja)
+        return 0
+
+    @classmethod
+    def saldo_atual(cls, loja):
+        ultimo = cls.objects.filter(loja=loja).order_by('-sequencia').values_list('saldo', flat=True).first()
+        return ultimo or Decimal('0')
+
+    @classmethod
+    def saldo_em(cls, loja, data):
+        ultimo = cls.objects.filter(loja=loja, data__lte=data).order_by('-sequencia').values_list('saldo', flat=True).first()
+        return ultimo or Decimal('0')
+
+    @classmethod
+    def totais_ate(cls, loja, data=None):
+        """Créditos e débitos acumulados até `data`: último checkpoint + movimentos posteriores."""
+        checkpoints = CheckpointCaixaLoja.objects.filter(loja=loja)
+        movimentos = cls.objects.filter(loja=loja)
+        if data:
+            checkpoints = checkpoints.filter(data__lte=data)
+            movimentos = movimentos.filter(data__lte=data)
+        checkpoint = checkpoints.order_by('-sequencia').first()
+        creditos = checkpoint.total_creditos if checkpoint else Decimal('0')
+        debitos = checkpoint.total_debitos if checkpoint else Decimal('0')
+        if checkpoint:
+            movimentos = movimentos.filter(sequencia__gt=checkpoint.sequencia)
+        cauda = movimentos.aggregate(
+            creditos=Sum('valor', filter=Q(tipo_movimento='1')),
+            debitos=Sum('valor', filter=Q(tipo_movimento='2')),
+        )
+        return {
+            'creditos': creditos + (cauda['creditos'] or 0),
+            'debitos': debitos + (cauda['debitos'] or 0),
+        }
+
+    @classmethod
+    def totais_periodo(cls, loja, inicio, fim):
+        ate_fim = cls.totais_ate(loja, fim)
+        antes = cls.totais_ate(loja, inicio - timedelta(microseconds=1))
+        return {chave: ate_fim[chave] - antes[chave] for chave in ate_fim}
+
+    @classmethod
+    def reconstruir(cls, loja):
+        """Refaz o livro da loja a partir dos caixas fechados e dos lançamentos do caixa total."""
+        eventos = []
+        for caixa in Caixa.objects.filter(loja=loja, data_fechamento__isnull=False):
+            if not caixa.saldos_congelados:
+                caixa.congelar_saldos(registrar_movimento=False)
+            fechamento = timezone.make_aware(datetime.combine(caixa.data_fechamento, time.max))
+            eventos.append((fechamento, caixa.saldo_final(), 'caixa', f'Fechamento do {caixa}', {'caixa': caixa}))
+        for lancamento in LancamentoCaixaTotal.objects.filter(loja=loja):
+            valor = lancamento.valor if lancamento.tipo_lancamento == '1' else -lancamento.valor
+            eventos.append((lancamento.criado_em, valor, 'lancamento', lancamento.motivo, {'lancamento': lancamento}))
+        eventos.sort(key=lambda evento: evento[0])
+        with transaction.atomic():
+            CheckpointCaixaLoja.objects.filter(loja=loja).delete()
+            cls.objects.filter(loja=loja).delete()
+            for data, valor, origem, descricao, referencia in eventos:
+                cls.registrar(getattr(loja, 'pk', loja), valor, origem, descricao, data=data, **referencia)
+        return len(eventos)
+
+    class Meta:
+        verbose_name = 'Movimento do Caixa Total'
+        verbose_name_plural = 'Movimentos do Caixa Total'
+        constraints = [
+            models.UniqueConstraint(fields=['loja', 'sequencia'], name='movimento_caixa_loja_sequencia_unica'),
+        ]
+
+
+class CheckpointCaixaLoja(models.Model):
+    """Totais acumulados do livro da loja a cada MovimentoCaixaLoja.INTERVALO_CHECKPOINT movimentos."""
+    loja = models.ForeignKey('vendas.Loja', on_delete=models.CASCADE, related_name='checkpoints_caixa')
+    movimento = models.OneToOneField('vendas.MovimentoCaixaLoja', on_delete=models.CASCADE, related_name='checkpoint')
+    sequencia = models.PositiveIntegerField()
+    data = models.DateTimeField()
+    saldo = models.DecimalField(max_digits=14, decimal_places=2)
+    total_creditos = models.DecimalField(max_digits=14, decimal_places=2)
+    total_debitos = models.DecimalField(max_digits=14, decimal_places=2)
+
+    @classmethod
+    def criar(cls, movimento):
+        totais = MovimentoCaixaLoja.totais_ate(movimento.loja_id)
+        return cls.objects.create(
+            loja_id=movimento.loja_id,
+            movimento=movimento,
+            sequencia=movimento.sequencia,
+            data=movimento.data,
+            saldo=movimento.saldo,
+            total_creditos=totais['creditos'],
+            total_debitos=totais['debitos'],
+        )
+
+    def __str__(self):
+        return f"{self.loja} até #{self.sequencia}: R$ {self.saldo}"
+
+    class Meta:
+        verbose_name = 'Checkpoint do Caixa Total'
+        verbose_name_plural = 'Checkpoints do Caixa Total'
+
+
 from django.db.models import Count, Case, When, Value, IntegerField
 from datetime import date
 
@@ -148,6 +494,46 @@ class LojaQuerySet(models.QuerySet):
             )
         ).filter(repasses_pendentes=0)  # Apenas lojas sem repasses pendentes
 
+    def repasses_status(self, meses_atras=0, limite_meses=6):
+        """
+        Versão em lote de Loja.get_repasses_status para todas as lojas do queryset:
+        uma consulta agrupa as vendas por loja e dia, outra busca os repasses dos ciclos.
+        Retorna {loja_id: (resultados, atrasados)} com a mesma estrutura do método do modelo.
+        Só faz leitura: o status 'parcial' dos repasses é mantido por RepasseQuerySet.reconciliar().
+        """
+        from financeiro.models import Repasse
+
+        hoje = date.today()
+        lojas_ids = list(self.values_list('pk', flat=True))
+        ciclos = Loja.ciclos_repasse(meses_atras, limite_meses, hoje)
+        if not lojas_ids or not ciclos:
+            return {loja_id: ([], 0) for loja_id in lojas_ids}
+
+        vendas_por_ciclo = Venda.objects.filter(loja_id__in=lojas_ids).repasse_por_ciclo(ciclos)
+
+        ciclos_pagos = set(Repasse.objects.filter(
+            loja_id__in=lojas_ids, data__date__in=[dt_atual for dt_atual, _, _ in ciclos],
+        ).annotate(dia=TruncDate('data')).values_list('loja_id', 'dia'))
+
+        resultado = {}
+        for loja_id in lojas_ids:
+            resultados = []
+            for dt_atual, inicio, fim in ciclos:
+                qtd, valor = vendas_por_ciclo.get((loja_id, dt_atual), (0, Decimal('0.00')))
+                if qtd == 0:
+                    continue
+                resultados.append({
+                    'data': dt_atual,
+                    'inicio_periodo': inicio,
+                    'fim_periodo': fim,
+                    'qtd_vendas': qtd,
+                    'valor_total_repasse': valor,
+                    'feito': (loja_id, dt_atual) in ciclos_pagos,
+                })
+            atrasados = sum(1 for rep in resultados if not rep['feito'] and rep['data'] < hoje)
+            resultado[loja_id] = (resultados, atrasados)
+        return resultado
+
 
 class Loja(Base):
     nome = models.CharField(max_length=100)
@@ -178,16 +564,18 @@ class Loja(Base):
 
     REPASSES_DIAS = (5, 15)
 
-    def get_repasses_status(self, meses_atras=0, limite_meses=6):
-        hoje = date.today()
-        resultados = []
+    @classmethod
+    def ciclos_repasse(cls, meses_atras=0, limite_meses=6, hoje=None):
+        """
+        Ciclos de repasse (data do repasse, início, fim) em ordem cronológica. Cada ciclo
+        cobre as vendas após o repasse anterior até o dia do repasse, inclusive.
+        """
+        hoje = hoje or date.today()
+        ciclos = []
 
         # Limita quantos meses olhar para trás
         meses_atras = min(meses_atras, limite_meses)
 
-        # Queryset base de Vendas
-        vendas_qs = self.venda_loja.all()
-
         for delta in range(meses_atras, -1, -1):
             ano = hoje.year
             mes = hoje.month - delta
@@ -195,111 +583,53 @@ class Loja(Base):
                 mes += 12
                 ano -= 1
 
-            for idx, dia in enumerate(self.REPASSES_DIAS):
+            for dia in cls.REPASSES_DIAS:
                 # Data do repasse atual
                 try:
                     dt_atual = date(ano, mes, dia)
                 except ValueError:
                     continue
+                ciclos.append((dt_atual, *cls.ciclo_do_repasse(dt_atual)))
 
-                # Data do repasse anterior
-                if idx == 0:
-                    prev_mes, prev_ano = (mes-1, ano)
-                    if prev_mes == 0:
-                        prev_mes, prev_ano = 12, ano-1
-                    dia_prev = self.REPASSES_DIAS[-1]
-                    dt_prev = date(prev_ano, prev_mes, dia_prev)
-                else:
-                    dt_prev = date(ano, mes, self.REPASSES_DIAS[idx-1])
-
-                # Intervalo de vendas (exclusive dt_prev, inclusive dt_atual)
-                inicio = dt_prev + timedelta(days=1)
-                fim    = dt_atual
-
-                vendas_periodo = vendas_qs.filter(
-                    data_venda__date__gte=inicio,
-                    data_venda__date__lte=fim,
-                    is_deleted=False
-                )
+        return ciclos
 
-                qtd = vendas_periodo.count()
-                if qtd == 0:
-                    continue
-
-                # Soma de valor_repasse_logista de cada venda
-                valor = Decimal('0.00')
-                for venda in vendas_periodo:
-                    valor_repasse = venda.repasse_logista
-                    valor += valor_repasse
-
-                feito = self.repasse.filter(data__date=dt_atual).exists()
-
-                # Verifica se o valor do repasse é menor que o calculado
-                if feito:
-                    repasses = self.repasse.filter(data__date=dt_atual)
-                    for repasse in repasses:
-                        if repasse.valor < valor:
-                            # Se o valor do repasse for menor que o calculado, marca como parcial
-                            repasse.status = 'parcial'
-                            repasse.save()
+    @classmethod
+    def ciclo_do_repasse(cls, data_repasse):
+        """
+        Intervalo de vendas (início, fim) coberto pelo repasse do dia `data_repasse`:
+        do dia seguinte ao repasse anterior até o próprio dia. None se não for dia de repasse.
+        """
+        if data_repasse.day not in cls.REPASSES_DIAS:
+            return None
+        idx = cls.REPASSES_DIAS.index(data_repasse.day)
+        if idx == 0:
+            mes_anterior = data_repasse.replace(day=1) - timedelta(days=1)
+            dt_prev = mes_anterior.replace(day=cls.REPASSES_DIAS[-1])
+        else:
+            dt_prev = data_repasse.replace(day=cls.REPASSES_DIAS[idx - 1])
+        return dt_prev + timedelta(days=1), data_repasse
 
-                resultados.append({
-                    'data': dt_atual,
-                    'inicio_periodo': inicio,
-                    'fim_periodo': fim,
-                    'qtd_vendas': qtd,
-                    'valor_total_repasse': valor,
-                    'feito': feito,
-                })
+    @classmethod
+    def data_repasse_da_venda(cls, dia):
+        """Dia do repasse cujo ciclo inclui as vendas feitas em `dia`."""
+        for dia_repasse in cls.REPASSES_DIAS:
+            if dia.day <= dia_repasse:
+                return dia.replace(day=dia_repasse)
+        proximo_mes = dia.replace(day=28) + timedelta(days=4)
+        return proximo_mes.replace(day=cls.REPASSES_DIAS[0])
 
-        atrasados = sum(1 for rep in resultados if not rep['feito'] and rep['data'] < hoje)
-        return resultados, atrasados
+    def get_repasses_status(self, meses_atras=0, limite_meses=6):
+        """Repasses por ciclo desta loja; para várias lojas use Loja.objects.repasses_status()."""
+        return Loja.objects.filter(pk=self.pk).repasses_status(meses_atras, limite_meses)[self.pk]
 
-        
     def calcular_valor_repasse(self, data_inicio, data_fim):
-        if data_inicio and data_fim:
-            vendas = self.venda_loja.filter(data_venda__date__gte=data_inicio, data_venda__date__lte=data_fim, is_deleted=False)
-            valor_repasse = sum(
-                venda.repasse_logista if venda.repasse_logista else sum(
-                    produto.produto.valor_repasse_logista * produto.quantidade
-                    for produto in ProdutoVenda.objects.filter(venda=venda)
-                )
-                for venda in vendas
-            )
-            return valor_repasse
-
-        elif data_inicio:
-            vendas = self.venda_loja.filter(data_venda__date__gte=data_inicio, is_deleted=False)
-            valor_repasse = sum(
-                venda.repasse_logista if venda.repasse_logista else sum(
-                    produto.produto.valor_repasse_logista * produto.quantidade
-                    for produto in ProdutoVenda.objects.filter(venda=venda)
-                )
-                for venda in vendas
-            )
-            return valor_repasse
-
-        elif data_fim:
-            vendas = self.venda_loja.filter(data_venda__date__lte=data_fim, is_deleted=False)
-            valor_repasse = sum(
-                venda.repasse_logista if venda.repasse_logista else sum(
-                    produto.produto.valor_repasse_logista * produto.quantidade
-                    for produto in ProdutoVenda.objects.filter(venda=venda)
-                )
-                for venda in vendas
-            )
-            return valor_repasse
-
-        else:
-            vendas = self.venda_loja.filter(is_deleted=False)
-            valor_repasse = sum(
-                venda.repasse_logista if venda.repasse_logista else sum(
-                    produto.produto.valor_repasse_logista * produto.quantidade
-                    for produto in ProdutoVenda.objects.filter(venda=venda)
-                )
-                for venda in vendas
-            )
-            return valor_repasse
+        """Valor a repassar ao lojista pelas vendas ativas entre as datas (qualquer uma pode ser None)."""
+        vendas = self.venda_loja.filter(is_deleted=False)
+        if data_inicio:
+            vendas = vendas.filter(data_venda__date__gte=data_inicio)
+        if data_fim:
+            vendas = vendas.filter(data_venda__date__lte=data_fim)
+        return vendas.valor_repasse()
 
     def __str__(self):
         return self.nome
@@ -334,6 +664,9 @@ class Cliente(Base):
     
     class Meta:
         verbose_name_plural = 'Clientes'
+        indexes = [
+            models.Index(fields=['cpf'], name='cliente_cpf_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         self.cpf = re.sub(r'\D', '', self.cpf or '')  # limpa antes de salvar
@@ -341,6 +674,91 @@ class Cliente(Base):
         
 
 
+class VendaQuerySet(models.QuerySet):
+    def valor_repasse(self):
+        """
+        Soma o repasse ao lojista das vendas em uma única consulta. Vendas sem repasse_logista
+        (zero) usam o repasse cadastrado nos produtos vendidos, multiplicado pela quantidade.
+        """
+        repasse_itens = _soma_subquery(
+            ProdutoVenda.objects.filter(venda=OuterRef('pk')),
+            ExpressionWrapper(
+                F('produto__valor_repasse_logista') * F('quantidade'),
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            ),
+            'venda',
+        )
+        total = self.aggregate(
+            total=Sum(Coalesce(NullIf('repasse_logista', Value(Decimal('0'))), repasse_itens))
+        )['total']
+        return total or Decimal('0.00')
+
+    def repasse_por_ciclo(self, ciclos):
+        """
+        Soma o repasse ao lojista das vendas ativas em cada ciclo (data do repasse, início, fim).
+        Uma consulta agrupa por loja e dia; os dias são distribuídos nos ciclos em Python.
+        Retorna {(loja_id, data do repasse): (qtd_vendas, valor)}.
+        """
+        ciclos = sorted(ciclos)
+        if not ciclos:
+            return {}
+        fins = [fim for _, _, fim in ciclos]
+        vendas_por_dia = self.filter(
+            is_deleted=False,
+            data_venda__date__gte=min(inicio for _, inicio, _ in ciclos),
+            data_venda__date__lte=fins[-1],
+        ).annotate(dia=TruncDate('data_venda')).order_by().values('loja_id', 'dia').annotate(
+            qtd=Count('id'), valor=Sum('repasse_logista'),
+        )
+
+        totais = {}
+        for linha in vendas_por_dia:
+            dt_atual, inicio, _ = ciclos[bisect_left(fins, linha['dia'])]
+            if linha['dia'] < inicio:
+                # dia entre ciclos não consecutivos
+                continue
+            qtd, valor = totais.get((linha['loja_id'], dt_atual), (0, Decimal('0.00')))
+            totais[(linha['loja_id'], dt_atual)] = (qtd + linha['qtd'], valor + (linha['valor'] or 0))
+        return totais
+
+    def com_situacao_pagamentos(self):
+        """Anota o total contabilizado dos pagamentos e se a venda tem pagamento bloqueado."""
+        pagamentos = Pagamento.objects.filter(venda=OuterRef('pk'))
+        return self.annotate(
+            valor_contabilizado_anotado=_soma_subquery(
+                pagamentos.filter(tipo_pagamento__nao_contabilizar=False), 'valor', 'venda'
+            ),
+            pagamento_bloqueado_anotado=Exists(pagamentos.filter(bloqueado=True)),
+        )
+
+    def com_totais(self):
+        """
+        Anota entrada, valor total, juros e quantidade de parcelas de cada venda
+        (subqueries correlacionadas), no lugar das cached_property calculadas por venda.
+        """
+        pagamentos = Pagamento.objects.filter(venda=OuterRef('pk'))
+        itens = ProdutoVenda.objects.filter(venda=OuterRef('pk')).order_by().values('venda').annotate(
+            total=Sum('quantidade')
+        ).values('total')
+        parcelas = pagamentos.filter(tipo_pagamento__parcelas=True).order_by().values('venda').annotate(
+            total=Sum('parcelas')
+        ).values('total')
+        return self.annotate(
+            valor_total_anotado=_soma_subquery(pagamentos, 'valor', 'venda'),
+            valor_entrada_anotado=_soma_subquery(
+                pagamentos.filter(tipo_pagamento__nome__iexact='ENTRADA'), 'valor', 'venda'
+            ),
+            quantidade_itens_anotado=Coalesce(Subquery(itens), Value(0)),
+            qtd_parcelas_anotado=Coalesce(Subquery(parcelas), Value(0)),
+        ).annotate(
+            juros_anotado=ExpressionWrapper(
+                (F('valor_total_anotado') - (F('valor_entrada_anotado') + F('repasse_logista')))
+                * F('quantidade_itens_anotado'),
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            ),
+        )
+
+
 class Venda(Base):
     data_venda = models.DateTimeField(auto_now_add=True)
     cliente = models.ForeignKey('vendas.cliente', on_delete=models.CASCADE, related_name='vendas')
@@ -351,8 +769,15 @@ class Venda(Base):
     repasse_logista = models.DecimalField(max_digits=10, decimal_places=2)
     is_deleted = models.BooleanField(default=False)
     is_trocado = models.BooleanField(default=False)
+
+    # valores anteriores guardados no pre_save (vendas/signals.py) para os recálculos derivados
+    CAMPOS_MONITORADOS = ('loja_id', 'data_venda', 'repasse_logista', 'is_deleted')
+
+    objects = VendaQuerySet.as_manager()
     
     def qtd_total_parcelas(self):
+        if hasattr(self, 'qtd_parcelas_anotado'):
+            return self.qtd_parcelas_anotado
         return sum(pagamento.parcelas for pagamento in self.pagamentos.filter(tipo_pagamento__parcelas=True))
     
     @cached_property
@@ -361,6 +786,8 @@ class Venda(Base):
 
     @property
     def pagamentos_valor_total(self):
+        if hasattr(self, 'valor_contabilizado_anotado'):
+            return self.valor_contabilizado_anotado
         return sum(pagamento.valor for pagamento in self.pagamentos.all().filter(tipo_pagamento__nao_contabilizar=False))
     
     @property
@@ -371,6 +798,8 @@ class Venda(Base):
         return sum(produto.calcular_valor_total() for produto in self.itens_venda.all())
 
     def possui_pagamento_bloqueado(self):
+        if hasattr(self, 'pagamento_bloqueado_anotado'):
+            return self.pagamento_bloqueado_anotado
         return self.pagamentos.filter(bloqueado=True).exists()
 
     @cached_property
@@ -379,40 +808,35 @@ class Venda(Base):
     
     @cached_property
     def valor_entrada_cliente(self):
+        if hasattr(self, 'valor_entrada_anotado'):
+            return self.valor_entrada_anotado
         # Busca o valor de pagamentos do tipo ENTRADA
         entrada_pagamento = self.pagamentos.filter(tipo_pagamento__nome__iexact='ENTRADA').aggregate(total=models.Sum('valor'))['total']
         return entrada_pagamento or 0
 
     @cached_property
     def lucro_venda(self):
-        # print("Calculando lucro da venda...")
-        from estoque.models import ProdutoEntrada
-        total_lucro = 0
-        for produto in self.itens_venda.all():
-            # print(f"Produto: {produto.produto.nome}, Quantidade: {produto.quantidade}")
-            custo_unitario = ProdutoEntrada.objects.filter(produto=produto.produto).last().custo_unitario
-            # print(f"Custo unitário: {custo_unitario}")
-            total_lucro += (produto.produto.valor_repasse_logista + produto.produto.entrada_cliente - custo_unitario) * produto.quantidade
-            # print(f'Calculo: {produto.produto.valor_repasse_logista} + {produto.produto.entrada_cliente} - {custo_unitario} * {produto.quantidade}')
-            # print(f"Lucro parcial: {total_lucro}")
-        # print(f"Total lucro: {total_lucro}")
-        return total_lucro
+        """Lucro dos itens sobre a base de custo atual (CustoProduto), em uma consulta."""
+        return self.itens_venda.com_custo().aggregate(
+            total=Coalesce(Sum('lucro_anotado'), Value(Decimal('0')))
+        )['total']
     
     @cached_property
     def valor_total_venda(self):
+        if hasattr(self, 'valor_total_anotado'):
+            return self.valor_total_anotado
         return sum(pagamento.valor for pagamento in self.pagamentos.all())
 
     @cached_property
     def custo_total(self):
-        from estoque.models import ProdutoEntrada
-        total_custo = Decimal('0.00')
-        for produto in self.itens_venda.all():
-            custo_unitario = ProdutoEntrada.objects.filter(produto=produto.produto).last().custo_unitario
-            total_custo += custo_unitario * produto.quantidade
-        return total_custo
+        return self.itens_venda.com_custo().aggregate(
+            total=Coalesce(Sum('custo_anotado'), Value(Decimal('0')))
+        )['total']
     
     @cached_property
     def juros(self):
+        if hasattr(self, 'juros_anotado'):
+            return self.juros_anotado
         entrada_pagamento = self.pagamentos.filter(tipo_pagamento__nome__iexact='ENTRADA').aggregate(total=models.Sum('valor'))['total'] or 0
         return sum((self.valor_total_venda - (entrada_pagamento + self.repasse_logista)) * produto.quantidade for produto in self.itens_venda.all())
 
@@ -434,6 +858,9 @@ class Venda(Base):
             ('can_view_your_dashboard', 'Pode ver seu dashboard'),
             ('can_view_all_dashboard', 'Pode ver todos os dashboards'),
         )
+        indexes = [
+            models.Index(fields=['loja', 'is_deleted', 'data_venda'], name='venda_loja_deleted_data_idx'),
+        ]
 
 
 class AnaliseCreditoCliente(Base):
@@ -511,6 +938,9 @@ class AnaliseCreditoCliente(Base):
             ('can_cancel_credit_analysis', 'Pode cancelar análise de crédito'),
             ('view_all_analise_credito', 'Pode ver todos as análise de crédito')
         )
+        indexes = [
+            models.Index(fields=['loja', 'status'], name='analise_loja_status_idx'),
+        ]
     
     
 
@@ -567,6 +997,27 @@ class ComprovantesCliente(Base):
     def __str__(self):
         return f"Comprovantes para {self.cliente.nome if self.cliente else 'Cliente'}"
 
+class ProdutoVendaQuerySet(models.QuerySet):
+    def com_custo(self):
+        """
+        Anota custo unitário, custo e lucro de cada item juntando a base de custo consolidada
+        do produto (CustoProduto sem loja), no lugar da busca da última entrada por item.
+        """
+        valor = DecimalField(max_digits=14, decimal_places=2)
+        return self.annotate(
+            custo_base=FilteredRelation('produto__custos', condition=Q(produto__custos__loja__isnull=True)),
+        ).annotate(
+            custo_unitario_anotado=Coalesce(F('custo_base__ultimo_custo'), Value(Decimal('0')), output_field=valor),
+        ).annotate(
+            custo_anotado=ExpressionWrapper(F('custo_unitario_anotado') * F('quantidade'), output_field=valor),
+            lucro_anotado=ExpressionWrapper(
+                (F('produto__valor_repasse_logista') + F('produto__entrada_cliente') - F('custo_unitario_anotado'))
+                * F('quantidade'),
+                output_field=valor,
+            ),
+        )
+
+
 class ProdutoVenda(Base):
     produto = models.ForeignKey('produtos.Produto', on_delete=models.CASCADE, related_name='produto_vendas')
     renavam = models.CharField(max_length=100, null=True, blank=True)
@@ -574,6 +1025,8 @@ class ProdutoVenda(Base):
     quantidade = models.PositiveIntegerField()
     valor_desconto = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     venda = models.ForeignKey('vendas.Venda', on_delete=models.CASCADE, related_name='itens_venda')
+
+    objects = ProdutoVendaQuerySet.as_manager()
     
     def clean(self):
         from django.core.exceptions import ValidationError
@@ -606,13 +1059,23 @@ class ProdutoVenda(Base):
     def calcular_valor_total(self):
         return (self.valor_unitario * self.quantidade) - self.valor_desconto
     
+    @cached_property
+    def custo_unitario(self):
+        if hasattr(self, 'custo_unitario_anotado'):
+            return self.custo_unitario_anotado
+        from estoque.models import CustoProduto
+        custo = CustoProduto.objects.filter(produto_id=self.produto_id, loja__isnull=True).values_list('ultimo_custo', flat=True).first()
+        return custo or Decimal('0.00')
+
     def lucro(self):
-        from estoque.models import ProdutoEntrada
-        return ((self.produto.valor_repasse_logista + self.produto.entrada_cliente) - ProdutoEntrada.objects.filter(produto=self.produto).last().custo_unitario) * self.quantidade
+        if hasattr(self, 'lucro_anotado'):
+            return self.lucro_anotado
+        return ((self.produto.valor_repasse_logista + self.produto.entrada_cliente) - self.custo_unitario) * self.quantidade
     
     def custo(self):
-        from estoque.models import ProdutoEntrada
-        return ProdutoEntrada.objects.filter(produto=self.produto).last().custo_unitario * self.quantidade
+        if hasattr(self, 'custo_anotado'):
+            return self.custo_anotado
+        return self.custo_unitario * self.quantidade
     
     def __str__(self):
         return f"{self.produto.nome} x {self.quantidade} (R$ {self.valor_unitario})"
@@ -620,6 +1083,9 @@ class ProdutoVenda(Base):
     class Meta:
         verbose_name_plural = 'Produtos Vendas'
         ordering = ['-id']
+        indexes = [
+            models.Index(fields=['renavam'], name='produtovenda_renavam_idx'),
+        ]
         permissions = (
             ('can_view_all_products_sold', 'Pode ver todos os produtos vendidos'),
         )
@@ -639,7 +1105,27 @@ class TipoPagamento(Base):
     
     class  Meta:
         verbose_name_plural = 'Tipos de Pagamentos'
-        
+
+
+def filtro_credfacil(caminho=''):
+    """
+    Pagamentos CredFácil, pelo nome do tipo de pagamento. `caminho` leva do modelo consultado
+    ao pagamento (ex.: 'pagamento__' em Parcela, 'pagamentos__' em Venda).
+    """
+    return Q(**{f'{caminho}tipo_pagamento__nome': 'CREDFACIL'})
+
+
+def calcular_data_vencimento(data_primeira_parcela, numero_parcela):
+    """
+    Vencimento da parcela `numero_parcela` (a partir de 1): mesmo dia da primeira parcela
+    (5 ou 15) nos meses seguintes, ou o último dia do mês quando o dia não existir.
+    """
+    mes_base = data_primeira_parcela.month - 1 + (numero_parcela - 1)
+    ano = data_primeira_parcela.year + mes_base // 12
+    mes = mes_base % 12 + 1
+    dia = min(data_primeira_parcela.day, calendar.monthrange(ano, mes)[1])
+    return date(ano, mes, dia)
+
 
 class PagamentoQuerySet(models.QuerySet):
     def with_parcelas_info(self):
@@ -670,6 +1156,51 @@ class PagamentoQuerySet(models.QuerySet):
             )
         )
 
+    def with_financial_summary(self):
+        """
+        Anota os valores exibidos nas contas a receber (totais, quitado, atrasado, a vencer,
+        vencimentos e último pagamento) como subqueries, em uma única consulta.
+        Os métodos de Pagamento usam estes valores quando presentes.
+        """
+        agora = timezone.now()
+        parcelas = Parcela.objects.filter(pagamento=OuterRef('pk'))
+        pagas = parcelas.filter(pago=True)
+        em_aberto = parcelas.filter(pago=False)
+        vencidas = em_aberto.filter(data_vencimento__lt=agora)
+        a_vencer = em_aberto.filter(data_vencimento__gte=agora)
+        zero = Value(Decimal('0'))
+        restante = F('valor') - Coalesce('desconto', zero) - Coalesce('valor_pago', zero)
+
+        def contagem(queryset):
+            total = queryset.order_by().values('pagamento').annotate(qtd=Count('id')).values('qtd')
+            return Coalesce(Subquery(total), Value(0))
+
+        def primeiro(queryset, campo, *ordem):
+            return Subquery(queryset.order_by(*ordem).values(campo)[:1])
+
+        proxima = a_vencer.order_by('data_vencimento', 'id').annotate(restante=restante)
+
+        return self.annotate(
+            valor_total_parcelas_anotado=_soma_subquery(parcelas, 'valor', 'pagamento'),
+            valor_quitado_anotado=_soma_subquery(pagas, 'valor', 'pagamento'),
+            valor_atrasado_anotado=_soma_subquery(vencidas, restante, 'pagamento'),
+            valor_a_vencer_anotado=_soma_subquery(a_vencer, restante, 'pagamento'),
+            total_a_vencer_anotado=_soma_subquery(em_aberto, restante, 'pagamento'),
+            valor_atual_a_vencer_anotado=Coalesce(
+                Subquery(proxima.values('restante')[:1]), zero,
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            ),
+            valor_pago_ultimo_anotado=Coalesce(
+                primeiro(pagas, 'valor', F('data_pagamento').desc(nulls_last=True), '-id'), zero,
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            ),
+            ultimo_vencimento_anotado=primeiro(vencidas, 'data_vencimento', '-data_vencimento'),
+            ultimo_pagamento_anotado=primeiro(pagas, 'data_pagamento', F('data_pagamento').asc(nulls_first=True), 'id'),
+            proximo_vencimento_anotado=primeiro(a_vencer, 'data_vencimento', 'data_vencimento'),
+            parcelas_totais_anotado=contagem(parcelas),
+            parcelas_pagas_anotado=contagem(pagas),
+        )
+
     def with_status_flags(self):
         return self.with_parcelas_info().annotate(
             todas_parcelas_pagas=Case(
@@ -714,62 +1245,125 @@ class Pagamento(Base):
     @property
     def valor_parcela(self):
         return self.valor / self.parcelas
+
+    def gerar_parcelas(self, simular=False, substituir=True):
+        """
+        Monta as parcelas do pagamento em memória e grava todas com um único bulk_create.
+        Com simular=True só devolve as parcelas, sem gravar (prévia; funciona com o pagamento
+        ainda não salvo). Com substituir=False não apaga parcelas existentes (pagamento novo).
+        Como o bulk_create não dispara sinais, agenda aqui os recálculos que os sinais de
+        Parcela fariam.
+        """
+        parcelas = [
+            Parcela(
+                loja_id=self.loja_id,
+                pagamento=self,
+                numero_parcela=numero,
+                valor=self.valor_parcela,
+                data_vencimento=calcular_data_vencimento(self.data_primeira_parcela, numero),
+                criado_por_id=self.criado_por_id,
+                modificado_por_id=self.modificado_por_id,
+            )
+            for numero in range(1, (self.parcelas or 0) + 1)
+        ]
+        if simular:
+            return parcelas
+
+        with transaction.atomic():
+            if substituir:
+                self.parcelas_pagamento.all().delete()
+            Parcela.objects.bulk_create(parcelas)
+        ResumoRecebiveisMensal.agendar_recalculo({(self.venda.loja_id, parcela.data_vencimento) for parcela in parcelas})
+        SituacaoCreditoCpf.agendar_recalculo({self.venda.cliente.cpf})
+        return parcelas
     
     def valor_atrasado(self):
+        if hasattr(self, 'valor_atrasado_anotado'):
+            return self.valor_atrasado_anotado
         return sum(parcela.valor_restante for parcela in self.parcelas_pagamento.filter(pago=False, data_vencimento__lt=timezone.now()))
     
     def ultimo_vencimento(self):
+        if hasattr(self, 'ultimo_vencimento_anotado'):
+            return self.ultimo_vencimento_anotado
         # primeiro pagamento em atraso
         # pega a última parcela que não foi paga que tem a data vencimento menor que a data atual e ordena por data de vencimento
         ultimo = self.parcelas_pagamento.filter(pago=False, data_vencimento__lt=timezone.now()).order_by('data_vencimento').last()
         return ultimo.data_vencimento if ultimo else None
     
     def valor_pago_ultimo(self):
+        if hasattr(self, 'valor_pago_ultimo_anotado'):
+            return self.valor_pago_ultimo_anotado
         ultimo = self.parcelas_pagamento.filter(pago=True).order_by('data_pagamento').last()
         return ultimo.valor if ultimo else 0
     
     def ultimo_pagamento(self):
+        if hasattr(self, 'ultimo_pagamento_anotado'):
+            return self.ultimo_pagamento_anotado
         ultimo = self.parcelas_pagamento.filter(pago=True).order_by('-data_pagamento').last()
         return ultimo.data_pagamento if ultimo else None
     
     def valor_a_vencer(self):
+        if hasattr(self, 'valor_a_vencer_anotado'):
+            return self.valor_a_vencer_anotado
         return sum(parcela.valor_restante for parcela in self.parcelas_pagamento.filter(pago=False, data_vencimento__gte=timezone.now()))
 
     def valor_atual_a_vencer(self):
+        if hasattr(self, 'valor_atual_a_vencer_anotado'):
+            return self.valor_atual_a_vencer_anotado
         proximo = self.parcelas_pagamento.filter(pago=False, data_vencimento__gte=timezone.now()).order_by('data_vencimento').first()
         if proximo:
             return proximo.valor_restante
         return 0
 
     def proximo_vencimento(self):
+        if hasattr(self, 'proximo_vencimento_anotado'):
+            return self.proximo_vencimento_anotado
         proximo = self.parcelas_pagamento.filter(pago=False, data_vencimento__gte=timezone.now()).order_by('data_vencimento').first()
         return proximo.data_vencimento if proximo else None
     
     def valor_total_parcelas(self):
+        if hasattr(self, 'valor_total_parcelas_anotado'):
+            return self.valor_total_parcelas_anotado
         return sum(parcela.valor for parcela in self.parcelas_pagamento.all())
     
     def parcelas_totais(self):
+        if hasattr(self, 'parcelas_totais_anotado'):
+            return self.parcelas_totais_anotado
         return self.parcelas_pagamento.count()
 
     def parcelas_pagas(self):
+        if hasattr(self, 'parcelas_pagas_anotado'):
+            return self.parcelas_pagas_anotado
         return self.parcelas_pagamento.filter(pago=True).count()
     
     def valor_quitado(self):
+        if hasattr(self, 'valor_quitado_anotado'):
+            return self.valor_quitado_anotado
         return sum(parcela.valor for parcela in self.parcelas_pagamento.filter(pago=True))
     
     def valor_pendente(self):
+        if hasattr(self, 'valor_quitado_anotado'):
+            return self.valor - self.valor_quitado_anotado
         return self.valor - sum(parcela.valor for parcela in self.parcelas_pagamento.filter(pago=True))
     
     def parcelas_pendentes(self):
+        if hasattr(self, 'parcelas_totais_anotado'):
+            return self.parcelas_totais_anotado - self.parcelas_pagas_anotado
         return self.parcelas_pagamento.filter(pago=False).count()
 
     def total_a_vencer(self):
+        if hasattr(self, 'total_a_vencer_anotado'):
+            return self.total_a_vencer_anotado
         return sum(parcela.valor_restante for parcela in self.parcelas_pagamento.filter(pago=False))
     
     def total_atrasos(self):
+        if hasattr(self, 'valor_atrasado_anotado'):
+            return self.valor_atrasado_anotado
         return sum(parcela.valor_restante for parcela in self.parcelas_pagamento.filter(pago=False, data_vencimento__lt=timezone.now()))
     
     def total_pago(self):
+        if hasattr(self, 'valor_quitado_anotado'):
+            return self.valor_quitado_anotado
         return sum(parcela.valor for parcela in self.parcelas_pagamento.filter(pago=True))
     
     def __str__(self):
@@ -787,6 +1381,58 @@ class Pagamento(Base):
         )
     
 
+class ParcelaQuerySet(models.QuerySet):
+    def credfacil(self):
+        return self.filter(filtro_credfacil('pagamento__'))
+
+    def primeiras_por_venda(self, quantidade=3):
+        # numera as parcelas de cada venda por vencimento e mantém só as primeiras
+        return self.annotate(
+            posicao_na_venda=Window(
+                RowNumber(),
+                partition_by=F('pagamento__venda_id'),
+                order_by=[F('data_vencimento').asc(), F('id').asc()],
+            )
+        ).filter(posicao_na_venda__lte=quantidade)
+
+    def resumo_recebiveis(self, hoje=None):
+        """
+        Quantidades e valores de parcelas pagas, vencidas e a vencer em uma única consulta.
+        Parcelas com pagamento informado (pagamento_efetuado) entram apenas no total.
+        """
+        hoje = hoje or timezone.now().date()
+        em_aberto = Q(pago=False, pagamento_efetuado=False)
+        filtros = {
+            'pagas': Q(pago=True, pagamento_efetuado=False),
+            'vencidas': em_aberto & Q(data_vencimento__lt=hoje),
+            'a_vencer': em_aberto & Q(data_vencimento__gte=hoje),
+        }
+        agregados = {'qtd_total': Count('id')}
+        for nome, filtro in filtros.items():
+            agregados[f'qtd_{nome}'] = Count('id', filter=filtro)
+            agregados[f'valor_{nome}'] = Sum('valor', filter=filtro)
+        resumo = self.aggregate(**agregados)
+        for nome in filtros:
+            resumo[f'valor_{nome}'] = resumo[f'valor_{nome}'] or Decimal('0')
+        return resumo
+
+    def resumo_desativados(self, hoje=None):
+        """Parcelas em aberto de pagamentos desativados, separadas entre vencidas e a vencer."""
+        hoje = hoje or timezone.now().date()
+        filtros = {
+            'vencidas': Q(data_vencimento__lt=hoje),
+            'a_vencer': Q(data_vencimento__gte=hoje),
+        }
+        agregados = {}
+        for nome, filtro in filtros.items():
+            agregados[f'qtd_{nome}'] = Count('id', filter=filtro)
+            agregados[f'valor_{nome}'] = Sum('valor', filter=filtro)
+        resumo = self.filter(pagamento__desativado=True, pago=False).aggregate(**agregados)
+        for nome in filtros:
+            resumo[f'valor_{nome}'] = resumo[f'valor_{nome}'] or Decimal('0')
+        return resumo
+
+
 class Parcela(Base):
     pagamento = models.ForeignKey('vendas.Pagamento', on_delete=models.CASCADE, related_name='parcelas_pagamento')
     numero_parcela = models.PositiveIntegerField()
@@ -799,6 +1445,7 @@ class Parcela(Base):
     pagamento_efetuado = models.BooleanField(default=False)
     pagamento_efetuado_em = models.DateTimeField(null=True, blank=True)
     pago = models.BooleanField(default=False)
+    objects = ParcelaQuerySet.as_manager()
 
     @property
     def valor_restante(self):
@@ -814,6 +1461,312 @@ class Parcela(Base):
         permissions = (
             ('change_vencimento_parcela', 'Pode alterar data de vencimento de parcelas'),
         )
+        indexes = [
+            models.Index(fields=['pagamento', 'pago', 'data_vencimento'], name='parcela_pag_pago_venc_idx'),
+        ]
+
+
+def _agendar_no_commit(local, itens, processar):
+    """
+    Acumula `itens` no conjunto pendente da transação atual e chama processar(conjunto) uma vez,
+    quando ela for confirmada. O callback só é registrado ao abrir um conjunto novo; se a transação
+    for desfeita o Django descarta o callback e o próximo agendamento começa do zero.
+    """
+    if not itens:
+        return
+    callback = getattr(local, 'callback', None)
+    registrado = any(registro[1] is callback for registro in transaction.get_connection().run_on_commit)
+    if callback is None or not registrado:
+        pendentes = set(itens)
+
+        def callback():
+            if local.callback is callback:
+                local.callback = None
+            processar(pendentes)
+
+        local.callback, local.pendentes = callback, pendentes
+        transaction.on_commit(callback)
+    else:
+        local.pendentes.update(itens)
+
+
+class ResumoRecebiveisMensal(models.Model):
+    """
+    Fotografia dos recebíveis CREDFÁCIL por loja, mês de vencimento e situação.
+
+    As situações pago / vencido / a_vencer / informado cobrem todas as parcelas de vendas
+    não excluídas (inclusive de pagamentos desativados, como no gráfico); as situações
+    desativado_* contam novamente apenas as parcelas em aberto de pagamentos desativados.
+    """
+    ESTADO_CHOICES = (
+        ('pago', 'Pago'),
+        ('vencido', 'Vencido'),
+        ('a_vencer', 'A vencer'),
+        ('informado', 'Pagamento informado'),
+        ('desativado_vencido', 'Desativado vencido'),
+        ('desativado_a_vencer', 'Desativado a vencer'),
+    )
+
+    loja = models.ForeignKey('vendas.Loja', on_delete=models.CASCADE, related_name='resumos_recebiveis')
+    mes = models.DateField()
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES)
+    quantidade = models.PositiveIntegerField(default=0)
+    valor = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    data_referencia = models.DateField(help_text='Dia usado para separar parcelas vencidas e a vencer')
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    _pendentes = threading.local()
+
+    def __str__(self):
+        return f"{self.loja} {self.mes:%m/%Y} {self.get_estado_display()}"
+
+    @staticmethod
+    def _parcelas_base():
+        return Parcela.objects.credfacil().filter(
+            pagamento__venda__is_deleted=False,
+            pagamento__venda__loja__isnull=False,
+        )
+
+    @classmethod
+    def _agregar(cls, parcelas, hoje):
+        """Agrupa as parcelas por loja, mês e situação em duas consultas."""
+        em_aberto = Q(pago=False, pagamento_efetuado=False)
+        estado = Case(
+            When(pagamento_efetuado=True, then=Value('informado')),
+            When(pago=True, then=Value('pago')),
+            When(em_aberto & Q(data_vencimento__lt=hoje), then=Value('vencido')),
+            default=Value('a_vencer'),
+        )
+        estado_desativado = Case(
+            When(data_vencimento__lt=hoje, then=Value('desativado_vencido')),
+            default=Value('desativado_a_vencer'),
+        )
+        consultas = (
+            parcelas.annotate(estado_resumo=estado),
+            parcelas.filter(pagamento__desativado=True, pago=False).annotate(estado_resumo=estado_desativado),
+        )
+        linhas = []
+        for consulta in consultas:
+            agrupado = consulta.annotate(mes_resumo=TruncMonth('data_vencimento')).values(
+                'pagamento__venda__loja_id', 'mes_resumo', 'estado_resumo'
+            ).annotate(qtd=Count('id'), total=Sum('valor')).order_by()
+            for item in agrupado:
+                linhas.append(cls(
+                    loja_id=item['pagamento__venda__loja_id'],
+                    mes=item['mes_resumo'],
+                    estado=item['estado_resumo'],
+                    quantidade=item['qtd'],
+                    valor=item['total'] or 0,
+                    data_referencia=hoje,
+                ))
+        return linhas
+
+    @staticmethod
+    def _intervalo_mes(mes):
+        inicio = mes.replace(day=1)
+        proximo = (inicio + timedelta(days=32)).replace(day=1)
+        return inicio, proximo
+
+    @classmethod
+    def recalcular(cls, buckets, hoje=None):
+        """Recalcula apenas os pares (loja_id, mês) informados."""
+        buckets = {(loja_id, mes.replace(day=1)) for loja_id, mes in buckets if loja_id and mes}
+        if not buckets:
+            return
+        hoje = hoje or timezone.now().date()
+        filtro_parcelas = Q()
+        filtro_resumos = Q()
+        for loja_id, mes in buckets:
+            inicio, proximo = cls._intervalo_mes(mes)
+            filtro_parcelas |= Q(
+                pagamento__venda__loja_id=loja_id, data_vencimento__gte=inicio, data_vencimento__lt=proximo
+            )
+            filtro_resumos |= Q(loja_id=loja_id, mes=mes)
+        with transaction.atomic():
+            cls.objects.filter(filtro_resumos).delete()
+            cls.objects.bulk_create(cls._agregar(cls._parcelas_base().filter(filtro_parcelas), hoje))
+
+    @classmethod
+    def reconstruir(cls, hoje=None):
+        hoje = hoje or timezone.now().date()
+        with transaction.atomic():
+            cls.objects.all().delete()
+            linhas = cls.objects.bulk_create(cls._agregar(cls._parcelas_base(), hoje))
+        return len(linhas)
+
+    @classmethod
+    def atualizar_referencia(cls, hoje=None):
+        """
+        Reclassifica entre vencido e a vencer as parcelas cujo vencimento passou desde o
+        último cálculo. Só os meses entre a referência mais antiga e hoje são refeitos; com a
+        tabela vazia (primeira execução) ela é montada por inteiro. Retorna as linhas refeitas.
+        """
+        hoje = hoje or timezone.now().date()
+        if not cls.objects.exists():
+            return cls.reconstruir(hoje)
+        referencia = cls.objects.filter(data_referencia__lt=hoje).aggregate(menor=Min('data_referencia'))['menor']
+        if referencia is None:
+            return 0
+        inicio = referencia.replace(day=1)
+        fim = cls._intervalo_mes(hoje)[1]
+        with transaction.atomic():
+            cls.objects.filter(mes__gte=inicio, mes__lt=fim).delete()
+            linhas = cls.objects.bulk_create(cls._agregar(
+                cls._parcelas_base().filter(data_vencimento__gte=inicio, data_vencimento__lt=fim), hoje
+            ))
+            cls.objects.filter(data_referencia__lt=hoje).update(data_referencia=hoje)
+        return len(linhas)
+
+    @classmethod
+    def buckets_de_pagamentos(cls, pagamento_ids):
+        return set(
+            Parcela.objects.filter(pagamento_id__in=pagamento_ids).annotate(
+                mes_resumo=TruncMonth('data_vencimento')
+            ).values_list('pagamento__venda__loja_id', 'mes_resumo').distinct().order_by()
+        )
+
+    @classmethod
+    def agendar_recalculo(cls, buckets):
+        """
+        Acumula os pares (loja_id, mês) alterados e recalcula todos de uma vez quando a
+        transação atual for confirmada.
+        """
+        _agendar_no_commit(cls._pendentes, {b for b in buckets if b[0] and b[1]}, cls.recalcular)
+
+    class Meta:
+        verbose_name = 'Resumo de Recebíveis Mensal'
+        verbose_name_plural = 'Resumos de Recebíveis Mensais'
+        constraints = [
+            models.UniqueConstraint(fields=['loja', 'mes', 'estado'], name='resumo_recebiveis_unico'),
+        ]
+
+
+class SituacaoCreditoCpf(models.Model):
+    """
+    Situação de crédito por CPF (somando todos os clientes com o mesmo CPF), mantida pelos
+    sinais de Parcela e Venda. As vendas consideradas são as não excluídas e as parcelas,
+    as do pagamento CREDFACIL. Parcelas em atraso são contadas em data_referencia.
+    """
+    PARCELAS_PAGAS_MINIMAS = 3
+    CAMPOS_CALCULADOS = (
+        'vendas', 'vendas_em_aberto', 'menor_parcelas_pagas', 'parcelas_em_atraso',
+        'primeiro_vencimento_em_aberto', 'data_referencia',
+    )
+
+    cpf = models.CharField(max_length=14, primary_key=True)
+    vendas = models.PositiveIntegerField(default=0)
+    vendas_em_aberto = models.PositiveIntegerField(default=0, help_text='Vendas com parcela CREDFACIL em aberto')
+    menor_parcelas_pagas = models.PositiveIntegerField(null=True, blank=True, help_text='Menor número de parcelas pagas entre as vendas')
+    parcelas_em_atraso = models.PositiveIntegerField(default=0)
+    primeiro_vencimento_em_aberto = models.DateField(null=True, blank=True)
+    data_referencia = models.DateField(help_text='Dia usado para contar as parcelas em atraso')
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    _pendentes = threading.local()
+
+    def __str__(self):
+        return f"{self.cpf}: {self.vendas} venda(s), {self.parcelas_em_atraso} parcela(s) em atraso"
+
+    @property
+    def apto_nova_venda(self):
+        """Cada venda anterior do CPF precisa ter ao menos PARCELAS_PAGAS_MINIMAS parcelas pagas."""
+        return self.menor_parcelas_pagas is None or self.menor_parcelas_pagas >= self.PARCELAS_PAGAS_MINIMAS
+
+    @classmethod
+    def _calcular(cls, cpfs, hoje):
+        """Monta as linhas dos CPFs informados (todos, com None) a partir de uma consulta agrupada por venda."""
+        parcela = 'pagamentos__parcelas_pagamento'
+        credfacil = filtro_credfacil('pagamentos__')
+        em_aberto = credfacil & Q(pagamentos__parcelas_pagamento__pago=False)
+        vendas = Venda.objects.filter(is_deleted=False)
+        if cpfs is not None:
+            vendas = vendas.filter(cliente__cpf__in=cpfs)
+        por_venda = vendas.values('pk', 'cliente__cpf').annotate(
+            pagas=Count(parcela, filter=credfacil & Q(pagamentos__parcelas_pagamento__pago=True), distinct=True),
+            abertas=Count(parcela, filter=em_aberto, distinct=True),
+            atrasadas=Count(
+                parcela, filter=em_aberto & Q(pagamentos__parcelas_pagamento__data_vencimento__lt=hoje), distinct=True
+            ),
+            primeiro_aberto=Min('pagamentos__parcelas_pagamento__data_vencimento', filter=em_aberto),
+        ).order_by()
+
+        linhas = {}
+        for venda in por_venda:
+            cpf = venda['cliente__cpf']
+            linha = linhas.get(cpf)
+            if linha is None:
+                linha = linhas[cpf] = cls(cpf=cpf, menor_parcelas_pagas=venda['pagas'], data_referencia=hoje)
+            linha.vendas += 1
+            linha.vendas_em_aberto += 1 if venda['abertas'] else 0
+            linha.menor_parcelas_pagas = min(linha.menor_parcelas_pagas, venda['pagas'])
+            linha.parcelas_em_atraso += venda['atrasadas']
+            if venda['primeiro_aberto'] and (
+                linha.primeiro_vencimento_em_aberto is None or venda['primeiro_aberto'] < linha.primeiro_vencimento_em_aberto
+            ):
+                linha.primeiro_vencimento_em_aberto = venda['primeiro_aberto']
+        return list(linhas.values())
+
+    @classmethod
+    def recalcular(cls, cpfs, hoje=None):
+        """
+        Recalcula apenas os CPFs informados. Cada linha é gravada com update_or_create (que trava
+        a linha existente), então dois recálculos simultâneos do mesmo CPF não se chocam.
+        """
+        cpfs = {cpf for cpf in cpfs if cpf}
+        if not cpfs:
+            return
+        hoje = hoje or timezone.now().date()
+        with transaction.atomic():
+            linhas = cls._calcular(cpfs, hoje)
+            for linha in linhas:
+                cls.objects.update_or_create(
+                    cpf=linha.cpf, defaults={campo: getattr(linha, campo) for campo in cls.CAMPOS_CALCULADOS}
+                )
+            # CPFs que ficaram sem vendas
+            cls.objects.filter(cpf__in=cpfs - {linha.cpf for linha in linhas}).delete()
+
+    @classmethod
+    def reconstruir(cls, hoje=None):
+        hoje = hoje or timezone.now().date()
+        with transaction.atomic():
+            cls.objects.all().delete()
+            linhas = cls.objects.bulk_create(cls._calcular(None, hoje), batch_size=1000)
+        return len(linhas)
+
+    @classmethod
+    def atualizar_referencia(cls, hoje=None):
+        """Recalcula só os CPFs com parcela em aberto que venceu desde o último cálculo."""
+        hoje = hoje or timezone.now().date()
+        cpfs = list(cls.objects.filter(
+            data_referencia__lt=hoje, primeiro_vencimento_em_aberto__lt=hoje
+        ).values_list('cpf', flat=True))
+        for inicio in range(0, len(cpfs), 1000):
+            cls.recalcular(cpfs[inicio:inicio + 1000], hoje)
+        return len(cpfs)
+
+    @classmethod
+    def calcular(cls, cpf, hoje=None):
+        """Situação do CPF calculada agora a partir das vendas, sem gravar (None se não houver vendas)."""
+        linhas = cls._calcular({cpf}, hoje or timezone.now().date())
+        return linhas[0] if linhas else None
+
+    @classmethod
+    def obter(cls, cpf):
+        """Situação do CPF; calcula na hora se ainda não existir (CPF sem vendas retorna None)."""
+        situacao = cls.objects.filter(pk=cpf).first()
+        if situacao is None and Venda.objects.filter(cliente__cpf=cpf, is_deleted=False).exists():
+            cls.recalcular([cpf])
+            situacao = cls.objects.filter(pk=cpf).first()
+        return situacao
+
+    @classmethod
+    def agendar_recalculo(cls, cpfs):
+        """Acumula os CPFs alterados e recalcula todos quando a transação atual for confirmada."""
+        _agendar_no_commit(cls._pendentes, {cpf for cpf in cpfs if cpf}, cls.recalcular)
+
+    class Meta:
+        verbose_name = 'Situação de Crédito por CPF'
+        verbose_name_plural = 'Situações de Crédito por CPF'
 
 
 class Contato(Base):
@@ -829,4 +1782,124 @@ class Contato(Base):
         return self.nome
     
     class Meta:
-        verbose_name_plural = 'Contatos'
\ No newline at end of file
+        verbose_name_plural = 'Contatos'
+
+class RelatorioJob(Base):
+    """
+    Relatório pesado gerado em segundo plano pelo comando processar_relatorios.
+    A chave é o hash do tipo, formato, loja e filtros normalizados: pedidos idênticos
+    dentro de RELATORIO_CACHE_SEGUNDOS reaproveitam o arquivo já gerado.
+    """
+    TIPO_CHOICES = (
+        ('vendas', 'Relatório de Vendas'),
+        ('solicitacoes', 'Relatório de Solicitações'),
+        ('contas_a_receber', 'Relatório de Contas a Receber'),
+        ('graficos', 'Gráficos'),
+    )
+    FORMATO_CHOICES = (
+        ('html', 'Página'),
+        ('csv', 'CSV'),
+        ('xlsx', 'Excel'),
+    )
+    STATUS_CHOICES = (
+        ('pendente', 'Pendente'),
+        ('processando', 'Processando'),
+        ('concluido', 'Concluído'),
+        ('erro', 'Erro'),
+    )
+
+    tipo = models.CharField(max_length=30, choices=TIPO_CHOICES)
+    formato = models.CharField(max_length=10, choices=FORMATO_CHOICES, default='html')
+    parametros = models.JSONField(default=dict, blank=True)
+    chave = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    arquivo = models.FileField(upload_to='relatorios/%Y/%m/', null=True, blank=True)
+    erro = models.TextField(null=True, blank=True)
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+    tentativas = models.PositiveSmallIntegerField(default=0)
+
+    TENTATIVAS_MAXIMAS = 3
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} ({self.get_status_display()})"
+
+    def get_absolute_url(self):
+        return reverse('vendas:relatorio_job_download', kwargs={'pk': self.pk})
+
+    @staticmethod
+    def normalizar_parametros(query_dict):
+        """Filtros do GET como dict ordenado de listas, sem valores vazios nem o formato."""
+        parametros = {}
+        for campo in sorted(query_dict.keys()):
+            if campo in ('formato', 'csrfmiddlewaretoken'):
+                continue
+            valores = sorted(v for v in query_dict.getlist(campo) if v not in ('', None))
+            if valores:
+                parametros[campo] = valores
+        return parametros
+
+    @staticmethod
+    def gerar_chave(tipo, formato, loja_id, parametros, usuario):
+        # o resultado depende das permissões do usuário (ex.: ver todas as lojas); páginas HTML
+        # também carregam dados do próprio usuário, então não são compartilhadas entre usuários
+        escopo = usuario.pk if formato == 'html' else sorted(usuario.get_all_permissions())
+        conteudo = json.dumps([tipo, formato, loja_id, parametros, escopo], sort_keys=True, default=str)
+        return hashlib.sha256(conteudo.encode()).hexdigest()
+
+    @classmethod
+    def resultado_em_cache(cls, chave):
+        """Job concluído com o arquivo desta chave gerado há menos de RELATORIO_CACHE_SEGUNDOS."""
+        janela = timezone.now() - timedelta(seconds=getattr(settings, 'RELATORIO_CACHE_SEGUNDOS', 600))
+        return cls.objects.filter(
+            chave=chave, status='concluido', concluido_em__gte=janela,
+        ).exclude(arquivo='').exclude(arquivo__isnull=True).order_by('-concluido_em').first()
+
+    @classmethod
+    def recuperar_travados(cls):
+        """
+        Jobs em 'processando' há mais de RELATORIO_TEMPO_MAXIMO_SEGUNDOS ficaram sem worker (o
+        processo caiu no meio): voltam para a fila ou, esgotadas as tentativas, viram erro.
+        Retorna (reenfileirados, abandonados).
+        """
+        limite = timezone.now() - timedelta(seconds=getattr(settings, 'RELATORIO_TEMPO_MAXIMO_SEGUNDOS', 1800))
+        travados = cls.objects.filter(status='processando', iniciado_em__lt=limite)
+        abandonados = travados.filter(tentativas__gte=cls.TENTATIVAS_MAXIMAS).update(
+            status='erro', erro='Tempo esgotado na geração do relatório.', concluido_em=timezone.now(),
+        )
+        reenfileirados = travados.update(status='pendente', iniciado_em=None)
+        return reenfileirados, abandonados
+
+    @classmethod
+    def solicitar(cls, usuario, loja_id, tipo, formato, query_dict):
+        """
+        Enfileira o relatório, ou devolve um já existente: o mesmo pedido ainda na fila do
+        próprio usuário ou um resultado recente em cache (copiado para o job do usuário).
+        """
+        parametros = cls.normalizar_parametros(query_dict)
+        chave = cls.gerar_chave(tipo, formato, loja_id, parametros, usuario)
+
+        em_andamento = cls.objects.filter(
+            chave=chave, criado_por=usuario, status__in=('pendente', 'processando'),
+        ).first()
+        if em_andamento:
+            return em_andamento
+
+        job = cls(
+            tipo=tipo, formato=formato, parametros=parametros, chave=chave,
+            loja_id=loja_id, criado_por=usuario, modificado_por=usuario,
+        )
+        cache = cls.resultado_em_cache(chave)
+        if cache:
+            job.status = 'concluido'
+            job.arquivo.name = cache.arquivo.name
+            job.iniciado_em = timezone.now()
+            # a cópia mantém a data em que o arquivo foi gerado: assim ela não renova a janela do cache
+            job.concluido_em = cache.concluido_em
+        job.save()
+        return job
+
+    class Meta:
+        verbose_name = 'Relatório em Segundo Plano'
+        verbose_name_plural = 'Relatórios em Segundo Plano'
+        ordering = ['-criado_em']
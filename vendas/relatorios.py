@@ -0,0 +1,523 @@
+"""
+Relatórios de vendas, solicitações e gráficos, e a geração em segundo plano (RelatorioJob).
+
+As consultas e os contextos de cada relatório ficam em funções que recebem os filtros
+(um QueryDict), o usuário e a loja da sessão: as views as chamam com o request.GET e o
+worker (comando processar_relatorios) com os parâmetros salvos no job. O worker grava o
+arquivo gerado e notifica o usuário pelo canal de notificações.
+"""
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from django.db.models import Count, OuterRef, Prefetch, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.http import QueryDict
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from financeiro.relatorios import (
+    COLUNAS_CONTAS_A_RECEBER, contexto_contas_a_receber, exportacao_contas_a_receber, filtrar_contas_a_receber,
+    partes_contas_a_receber,
+)
+from notificacao.utils import notificar_usuarios
+from .exportacao import gerar_arquivo, sim_nao
+from .models import AnaliseCreditoCliente, Cliente, Loja, Pagamento, ProdutoVenda, ResumoRecebiveisMensal, Venda, filtro_credfacil
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_SOLICITACOES = 'relatorios/relatorio_solicitacoes.html'
+TEMPLATE_VENDAS = 'relatorios/folha_relatorio_vendas.html'
+TEMPLATE_GRAFICOS = 'dash/index.html'
+# totais sem vendas no filtro saem como zero, não None (floatformat mostraria vazio)
+ZERO = Value(Decimal('0'))
+
+
+# --- SOLICITAÇÕES ---
+
+COLUNAS_SOLICITACOES = (
+    ('ID', 'pk'),
+    ('Loja', 'loja__nome'),
+    ('Cliente', 'nome'),
+    ('CPF', 'cpf'),
+    ('Data Solicitação', 'criado_em'),
+    ('Vendedor', 'analise_credito__criado_por__username'),
+    ('Status Solicitação', 'analise_credito__status', dict(AnaliseCreditoCliente.STATUS_CHOICES).get),
+    ('Parcelas', 'analise_credito__numero_parcelas'),
+    ('Produto', 'analise_credito__produto__nome'),
+    ('Consulta Serasa', 'comprovantes__restricao', lambda restricao: 'Positiva' if restricao else 'Negativa'),
+    ('Venda Gerada?', 'analise_credito__venda', sim_nao),
+    ('Valor Entrada', 'valor_entrada_venda'),
+    ('Valor Repasse', 'analise_credito__venda__repasse_logista'),
+    ('Valor Total', 'valor_total_venda'),
+    ('Valor Juros', 'juros_venda'),
+)
+
+
+def filtrar_solicitacoes(parametros, usuario, loja_id):
+    """Clientes (solicitações) dos filtros informados e a loja do cabeçalho (None: todas as lojas)."""
+    # --- Extrai parâmetros ---
+    data_inicial    = parametros.get('data_inicial')
+    data_final      = parametros.get('data_final')
+    produtos        = parametros.getlist('produtos')
+    vendedores      = parametros.getlist('vendedores')
+    loja_ids        = parametros.getlist('lojas')
+    status_solicitacao = parametros.get('status_solicitacao')
+    parcelas        = parametros.get('parcelas')
+    analise_serasa  = parametros.get('analise_serasa')
+    vr              = parametros.get('venda_realizada', '').lower()
+
+    filtros = {}
+
+    # status_solicitacao
+    if status_solicitacao:
+        filtros['analise_credito__status__in'] = status_solicitacao.split(',')
+
+    # parcelas
+    if parcelas:
+        filtros['analise_credito__numero_parcelas__in'] = parcelas.split(',')
+
+    # serasa
+    if analise_serasa:
+        filtros['comprovantes__restricao__in'] = analise_serasa.split(',')
+
+    # venda realizada?
+    if vr in ('true', '1'):
+        filtros['analise_credito__venda__isnull'] = False
+    elif vr in ('false', '0'):
+        filtros['analise_credito__venda__isnull'] = True
+
+    # datas
+    if data_inicial and data_final:
+        di = datetime.strptime(data_inicial, '%Y-%m-%d')
+        df = datetime.strptime(data_final, '%Y-%m-%d') + timedelta(days=1)
+        filtros['criado_em__range'] = [
+            timezone.make_aware(di),
+            timezone.make_aware(df),
+        ]
+    elif data_inicial:
+        di = datetime.strptime(data_inicial, '%Y-%m-%d')
+        filtros['criado_em__gte'] = timezone.make_aware(di)
+    elif data_final:
+        df = datetime.strptime(data_final, '%Y-%m-%d')
+        filtros['criado_em__lte'] = timezone.make_aware(df)
+
+    # outros filtros simples
+    if vendedores:
+        filtros['analise_credito__criado_por__in'] = vendedores
+    if produtos:
+        filtros['analise_credito__produto__in'] = produtos
+
+    # Loja: se não selecionou, pega a loja do usuário logado
+    if loja_ids:
+        filtros['loja__id__in'] = loja_ids
+        loja = Loja.objects.filter(pk__in=loja_ids).first()
+    elif usuario.has_perm('vendas.can_view_all_stores'):
+        # Usuário pode ver todas as lojas e não selecionou nenhuma: pega todas
+        all_lojas = Loja.objects.values_list('id', flat=True)
+        filtros['loja__id__in'] = list(all_lojas)
+        loja = None
+    elif loja_id:
+        filtros['loja__id'] = loja_id
+        loja = Loja.objects.filter(pk=loja_id).first()
+    else:
+        loja = None
+
+    # executa consulta
+    return Cliente.objects.filter(**filtros).distinct(), loja
+
+
+def exportacao_solicitacoes(solicitacoes):
+    venda = Venda.objects.com_totais().filter(pk=OuterRef('analise_credito__venda'))
+    return solicitacoes.annotate(
+        valor_entrada_venda=Subquery(venda.values('valor_entrada_anotado')[:1]),
+        valor_total_venda=Subquery(venda.values('valor_total_anotado')[:1]),
+        juros_venda=Subquery(venda.values('juros_anotado')[:1]),
+    ).order_by('criado_em', 'pk')
+
+
+def contexto_solicitacoes(solicitacoes, parametros, loja):
+    data_inicial = parametros.get('data_inicial')
+    data_final = parametros.get('data_final')
+
+    # totais das vendas dos clientes filtrados em uma única consulta
+    totais = Venda.objects.filter(cliente__in=solicitacoes).com_totais().aggregate(
+        total_valor=Coalesce(Sum('valor_total_anotado'), ZERO),
+        total_repasse=Coalesce(Sum('repasse_logista'), ZERO),
+        total_entrada=Coalesce(Sum('valor_entrada_anotado'), ZERO),
+        total_juros=Coalesce(Sum('juros_anotado'), ZERO),
+    )
+    return {
+        # linhas: relações em joins e a venda da análise com os valores já anotados
+        'solicitacoes': solicitacoes.select_related(
+            'loja', 'comprovantes', 'analise_credito__criado_por', 'analise_credito__produto',
+        ).prefetch_related(
+            Prefetch('analise_credito__venda', queryset=Venda.objects.com_totais().com_situacao_pagamentos()),
+        ),
+        'total_vendas': solicitacoes.count(),
+        **totais,
+        'data_inicial': _data_formatada(data_inicial),
+        'data_final': _data_formatada(data_final),
+        'lojas': Loja.objects.filter(id__in=parametros.getlist('lojas')) if loja else Loja.objects.all(),
+    }
+
+
+# --- VENDAS ---
+
+COLUNAS_VENDAS = (
+    ('ID', 'pk'),
+    ('Loja', 'loja__nome'),
+    ('Cliente', 'cliente__nome'),
+    ('CPF', 'cliente__cpf'),
+    ('Data', 'data_venda'),
+    ('Vendedor', 'vendedor__username'),
+    ('Parcelas', 'qtd_parcelas_anotado'),
+    ('Produto', 'primeiro_produto_nome'),
+    ('Status Solicitação', 'cliente__analise_credito__status', dict(AnaliseCreditoCliente.STATUS_CHOICES).get),
+    ('Consulta Serasa', 'cliente__comprovantes__restricao', lambda restricao: 'Positiva' if restricao else 'Negativa'),
+    ('Valor de Entrada', 'valor_entrada_anotado'),
+    ('Valor de Repasse', 'repasse_logista'),
+    ('Valor Total', 'valor_total_anotado'),
+    ('Valor Juros', 'juros_anotado'),
+)
+
+
+def filtrar_vendas(parametros, usuario, loja_id):
+    """Vendas dos filtros informados e a loja do cabeçalho (None: todas as lojas)."""
+    # --- montamos filtros exatamente como antes ---
+    data_inicial = parametros.get('data_inicial')
+    data_final = parametros.get('data_final')
+    produtos = parametros.getlist('produtos')
+    vendedores = parametros.getlist('vendedores')
+    analise_serasa = parametros.getlist('analise_serasa')
+    parcelas = parametros.getlist('parcelas')
+    loja_ids = parametros.getlist('lojas')
+
+    filtros = {}
+
+    # datas
+    if data_inicial and data_final:
+        di = datetime.strptime(data_inicial, '%Y-%m-%d')
+        df = datetime.strptime(data_final, '%Y-%m-%d') + timedelta(days=1)
+        filtros['data_venda__range'] = [
+            timezone.make_aware(di),
+            timezone.make_aware(df),
+        ]
+    elif data_inicial:
+        di = datetime.strptime(data_inicial, '%Y-%m-%d')
+        filtros['data_venda__gte'] = timezone.make_aware(di)
+    elif data_final:
+        df = datetime.strptime(data_final, '%Y-%m-%d')
+        filtros['data_venda__lte'] = timezone.make_aware(df)
+
+    # outros filtros simples
+    if vendedores:
+        filtros['vendedor__in'] = vendedores
+    if analise_serasa:
+        filtros['cliente__comprovantes__restricao__in'] = analise_serasa
+    if parcelas:
+        filtros['analises_credito_venda__numero_parcelas__in'] = parcelas
+    if produtos:
+        filtros['produtos__in'] = produtos
+
+    # Loja: se não selecionou, pega a loja do usuário logado
+    if loja_ids:
+        filtros['loja__id__in'] = loja_ids
+        loja = Loja.objects.filter(pk__in=loja_ids).first()
+    elif usuario.has_perm('vendas.can_view_all_stores'):
+        # Usuário pode ver todas as lojas e não selecionou nenhuma: pega todas
+        all_lojas = Loja.objects.values_list('id', flat=True)
+        filtros['loja__id__in'] = list(all_lojas)
+        loja = None
+    elif loja_id:
+        filtros['loja__id'] = loja_id
+        loja = Loja.objects.filter(pk=loja_id).first()
+    else:
+        loja = None
+
+    # faz a query
+    return Venda.objects.filter(**filtros).distinct(), loja
+
+
+def exportacao_vendas(vendas):
+    primeiro_item = ProdutoVenda.objects.filter(venda=OuterRef('pk')).order_by('pk')
+    return vendas.com_totais().annotate(
+        primeiro_produto_nome=Subquery(primeiro_item.values('produto__nome')[:1]),
+    ).order_by('data_venda', 'pk')
+
+
+def contexto_vendas(vendas, parametros, loja):
+    # totais em uma única consulta sobre as vendas anotadas
+    totais = vendas.com_totais().aggregate(
+        total_vendas=Count('pk'),
+        total_juros=Coalesce(Sum('juros_anotado'), ZERO),
+        total_valor=Coalesce(Sum('valor_total_anotado'), ZERO),
+        total_entrada=Coalesce(Sum('valor_entrada_anotado'), ZERO),
+        total_repasse=Coalesce(Sum('repasse_logista'), ZERO),
+    )
+    return {
+        # linhas com os valores já anotados: o número de consultas não depende do número de vendas
+        'vendas': vendas.com_totais().com_situacao_pagamentos().select_related(
+            'loja', 'vendedor', 'cliente__analise_credito', 'cliente__comprovantes',
+        ).prefetch_related('produtos'),
+        **totais,
+        'data_inicial': _data_formatada(parametros.get('data_inicial')),
+        'data_final': _data_formatada(parametros.get('data_final')),
+        'lojas': Loja.objects.filter(id__in=parametros.getlist('lojas')) if loja else Loja.objects.all(),
+    }
+
+
+def _data_formatada(data):
+    return datetime.strptime(data, '%Y-%m-%d').strftime('%d/%m/%Y') if data else None
+
+
+# --- GRÁFICOS ---
+
+def contexto_graficos(loja_get):
+    """Contexto do painel de gráficos (dash/index.html), de todas as lojas ou da loja `loja_get`."""
+    loja = Loja.objects.filter(id=loja_get) if loja_get else Loja.objects.all()
+
+    vendas = Venda.objects.filter(is_deleted=False, loja__in=loja)
+    total_vendas = vendas.count()
+
+    # Os valores vêm do resumo mensal materializado (ver ResumoRecebiveisMensal); a virada
+    # do dia é feita pelo comando reconstruir_resumo_recebiveis
+    resumos = ResumoRecebiveisMensal.objects.filter(loja__in=loja).values(
+        'loja__nome', 'mes', 'estado', 'quantidade', 'valor'
+    ).order_by('mes')
+
+    valores_por_loja = defaultdict(lambda: {
+        'total_pagas': 0, 'total_vencidas': 0, 'total_a_vencer': 0,
+        'total_desativados_vencidas': 0, 'total_desativados_a_vencer': 0,
+    })
+    # Lojas com vendas aparecem mesmo sem parcelas CREDFÁCIL
+    for loja_nome in vendas.values_list('loja__nome', flat=True).distinct().order_by():
+        valores_por_loja[loja_nome]
+
+    # --- DASH POR MÊS ---
+    # Estrutura: {loja_nome: {YYYY-MM: {'pago': x, 'vencido': y, 'a_vencer': z}}}
+    dash_mensal_lojas = defaultdict(lambda: defaultdict(lambda: {'pago': 0, 'vencido': 0, 'a_vencer': 0}))
+
+    campos_por_estado = {
+        'pago': 'total_pagas',
+        'vencido': 'total_vencidas',
+        'a_vencer': 'total_a_vencer',
+        'desativado_vencido': 'total_desativados_vencidas',
+        'desativado_a_vencer': 'total_desativados_a_vencer',
+    }
+    quantidades = defaultdict(int)
+    totais = defaultdict(int)
+
+    for resumo in resumos:
+        loja_nome, estado = resumo['loja__nome'], resumo['estado']
+        quantidades[estado] += resumo['quantidade']
+        totais[estado] += resumo['valor']
+        if estado in campos_por_estado:
+            valores_por_loja[loja_nome][campos_por_estado[estado]] += resumo['valor']
+        if estado in ('pago', 'vencido', 'a_vencer'):
+            dash_mensal_lojas[loja_nome][resumo['mes'].strftime('%Y-%m')][estado] += float(resumo['valor'])
+
+    total_pagas, total_vencidas, total_a_vencer = totais['pago'], totais['vencido'], totais['a_vencer']
+    total_de_parcelas_pagas = quantidades['pago']
+    total_de_parcelas_vencidas = quantidades['vencido']
+    total_de_parcelas_a_vencer = quantidades['a_vencer']
+    total_geral_parcelas = total_de_parcelas_pagas + total_de_parcelas_vencidas + total_de_parcelas_a_vencer + quantidades['informado']
+
+    for loja_nome, valores in valores_por_loja.items():
+        total_geral = valores['total_pagas'] + valores['total_vencidas'] + valores['total_a_vencer'] + valores['total_desativados_vencidas'] + valores['total_desativados_a_vencer']
+        valores['pct_pagas'] = round((valores['total_pagas'] / total_geral) * 100, 2) if total_geral else 0
+        valores['pct_vencidas'] = round((valores['total_vencidas'] / total_geral) * 100, 2) if total_geral else 0
+        valores['pct_desativados'] = round(((valores['total_desativados_vencidas'] + valores['total_desativados_a_vencer']) / total_geral) * 100, 2) if total_geral else 0
+
+    # Prepara dash mensal para o template (serializável)
+    dash_mensal_json = {}
+    for loja_nome, meses in dash_mensal_lojas.items():
+        dash_mensal_json[loja_nome] = []
+        for mes_ano in sorted(meses.keys()):
+            dash_mensal_json[loja_nome].append({
+                'mes': mes_ano,
+                'pago': meses[mes_ano]['pago'],
+                'vencido': meses[mes_ano]['vencido'],
+                'a_vencer': meses[mes_ano]['a_vencer'],
+            })
+
+    # --- CÁLCULO DOS CLIENTES DESATIVADOS ---
+    total_desativados_vencidas = totais['desativado_vencido']
+    total_desativados_a_vencer = totais['desativado_a_vencer']
+    qtd_desativados_vencidas = quantidades['desativado_vencido']
+    qtd_desativados_a_vencer = quantidades['desativado_a_vencer']
+
+    # Total de pagamentos desativados
+    total_pagamentos_desativados = Pagamento.objects.filter(
+        filtro_credfacil(),
+        venda__in=vendas,
+        desativado=True
+    ).count()
+
+    # --- CÁLCULO DO VALOR TOTAL DE REPASSES ---
+    repasses_por_loja = {
+        item['venda__loja__nome']: item['total'] or 0
+        for item in ProdutoVenda.objects.filter(venda__in=vendas).values('venda__loja__nome').annotate(
+            total=Sum('produto__valor_repasse_logista')
+        ).order_by()
+    }
+    total_repasses = sum(repasses_por_loja.values())
+
+    return {
+        'loja_get': int(loja_get) if loja_get else None,
+        'lojas': Loja.objects.all(),
+        'total_vendas_loja': total_vendas,
+        'total_de_parcelas_geral': total_geral_parcelas,
+        'parcelas_vencidas': total_de_parcelas_vencidas,
+        'parcelas_pagas': total_de_parcelas_pagas,
+        'parcelas_a_vencer': total_de_parcelas_a_vencer,
+        'valor_total_parcelas': total_pagas + total_vencidas + total_a_vencer,
+        'total_pagas': total_pagas,
+        'total_vencidas': total_vencidas,
+        'total_a_vencer': total_a_vencer,
+        'total_desativados_vencidas': total_desativados_vencidas,
+        'total_desativados_a_vencer': total_desativados_a_vencer,
+        'qtd_desativados_vencidas': qtd_desativados_vencidas,
+        'qtd_desativados_a_vencer': qtd_desativados_a_vencer,
+        'total_pagamentos_desativados': total_pagamentos_desativados,
+        'total_repasses': total_repasses,
+        'repasses_por_loja': repasses_por_loja,
+        'dados_lojas': json.dumps(valores_por_loja, default=str),
+        'dash_mensal_lojas': json.dumps(dash_mensal_json, default=str) if loja_get else None,
+    }
+
+
+# --- GERAÇÃO EM SEGUNDO PLANO ---
+
+# permissão exigida para enfileirar cada tipo (conferida de novo pelo worker ao gerar)
+PERMISSOES_RELATORIO = {
+    'vendas': 'vendas.can_generate_report_sale',
+    'solicitacoes': 'vendas.can_generate_report_sale',
+    'contas_a_receber': 'vendas.can_genarate_report_payments',
+    'graficos': None,
+}
+
+# tipos que só existem como página (sem exportação CSV/XLSX)
+TIPOS_SOMENTE_HTML = ('graficos',)
+
+
+class RelatorioVazio(Exception):
+    pass
+
+
+def _parametros(job):
+    parametros = QueryDict(mutable=True)
+    for campo, valores in job.parametros.items():
+        parametros.setlist(campo, valores)
+    return parametros
+
+
+def _gerar_solicitacoes(parametros, usuario, loja_id, formato):
+    solicitacoes, loja = filtrar_solicitacoes(parametros, usuario, loja_id)
+    if not solicitacoes.exists():
+        raise RelatorioVazio('Nenhuma solicitação encontrada com os filtros informados')
+    if formato != 'html':
+        return gerar_arquivo(exportacao_solicitacoes(solicitacoes), COLUNAS_SOLICITACOES, formato).read()
+    return render_to_string(TEMPLATE_SOLICITACOES, contexto_solicitacoes(solicitacoes, parametros, loja))
+
+
+def _gerar_vendas(parametros, usuario, loja_id, formato):
+    vendas, loja = filtrar_vendas(parametros, usuario, loja_id)
+    if not vendas.exists():
+        raise RelatorioVazio('Nenhuma venda encontrada com os filtros informados')
+    if formato != 'html':
+        return gerar_arquivo(exportacao_vendas(vendas), COLUNAS_VENDAS, formato).read()
+    return render_to_string(TEMPLATE_VENDAS, contexto_vendas(vendas, parametros, loja))
+
+
+def _gerar_contas_a_receber(parametros, usuario, loja_id, formato):
+    contas_a_receber = filtrar_contas_a_receber(parametros)
+    if formato != 'html':
+        return gerar_arquivo(exportacao_contas_a_receber(contas_a_receber), COLUNAS_CONTAS_A_RECEBER, formato).read()
+    return ''.join(partes_contas_a_receber(contexto_contas_a_receber(contas_a_receber, parametros)))
+
+
+def _gerar_graficos(parametros, usuario, loja_id, formato):
+    return render_to_string(TEMPLATE_GRAFICOS, dict(contexto_graficos(parametros.get('loja')), user=usuario))
+
+
+GERADORES = {
+    'vendas': _gerar_vendas,
+    'solicitacoes': _gerar_solicitacoes,
+    'contas_a_receber': _gerar_contas_a_receber,
+    'graficos': _gerar_graficos,
+}
+
+
+def renderizar_relatorio(job):
+    """Gera o conteúdo do relatório com os filtros e as permissões do usuário do job."""
+    permissao = PERMISSOES_RELATORIO[job.tipo]
+    if permissao and not job.criado_por.has_perm(permissao):
+        raise RelatorioVazio('Você não tem permissão para gerar este relatório.')
+    conteudo = GERADORES[job.tipo](_parametros(job), job.criado_por, job.loja_id, job.formato)
+    return conteudo.encode() if isinstance(conteudo, str) else conteudo
+
+
+def notificar_usuario(job):
+    usuario = job.criado_por
+    if job.status == 'concluido':
+        verb = f'{job.get_tipo_display()} pronto'
+        descricao = f'O relatório solicitado em {timezone.localtime(job.criado_em).strftime("%d/%m às %H:%M")} está disponível para download.'
+    else:
+        verb = f'Falha ao gerar {job.get_tipo_display()}'
+        descricao = job.erro or 'Não foi possível gerar o relatório.'
+
+    notificar_usuarios(
+        [usuario.pk],
+        job,
+        verb=verb,
+        description=descricao,
+        target=job,
+        target_url=job.get_absolute_url() if job.status == 'concluido' else None,
+        type_notification='relatorio',
+    )
+
+
+def executar_relatorio_job(job_id):
+    """Ponto de entrada dos processos do worker: gera (ou reaproveita) o arquivo do job."""
+    from vendas.models import RelatorioJob
+
+    close_old_connections()
+    job = RelatorioJob.objects.select_related('criado_por').get(pk=job_id)
+
+    cache = RelatorioJob.resultado_em_cache(job.chave)
+    try:
+        if cache:
+            job.arquivo.name = cache.arquivo.name
+        else:
+            conteudo = renderizar_relatorio(job)
+            nome = f'{job.tipo}_{job.pk}_{timezone.localtime().strftime("%Y%m%d_%H%M")}.{job.formato}'
+            job.arquivo.save(nome, ContentFile(conteudo), save=False)
+        job.status = 'concluido'
+        job.erro = None
+    except RelatorioVazio as erro:
+        job.status = 'erro'
+        job.erro = str(erro)
+    except Exception as erro:
+        logger.exception('Erro ao gerar o relatório %s', job_id)
+        job.status = 'erro'
+        job.erro = f'Erro inesperado: {erro}'
+
+    # arquivo reaproveitado: conta a partir da geração original, senão o cache nunca expiraria
+    job.concluido_em = cache.concluido_em if cache and job.status == 'concluido' else timezone.now()
+    job.save(update_fields=['arquivo', 'status', 'erro', 'concluido_em', 'modificado_em'])
+
+    try:
+        notificar_usuario(job)
+    except Exception:
+        logger.exception('Erro ao notificar o relatório %s', job_id)
+    return job.status
+
+
+def nome_download(job):
+    return f'{job.tipo}_{timezone.localtime(job.criado_em).strftime("%Y%m%d_%H%M")}{os.path.splitext(job.arquivo.name)[1]}'
@@ -0,0 +1,212 @@
+"""
+Geração da venda CredFácil a partir de uma análise de crédito aprovada.
+
+Toda a geração roda em uma transação: a análise, o RENAVAM e os cadastros do CPF são
+travados com select_for_update, então duas requisições para o mesmo RENAVAM, a mesma
+análise ou o mesmo CPF não geram duas vendas: a segunda espera a primeira e encontra o
+RENAVAM já vendido ou o CPF sem as parcelas pagas exigidas.
+"""
+import calendar
+import re
+from datetime import date
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from estoque.models import EstoqueImei
+from .models import AnaliseCreditoCliente, Caixa, Cliente, Loja, Pagamento, ProdutoVenda, SituacaoCreditoCpf, TipoPagamento, Venda
+
+CHAVE_DADOS_FIXOS = 'vendas:geracao_venda:dados_fixos'
+# os sinais de Loja e TipoPagamento limpam a chave; o tempo limita a defasagem entre processos
+TEMPO_DADOS_FIXOS = 300
+
+
+class VendaNaoGerada(Exception):
+    """Motivo (mensagem ao usuário) e a página para onde voltar."""
+
+    def __init__(self, mensagem, destino='vendas:cliente_list', **kwargs_destino):
+        super().__init__(mensagem)
+        self.destino = destino
+        self.kwargs_destino = kwargs_destino
+
+
+def dados_fixos():
+    """Loja CredFácil, percentuais de desconto por número de parcelas e tipos ENTRADA/CREDFACIL (em cache)."""
+    dados = cache.get(CHAVE_DADOS_FIXOS)
+    if dados is None:
+        credfacil = Loja.objects.filter(nome__icontains='CREDFÁCIL').first()
+        tipos = {
+            nome.upper(): pk for pk, nome in
+            TipoPagamento.objects.filter(Q(nome__iexact='ENTRADA') | Q(nome__iexact='CREDFACIL')).values_list('pk', 'nome')
+        }
+        dados = {
+            'loja_credfacil_id': credfacil.pk if credfacil else None,
+            'descontos': {
+                str(parcelas): getattr(credfacil, f'porcentagem_desconto_{parcelas}')
+                for parcelas in ServicoGeracaoVenda.PARCELAS
+            } if credfacil else {},
+            'tipo_entrada_id': tipos.get('ENTRADA'),
+            'tipo_credfacil_id': tipos.get('CREDFACIL'),
+        }
+        cache.set(CHAVE_DADOS_FIXOS, dados, TEMPO_DADOS_FIXOS)
+    return dados
+
+
+def limpar_dados_fixos():
+    cache.delete(CHAVE_DADOS_FIXOS)
+
+
+def calcular_data_primeira_parcela(data_pagamento_str):
+    """
+    Retorna a data com o dia escolhido (05 ou 15) mais distante possível,
+    mas ainda dentro de até 40 dias após a data da compra.
+    """
+    hoje = timezone.now().date()
+    dia_escolhido = int(data_pagamento_str)
+    max_dias = 40
+    ano, mes = hoje.year, hoje.month
+
+    melhor_data = None
+    maior_diferenca = -1
+
+    # Verifica até 3 meses à frente
+    for i in range(3):
+        novo_mes = mes + i
+        novo_ano = ano + (novo_mes - 1) // 12
+        novo_mes = ((novo_mes - 1) % 12) + 1
+
+        # Verifica se o mês tem o dia escolhido
+        ultimo_dia_mes = calendar.monthrange(novo_ano, novo_mes)[1]
+        dia_real = min(dia_escolhido, ultimo_dia_mes)
+
+        data_candidata = date(novo_ano, novo_mes, dia_real)
+        dias_ate_parcela = (data_candidata - hoje).days
+
+        if 0 < dias_ate_parcela <= max_dias:
+            if dias_ate_parcela > maior_diferenca:
+                melhor_data = data_candidata
+                maior_diferenca = dias_ate_parcela
+
+    return melhor_data
+
+
+class ServicoGeracaoVenda:
+    PARCELAS = (4, 6, 8, 10, 12, 14)
+
+    def __init__(self, cliente, usuario):
+        self.cliente = cliente
+        self.usuario = usuario
+
+    def validar_cpf(self):
+        """
+        Trava os cadastros do CPF, então duas vendas do mesmo CPF (análises diferentes) são geradas
+        uma de cada vez, e calcula a situação na hora: a tabela SituacaoCreditoCpf só é atualizada
+        depois do commit e não veria a venda que a outra transação acabou de gravar.
+        """
+        cpf = re.sub(r'\D', '', self.cliente.cpf)
+        list(Cliente.objects.select_for_update().filter(cpf=cpf).values_list('pk', flat=True))
+        situacao = SituacaoCreditoCpf.calcular(cpf)
+        if situacao and not situacao.apto_nova_venda:
+            raise VendaNaoGerada(
+                "❌ Para gerar uma nova venda, cada venda anterior do mesmo CPF deve ter pelo menos 3 parcelas pagas."
+            )
+
+    def travar_analise(self):
+        # trava só a análise: loja e produto vêm no join, mas não precisam ficar presos
+        analise = AnaliseCreditoCliente.objects.select_for_update(of=('self',)).select_related('loja', 'produto').filter(
+            cliente=self.cliente
+        ).first()
+        if not analise or analise.status != 'A':
+            raise VendaNaoGerada("❌ Análise de crédito não aprovada para o cliente.")
+        if not analise.renavam_id:
+            raise VendaNaoGerada(
+                "❌ Nenhum RENAVAM associado à análise de crédito. Informe o RENAVAM antes de gerar a venda.",
+                'vendas:cliente_update', pk=self.cliente.pk,
+            )
+        if analise.status_aplicativo != 'L':
+            raise VendaNaoGerada(
+                "❌ RENAVAM e placa não foram informados pelo analista. Aguarde o analista informar esses dados.",
+                'vendas:cliente_update', pk=self.cliente.pk,
+            )
+        if analise.venda_id:
+            raise VendaNaoGerada("❌ Essa solicitação já foi convertida em venda.")
+        if analise.numero_parcelas not in {str(parcelas) for parcelas in self.PARCELAS}:
+            raise VendaNaoGerada("❌ Número de parcelas da análise de crédito inválido.")
+        return analise
+
+    def travar_renavam(self, analise):
+        renavam = EstoqueImei.objects.select_for_update().get(pk=analise.renavam_id)
+        if renavam.vendido:
+            raise VendaNaoGerada("❌ RENAVAM já vendido. Altere o RENAVAM para continuar.")
+        return renavam
+
+    def gerar(self):
+        dados = dados_fixos()
+        if not dados['loja_credfacil_id']:
+            raise VendaNaoGerada("❌ Loja ou cliente não encontrado.")
+        if not dados['tipo_entrada_id'] or not dados['tipo_credfacil_id']:
+            raise VendaNaoGerada("❌ Tipos de pagamento ENTRADA e CREDFACIL não cadastrados.")
+
+        with transaction.atomic():
+            # travas primeiro e só depois as leituras comuns: no MySQL (REPEATABLE READ) a primeira
+            # leitura sem trava fixa o que a transação enxerga
+            analise = self.travar_analise()
+            renavam = self.travar_renavam(analise)
+            self.validar_cpf()
+            caixa = Caixa.objects.filter(loja=analise.loja, data_fechamento__isnull=True).first()
+            if not caixa:
+                raise VendaNaoGerada(f"❌ Nenhum caixa aberto encontrado para a loja {analise.loja.nome}.")
+
+            produto = analise.produto
+            parcelas = int(analise.numero_parcelas)
+            valor_credfacil = getattr(produto, f'valor_{parcelas}_vezes')
+            agora = timezone.now()
+
+            venda = Venda.objects.create(
+                loja=analise.loja,  # Usa a loja da análise de crédito
+                cliente=self.cliente,
+                vendedor=self.usuario,
+                caixa=caixa,
+                repasse_logista=produto.valor_repasse_logista,
+                observacao=analise.observacao,
+                criado_por=self.usuario,
+                modificado_por=self.usuario,
+            )
+            analise.venda = venda
+            analise.save()
+
+            ProdutoVenda.objects.create(
+                loja=analise.loja,
+                venda=venda,
+                produto=produto,
+                renavam=renavam.renavam,
+                valor_unitario=valor_credfacil,
+                quantidade=1,
+                valor_desconto=0,
+            )
+
+            renavam.vendido = True
+            renavam.data_venda = agora
+            renavam.save()
+
+            # as parcelas de cada pagamento são gravadas em lote pelo sinal (Pagamento.gerar_parcelas)
+            Pagamento.objects.create(
+                loja=analise.loja,
+                venda=venda,
+                tipo_pagamento_id=dados['tipo_entrada_id'],
+                valor=produto.entrada_cliente,
+                parcelas=1,
+                data_primeira_parcela=agora.date(),
+            )
+            Pagamento.objects.create(
+                loja=analise.loja,
+                venda=venda,
+                tipo_pagamento_id=dados['tipo_credfacil_id'],
+                valor=valor_credfacil,
+                parcelas=parcelas,
+                data_primeira_parcela=calcular_data_primeira_parcela(analise.data_pagamento),
+                porcentagem_desconto=dados['descontos'][str(parcelas)],
+            )
+        return venda
@@ -1,59 +1,27 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save, pre_delete
 from django.dispatch import receiver
-from .models import Pagamento, Parcela
+from .models import (
+    Caixa, Cliente, LancamentoCaixaTotal, Loja, MovimentoCaixaLoja, Pagamento, Parcela, ResumoRecebiveisMensal, SituacaoCreditoCpf,
+    TipoPagamento, Venda,
+)
+from .services import limpar_dados_fixos
 from datetime import timedelta
-from notifications.signals import notify
-from .models import Parcela
-from notificacao.utils import enviar_ws_para_usuario
+from django.db.models import Exists, OuterRef
+from notifications.models import Notification
+from notificacao.utils import destinatarios, notificar_usuarios
 from django.contrib.auth import get_user_model
-from dateutil.relativedelta import relativedelta
 User = get_user_model()
 
 @receiver(post_save, sender=Pagamento)
 def criar_ou_atualizar_parcelas(sender, instance, created, **kwargs):
-    if created: 
-        for numero in range(1, instance.parcelas + 1):
-            Parcela.objects.create(
-                pagamento=instance,
-                numero_parcela=numero,
-                valor=instance.valor_parcela,
-                data_vencimento=calcular_data_vencimento(instance.data_primeira_parcela, numero),
-                criado_por=instance.criado_por,
-                modificado_por=instance.modificado_por
-            )
-    else:
-        update_fields = kwargs.get('update_fields', None)
-        
-        if update_fields is not None or update_fields == {'bloqueado', 'desativado', 'quitado', 'porcentagem_desconto'}:
-            return
-
-        Parcela.objects.filter(pagamento=instance).delete()
-
-        for numero in range(1, instance.parcelas + 1):
-            Parcela.objects.create(
-                pagamento=instance,
-                numero_parcela=numero,
-                valor=instance.valor_parcela,
-                data_vencimento=calcular_data_vencimento(instance.data_primeira_parcela, numero),
-                criado_por=instance.criado_por,
-                modificado_por=instance.modificado_por
-            )
-
-def calcular_data_vencimento(data_primeira_parcela, numero_parcela):
-    # Cada parcela é no mesmo dia do mês (5 ou 15), nos meses seguintes
-    # Se o dia não existir no mês, usa o último dia do mês
-    from datetime import date
-    import calendar
-    
-    dia_original = data_primeira_parcela.day
-    data_calculada = data_primeira_parcela + relativedelta(months=numero_parcela - 1)
-    
-    # Verifica se o dia existe no mês calculado
-    ultimo_dia_mes = calendar.monthrange(data_calculada.year, data_calculada.month)[1]
-    dia_final = min(dia_original, ultimo_dia_mes)
-    
-    return date(data_calculada.year, data_calculada.month, dia_final)
+    if created:
+        instance.gerar_parcelas(substituir=False)
+        return
 
+    update_fields = kwargs.get('update_fields', None)
+    if update_fields is not None:
+        return
+    instance.gerar_parcelas()
 
 
 @receiver(post_save, sender=Parcela)
@@ -64,39 +32,193 @@ def notificar_pagamento_parcela(sender, instance, created, **kwargs):
     if instance.pagamento_efetuado_em and not instance.pago:
         print("🧾 Mudou pagamento e ainda não está marcado como pago.")
         
-        admins = User.objects.filter(groups__name__in=["ADMINISTRADOR", "ANALISTA"]).exclude(id=instance.criado_por_id)
         pagamento = instance.pagamento
         cliente = pagamento.venda.cliente if hasattr(pagamento.venda, 'cliente') else "Cliente"
         
         descricao = f'Parcela {instance.numero_parcela} no valor de R$ {instance.valor} foi informada como paga em {instance.pagamento_efetuado_em.strftime("%d/%m às %H:%M")} e está pendente de análise.'
 
-        for admin in admins:
-            ja_existe = admin.notifications.unread().filter(
-                verb__icontains="Pagamento informado",
-                description=descricao,
-                target_object_id=pagamento.id,
-                target_content_type__model=pagamento._meta.model_name
-            ).exists()
-
-            if ja_existe:
-                continue
-
-            print(f"✅ Enviando notificação ao admin {admin.username}")
-            notify.send(
-                instance,
-                recipient=admin,
-                verb=f'Pagamento informado por {cliente.nome.capitalize()}',
-                description=descricao,
-                target=pagamento,
+        # quem já tem a mesma notificação não lida fica de fora
+        ja_notificados = Notification.objects.filter(
+            recipient=OuterRef('pk'),
+            unread=True,
+            verb__icontains="Pagamento informado",
+            description=descricao,
+            target_object_id=pagamento.id,
+            target_content_type__model=pagamento._meta.model_name,
+        )
+        admins = User.objects.filter(
+            pk__in=destinatarios("ADMINISTRADOR", "ANALISTA", excluir=instance.criado_por_id)
+        ).exclude(Exists(ja_notificados))
+
+        notificar_usuarios(
+            admins,
+            instance,
+            verb=f'Pagamento informado por {cliente.nome.capitalize()}',
+            description=descricao,
+            target=pagamento,
+            target_url=pagamento.get_absolute_url(),
+        )
+
+
+# --- RESUMO DE RECEBÍVEIS ---
+
+def _bucket_parcela(parcela):
+    loja_id = Pagamento.objects.filter(pk=parcela.pagamento_id).values_list('venda__loja_id', flat=True).first()
+    return (loja_id, parcela.data_vencimento)
+
+
+@receiver(pre_save, sender=Parcela)
+def guardar_vencimento_anterior(sender, instance, **kwargs):
+    instance._vencimento_anterior = None
+    if instance.pk:
+        instance._vencimento_anterior = Parcela.objects.filter(pk=instance.pk).values_list(
+            'data_vencimento', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Parcela)
+def atualizar_resumo_parcela(sender, instance, **kwargs):
+    loja_id, vencimento = _bucket_parcela(instance)
+    buckets = {(loja_id, vencimento)}
+    anterior = getattr(instance, '_vencimento_anterior', None)
+    if anterior:
+        buckets.add((loja_id, anterior))
+    ResumoRecebiveisMensal.agendar_recalculo(buckets)
+
+
+@receiver(pre_delete, sender=Parcela)
+def atualizar_resumo_parcela_excluida(sender, instance, **kwargs):
+    ResumoRecebiveisMensal.agendar_recalculo({_bucket_parcela(instance)})
+
+
+@receiver(post_save, sender=Pagamento)
+def atualizar_resumo_pagamento(sender, instance, created, **kwargs):
+    if created:
+        # as parcelas novas já agendam o próprio recálculo
+        return
+    ResumoRecebiveisMensal.agendar_recalculo(ResumoRecebiveisMensal.buckets_de_pagamentos([instance.pk]))
+
+
+@receiver(pre_save, sender=Venda)
+def guardar_venda_anterior(sender, instance, **kwargs):
+    """Valores gravados antes deste save (instance._anterior), usados pelos sinais de post_save."""
+    instance._anterior = {}
+    if instance.pk:
+        instance._anterior = Venda.objects.filter(pk=instance.pk).values(
+            *Venda.CAMPOS_MONITORADOS, 'cliente__cpf'
+        ).first() or {}
+
+
+@receiver(post_save, sender=Venda)
+def atualizar_resumo_venda(sender, instance, created, **kwargs):
+    if created:
+        return
+    buckets = ResumoRecebiveisMensal.buckets_de_pagamentos(instance.pagamentos.values('pk'))
+    loja_anterior = getattr(instance, '_anterior', {}).get('loja_id')
+    if loja_anterior and loja_anterior != instance.loja_id:
+        # a venda mudou de loja: os meses dela também precisam sair da loja antiga
+        buckets |= {(loja_anterior, mes) for _, mes in buckets}
+    ResumoRecebiveisMensal.agendar_recalculo(buckets)
+
+
+# --- SITUAÇÃO DE CRÉDITO POR CPF ---
+
+def _cpf_da_parcela(parcela):
+    # as parcelas criadas a partir do pagamento já trazem pagamento, venda e cliente em memória
+    if Parcela.pagamento.is_cached(parcela):
+        pagamento = parcela.pagamento
+        if Pagamento.venda.is_cached(pagamento) and Venda.cliente.is_cached(pagamento.venda):
+            return pagamento.venda.cliente.cpf
+    return Pagamento.objects.filter(pk=parcela.pagamento_id).values_list('venda__cliente__cpf', flat=True).first()
+
+
+@receiver(post_save, sender=Parcela)
+def atualizar_situacao_credito_parcela(sender, instance, **kwargs):
+    SituacaoCreditoCpf.agendar_recalculo({_cpf_da_parcela(instance)})
+
+
+@receiver(pre_delete, sender=Parcela)
+def atualizar_situacao_credito_parcela_excluida(sender, instance, **kwargs):
+    SituacaoCreditoCpf.agendar_recalculo({_cpf_da_parcela(instance)})
+
+
+@receiver(post_save, sender=Venda)
+def atualizar_situacao_credito_venda(sender, instance, **kwargs):
+    # se a venda trocou de cliente, o CPF anterior perde a venda
+    cpf_anterior = getattr(instance, '_anterior', {}).get('cliente__cpf')
+    SituacaoCreditoCpf.agendar_recalculo({instance.cliente.cpf, cpf_anterior})
+
+
+@receiver(pre_save, sender=Cliente)
+def guardar_cpf_anterior(sender, instance, **kwargs):
+    instance._cpf_anterior = None
+    if instance.pk:
+        instance._cpf_anterior = Cliente.objects.filter(pk=instance.pk).values_list('cpf', flat=True).first()
+
+
+@receiver(post_save, sender=Cliente)
+def atualizar_situacao_credito_cliente(sender, instance, created, **kwargs):
+    cpf_anterior = getattr(instance, '_cpf_anterior', None)
+    if not created and cpf_anterior != instance.cpf:
+        # as vendas do cliente passam do CPF antigo para o novo
+        SituacaoCreditoCpf.agendar_recalculo({cpf_anterior, instance.cpf})
+
+
+# --- DADOS FIXOS DA GERAÇÃO DE VENDA (cache) ---
+
+@receiver(post_save, sender=Loja)
+@receiver(post_delete, sender=Loja)
+@receiver(post_save, sender=TipoPagamento)
+@receiver(post_delete, sender=TipoPagamento)
+def limpar_cache_geracao_venda(sender, **kwargs):
+    limpar_dados_fixos()
+
+
+# --- LIVRO DO CAIXA TOTAL ---
+
+@receiver(post_save, sender=LancamentoCaixaTotal)
+def registrar_lancamento_caixa_total(sender, instance, **kwargs):
+    valor = instance.valor if instance.tipo_lancamento == '1' else -instance.valor
+    MovimentoCaixaLoja.sincronizar(
+        instance.loja_id, valor, 'lancamento', instance.motivo, user=instance.criado_por, lancamento=instance
+    )
+
+
+@receiver(pre_delete, sender=LancamentoCaixaTotal)
+def estornar_lancamento_caixa_total(sender, instance, **kwargs):
+    MovimentoCaixaLoja.sincronizar(
+        instance.loja_id, 0, 'ajuste', f'Estorno: {instance.motivo}', lancamento=instance
+    )
+
+
+@receiver(post_save, sender=Caixa)
+def sincronizar_fechamento_caixa(sender, instance, created, raw=False, **kwargs):
+    """
+    Mantém no livro o fechamento de caixas fechados ou reabertos por qualquer caminho (tela,
+    admin, shell): o caixa fechado é congelado e lançado; o reaberto tem o lançamento estornado.
+    """
+    if raw or not getattr(instance, '_sincronizar_livro', True):
+        return
+    if instance.data_fechamento:
+        if not instance.saldos_congelados:
+            # grava os totais e lança o saldo final (salva de novo sem passar por aqui)
+            instance.congelar_saldos(user=instance.modificado_por)
+        else:
+            MovimentoCaixaLoja.sincronizar(
+                instance.loja_id, instance.saldo_final(), 'caixa', f'Fechamento do {instance}',
+                user=instance.modificado_por, caixa=instance,
             )
+    elif not created and instance.movimentos_loja.exists():
+        # reaberto: estorna o fechamento e volta a usar os totais calculados
+        MovimentoCaixaLoja.sincronizar(
+            instance.loja_id, 0, 'ajuste', f'Reabertura do {instance}', user=instance.modificado_por, caixa=instance
+        )
+        if instance.saldos_congelados:
+            instance.saldos_congelados_em = None
+            Caixa.objects.filter(pk=instance.pk).update(saldos_congelados_em=None)
+
 
-            notification_obj = admin.notifications.unread().order_by('-timestamp').first()
-            if notification_obj:
-                enviar_ws_para_usuario(
-                    admin,
-                    instance=pagamento,
-                    notification_id=notification_obj.id,
-                    verb=f'Pagamento informado por {cliente.nome.capitalize()}',
-                    description=descricao,
-                    target_url=pagamento.get_absolute_url()
-                )
+@receiver(pre_delete, sender=Caixa)
+def estornar_fechamento_caixa(sender, instance, **kwargs):
+    if instance.movimentos_loja.exists():
+        MovimentoCaixaLoja.sincronizar(instance.loja_id, 0, 'ajuste', f'Estorno: exclusão do {instance}', caixa=instance)
@@ -1,3 +1,1063 @@
-from django.test import TestCase
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from financeiro.models import Repasse
+from financeiro.signals import _reconciliar_ciclos
+from produtos.models import Produto
+from vendas.models import (
+    AnaliseCreditoCliente, Caixa, Cliente, LancamentoCaixaTotal, Loja, MovimentoCaixaLoja, Pagamento,
+    Parcela, ProdutoVenda, RelatorioJob, ResumoRecebiveisMensal, SituacaoCreditoCpf, TipoPagamento, Venda,
+)
+from vendas.tests_utils import (
+    DadosBaseMixin, RelatorioTestMixin, criar_cliente, criar_dados_base, criar_venda_credfacil,
+)
+
+
+class ResumoRecebiveisTest(DadosBaseMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.hoje = timezone.now().date()
+        base = self.dados
+
+        # venda com parcelas vencidas, pagas e informadas
+        _, pagamento = criar_venda_credfacil(*base, self.hoje - timedelta(days=70))
+        parcelas = list(pagamento.parcelas_pagamento.order_by('data_vencimento'))
+        Parcela.objects.filter(pk=parcelas[0].pk).update(pago=True, valor_pago=parcelas[0].valor)
+        Parcela.objects.filter(pk=parcelas[1].pk).update(pagamento_efetuado=True)
+
+        # venda com todas as parcelas a vencer
+        criar_venda_credfacil(*base, self.hoje + timedelta(days=10), parcelas=4, valor=400)
+
+        # venda desativada (fica fora do resumo principal)
+        _, desativado = criar_venda_credfacil(*base, self.hoje - timedelta(days=40), parcelas=3, valor=300)
+        Pagamento.objects.filter(pk=desativado.pk).update(desativado=True)
+
+        # venda de outra loja não pode interferir
+        outra_loja = Loja.objects.create(nome='Outra Loja')
+        criar_venda_credfacil(self.usuario, outra_loja, Caixa.objects.create(loja=outra_loja), self.cliente,
+                              self.credfacil, self.hoje - timedelta(days=100))
+
+    def resumo_por_loop(self):
+        """Cálculo original do IndexView, parcela a parcela."""
+        resumo = dict.fromkeys(['qtd_total', 'qtd_pagas', 'qtd_vencidas', 'qtd_a_vencer'], 0)
+        resumo.update(dict.fromkeys(['valor_pagas', 'valor_vencidas', 'valor_a_vencer'], Decimal('0')))
+        for venda in Venda.objects.filter(loja=self.loja):
+            parcelas = list(Parcela.objects.filter(
+                pagamento__venda=venda,
+                pagamento__tipo_pagamento__nome='CREDFACIL',
+                pagamento__desativado=False,
+            ).order_by('data_vencimento')[:3])
+            grupos = {
+                'vencidas': [p for p in parcelas if p.data_vencimento < self.hoje and not p.pago and not p.pagamento_efetuado],
+                'pagas': [p for p in parcelas if p.pago and not p.pagamento_efetuado],
+                'a_vencer': [p for p in parcelas if p.data_vencimento >= self.hoje and not p.pago and not p.pagamento_efetuado],
+            }
+            resumo['qtd_total'] += len(parcelas)
+            for nome, itens in grupos.items():
+                resumo[f'qtd_{nome}'] += len(itens)
+                resumo[f'valor_{nome}'] += sum(p.valor for p in itens)
+        return resumo
+
+    def test_resumo_recebiveis_igual_ao_loop(self):
+        resumo = Parcela.objects.credfacil().filter(
+            pagamento__venda__loja=self.loja,
+            pagamento__desativado=False,
+        ).primeiras_por_venda(3).resumo_recebiveis(self.hoje)
+
+        self.assertEqual(resumo, self.resumo_por_loop())
+        self.assertEqual(resumo['qtd_total'], 6)
+
+    def test_resumo_desativados(self):
+        resumo = Parcela.objects.credfacil().filter(
+            pagamento__venda__loja=self.loja,
+        ).resumo_desativados(self.hoje)
+
+        abertas = Parcela.objects.filter(pagamento__venda__loja=self.loja, pagamento__desativado=True, pago=False)
+        vencidas = [p for p in abertas if p.data_vencimento < self.hoje]
+        a_vencer = [p for p in abertas if p.data_vencimento >= self.hoje]
+        self.assertEqual(resumo['qtd_vencidas'], len(vencidas))
+        self.assertEqual(resumo['qtd_a_vencer'], len(a_vencer))
+        self.assertEqual(resumo['valor_vencidas'], sum(p.valor for p in vencidas))
+        self.assertEqual(resumo['valor_a_vencer'], sum(p.valor for p in a_vencer))
+
+
+class RepassesStatusTest(TestCase):
+    """Compara o cálculo em lote dos ciclos de repasse com o cálculo original, loja a loja."""
+
+    QTD_LOJAS = 6
+    MESES = 6
+
+    @classmethod
+    def setUpTestData(cls):
+        usuario, loja_base, caixa, cliente, _ = criar_dados_base()
+        hoje = date.today()
+        cls.lojas = Loja.objects.bulk_create([Loja(nome=f'Loja {i}') for i in range(cls.QTD_LOJAS)])
+
+        vendas_por_data = {}
+        for delta in range(cls.MESES, -1, -1):
+            ano, mes = hoje.year, hoje.month - delta
+            while mes <= 0:
+                mes += 12
+                ano -= 1
+            for dia in (3, 5, 10, 16, 28):
+                data_venda = timezone.make_aware(datetime(ano, mes, dia, 12))
+                vendas = [
+                    Venda(loja=loja, cliente=cliente, vendedor=usuario, caixa=caixa,
+                          repasse_logista=Decimal(100 + i), is_deleted=(i == 1 and dia == 10))
+                    for i, loja in enumerate(cls.lojas)
+                    for _ in range(i % 3 + 1)
+                ]
+                vendas_por_data[data_venda] = [venda.pk for venda in Venda.objects.bulk_create(vendas)]
+        for data_venda, ids in vendas_por_data.items():
+            Venda.objects.filter(pk__in=ids).update(data_venda=data_venda)
+
+        # metade das lojas com repasse (um deles abaixo do calculado) no último ciclo passado
+        ciclo = [c for c in Loja.ciclos_repasse(cls.MESES, cls.MESES) if c[0] < hoje][-1][0]
+        Repasse.objects.bulk_create([
+            Repasse(loja=loja, valor=Decimal('1'), data=timezone.make_aware(datetime(ciclo.year, ciclo.month, ciclo.day, 12)),
+                    criado_por=usuario, atualizado_por=usuario)
+            for loja in cls.lojas[::2]
+        ])
+
+    def status_por_loop(self, loja, meses_atras):
+        """
+        Cálculo original de Loja.get_repasses_status (sem a marcação de parcial), com a aritmética
+        de meses e REPASSES_DIAS escrita aqui mesmo: não depende de Loja.ciclos_repasse.
+        """
+        hoje = date.today()
+        resultados = []
+        dias = Loja.REPASSES_DIAS
+        for delta in range(min(meses_atras, self.MESES), -1, -1):
+            ano, mes = hoje.year, hoje.month - delta
+            while mes <= 0:
+                mes += 12
+                ano -= 1
+            for idx, dia in enumerate(dias):
+                try:
+                    dt_atual = date(ano, mes, dia)
+                except ValueError:
+                    continue
+                if idx == 0:
+                    prev_mes, prev_ano = (mes - 1, ano) if mes > 1 else (12, ano - 1)
+                    dt_prev = date(prev_ano, prev_mes, dias[-1])
+                else:
+                    dt_prev = date(ano, mes, dias[idx - 1])
+                inicio, fim = dt_prev + timedelta(days=1), dt_atual
+
+                vendas_periodo = loja.venda_loja.filter(
+                    data_venda__date__gte=inicio, data_venda__date__lte=fim, is_deleted=False
+                )
+                qtd = vendas_periodo.count()
+                if qtd == 0:
+                    continue
+                valor = Decimal('0.00')
+                for venda in vendas_periodo:
+                    valor += venda.repasse_logista
+                resultados.append({
+                    'data': dt_atual,
+                    'inicio_periodo': inicio,
+                    'fim_periodo': fim,
+                    'qtd_vendas': qtd,
+                    'valor_total_repasse': valor,
+                    'feito': loja.repasse.filter(data__date=dt_atual).exists(),
+                })
+        atrasados = sum(1 for rep in resultados if not rep['feito'] and rep['data'] < hoje)
+        return resultados, atrasados
+
+    def test_lote_igual_ao_loop(self):
+        lojas = Loja.objects.filter(pk__in=[loja.pk for loja in self.lojas])
+        # uma consulta de ids, uma de vendas e uma de repasses (sem escrita), qualquer que seja o número de lojas
+        with self.assertNumQueries(3):
+            em_lote = lojas.repasses_status(meses_atras=self.MESES)
+        por_loop = {loja.pk: self.status_por_loop(loja, self.MESES) for loja in lojas}
+
+        self.assertEqual(em_lote, por_loop)
+        self.assertTrue(any(atrasados for _, atrasados in em_lote.values()))
+
+        Loja.objects.bulk_create([Loja(nome=f'Loja extra {i}') for i in range(3)])
+        with self.assertNumQueries(3):
+            Loja.objects.all().repasses_status(meses_atras=self.MESES)
+
+    def test_get_repasses_status_da_loja(self):
+        loja = self.lojas[1]
+        self.assertEqual(loja.get_repasses_status(meses_atras=1), self.status_por_loop(loja, 1))
+
+    def test_consulta_nao_altera_repasses(self):
+        Loja.objects.filter(pk__in=[loja.pk for loja in self.lojas]).repasses_status(meses_atras=self.MESES)
+        self.assertFalse(Repasse.objects.filter(status='parcial').exists())
+
+    def test_reconciliar_marca_parcial_e_e_idempotente(self):
+        self.assertEqual(Repasse.objects.reconciliar(), len(self.lojas[::2]))
+        self.assertEqual(Repasse.objects.filter(status='parcial').count(), len(self.lojas[::2]))
+        self.assertEqual(Repasse.objects.reconciliar(), 0)
+
+    def test_salvar_repasse_reconcilia_o_ciclo(self):
+        repasse = Repasse.objects.filter(loja=self.lojas[0]).get()
+        repasse.save()
+        repasse.refresh_from_db()
+        self.assertEqual(repasse.status, 'parcial')
+        self.assertEqual(Repasse.objects.filter(status='parcial').count(), 1)
+
+        # coberto o ciclo, volta ao status lançado (pendente), e não a 'pago'
+        repasse.valor = Decimal('100000')
+        repasse.save()
+        repasse.refresh_from_db()
+        self.assertEqual((repasse.status, repasse.status_anterior), ('pendente', None))
+
+    def test_parcial_manual_nao_e_promovido(self):
+        repasse = Repasse.objects.filter(loja=self.lojas[0]).get()
+        Repasse.objects.filter(pk=repasse.pk).update(status='parcial', valor=Decimal('100000'))
+        self.assertEqual(Repasse.objects.filter(pk=repasse.pk).reconciliar(), 0)
+
+    def test_venda_so_reconcilia_quando_muda_o_ciclo(self):
+        venda = Venda.objects.filter(loja=self.lojas[0], is_deleted=False).latest('data_venda')
+        with self.captureOnCommitCallbacks() as callbacks:
+            venda.observacao = 'sem efeito no repasse'
+            venda.save()
+        self.assertFalse([c for c in callbacks if getattr(c, 'func', None) is _reconciliar_ciclos])
+
+        venda.repasse_logista += 1
+        with self.captureOnCommitCallbacks() as callbacks:
+            venda.save()
+        self.assertEqual(len([c for c in callbacks if getattr(c, 'func', None) is _reconciliar_ciclos]), 1)
+
+
+@skipUnless(os.environ.get('BENCHMARK_REPASSES'), 'medição opcional: defina BENCHMARK_REPASSES=1')
+class RepassesStatusBenchmarkTest(RepassesStatusTest):
+    """
+    Os mesmos testes com 50 lojas x 6 meses (cerca de 3.500 vendas), mais a medição do lote
+    contra o loop original. Os tempos só são impressos: dependem da máquina e não viram asserção.
+    """
+    QTD_LOJAS = 50
+
+    def test_medir_lote_e_loop(self):
+        lojas = Loja.objects.filter(pk__in=[loja.pk for loja in self.lojas])
+        inicio = time.perf_counter()
+        em_lote = lojas.repasses_status(meses_atras=self.MESES)
+        tempo_lote = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        por_loop = {loja.pk: self.status_por_loop(loja, self.MESES) for loja in lojas}
+        tempo_loop = time.perf_counter() - inicio
+
+        self.assertEqual(em_lote, por_loop)
+        print(f'\nrepasses_status {self.QTD_LOJAS} lojas x {self.MESES} meses: '
+              f'lote {tempo_lote * 1000:.1f} ms, loop {tempo_loop * 1000:.1f} ms')
+
+
+class CalcularValorRepasseTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        usuario, cls.loja, caixa, cliente, _ = criar_dados_base()
+        moto = Produto.objects.create(nome='Moto', valor_repasse_logista=Decimal('1500.50'))
+        capacete = Produto.objects.create(nome='Capacete', valor_repasse_logista=Decimal('80'))
+        hoje = timezone.localtime()
+
+        itens = []
+        for dias in range(40):
+            # uma venda com repasse próprio e outra que depende do repasse dos produtos
+            for repasse, excluida in ((Decimal('250.75'), dias % 7 == 0), (Decimal('0'), dias % 5 == 0)):
+                venda = Venda.objects.create(
+                    loja=cls.loja, cliente=cliente, vendedor=usuario, caixa=caixa,
+                    repasse_logista=repasse, is_deleted=excluida,
+                )
+                Venda.objects.filter(pk=venda.pk).update(data_venda=hoje - timedelta(days=dias))
+                itens.append(ProdutoVenda(venda=venda, produto=moto, valor_unitario=Decimal('9000'), quantidade=1))
+                itens.append(ProdutoVenda(venda=venda, produto=capacete, valor_unitario=Decimal('150'), quantidade=dias % 3))
+        ProdutoVenda.objects.bulk_create(itens)
+        cls.hoje = hoje.date()
+
+    def valor_por_loop(self, data_inicio, data_fim):
+        """Cálculo original: percorre as vendas e, sem repasse_logista, os itens de cada uma."""
+        vendas = self.loja.venda_loja.filter(is_deleted=False)
+        if data_inicio:
+            vendas = vendas.filter(data_venda__date__gte=data_inicio)
+        if data_fim:
+            vendas = vendas.filter(data_venda__date__lte=data_fim)
+        return sum(
+            venda.repasse_logista if venda.repasse_logista else sum(
+                produto.produto.valor_repasse_logista * produto.quantidade
+                for produto in ProdutoVenda.objects.filter(venda=venda)
+            )
+            for venda in vendas
+        )
+
+    def test_igual_ao_loop_em_qualquer_janela(self):
+        janelas = [
+            (self.hoje - timedelta(days=10), self.hoje),
+            (self.hoje - timedelta(days=25), None),
+            (None, self.hoje - timedelta(days=15)),
+            (None, None),
+            (self.hoje + timedelta(days=1), None),
+        ]
+        for data_inicio, data_fim in janelas:
+            with self.subTest(data_inicio=data_inicio, data_fim=data_fim):
+                with self.assertNumQueries(1):
+                    valor = self.loja.calcular_valor_repasse(data_inicio, data_fim)
+                self.assertEqual(valor, self.valor_por_loop(data_inicio, data_fim))
+
+
+class FolhaRelatorioVendasTest(RelatorioTestMixin, TestCase):
+    def criar_vendas(self, quantidade):
+        for _ in range(quantidade):
+            venda, _ = criar_venda_credfacil(*self.dados, primeira_parcela=date.today() + timedelta(days=30))
+            ProdutoVenda.objects.bulk_create([
+                ProdutoVenda(venda=venda, produto=self.produto, valor_unitario=Decimal('600'), quantidade=1),
+            ])
+
+    def gerar(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse('vendas:folha_venda_relatorio'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(consultas)
+
+    def test_consultas_nao_dependem_do_numero_de_vendas(self):
+        self.criar_vendas(2)
+        _, poucas = self.gerar()
+        self.criar_vendas(8)
+        response, muitas = self.gerar()
+
+        self.assertEqual(poucas, muitas)
+        self.assertEqual(response.context['total_vendas'], 10)
+        self.assertEqual(response.context['total_valor'], Decimal('6000'))
+        self.assertEqual(response.context['total_repasse'], Decimal('1000'))
+        self.assertEqual(response.context['total_juros'], Decimal('5000'))
+
+
+class FolhaRelatorioSolicitacoesTest(RelatorioTestMixin, TestCase):
+    # sessão, usuário, 2 de permissões, loja do usuário, exists, contagem, totais,
+    # lojas do cabeçalho, clientes (com joins) e vendas das análises (prefetch)
+    CONSULTAS = 11
+    def criar_solicitacoes(self, quantidade):
+        usuario, loja, caixa, _, credfacil = self.dados
+        analises = []
+        for _ in range(quantidade):
+            indice = Cliente.objects.count()
+            cliente = criar_cliente(loja, cpf=f'{indice:011d}', nome=f'Cliente {indice}')
+            venda, _ = criar_venda_credfacil(
+                usuario, loja, caixa, cliente, credfacil, primeira_parcela=date.today() + timedelta(days=30)
+            )
+            ProdutoVenda.objects.bulk_create([
+                ProdutoVenda(venda=venda, produto=self.produto, valor_unitario=Decimal('600'), quantidade=1),
+            ])
+            analises.append(AnaliseCreditoCliente(
+                cliente=cliente, produto=self.produto, numero_parcelas='6', status='A', venda=venda,
+                loja=loja, criado_por=usuario,
+            ))
+        AnaliseCreditoCliente.objects.bulk_create(analises)
+
+    def test_consultas_nao_dependem_do_numero_de_solicitacoes(self):
+        url = reverse('vendas:folha_solicitacao_relatorio')
+        usuario, loja, _, cliente, _ = self.dados
+        AnaliseCreditoCliente.objects.bulk_create([AnaliseCreditoCliente(
+            cliente=cliente, produto=self.produto, numero_parcelas='6', loja=loja, criado_por=usuario,
+        )])
+        self.criar_solicitacoes(2)
+        with self.assertNumQueries(self.CONSULTAS):
+            self.client.get(url)
+        self.criar_solicitacoes(8)
+        with self.assertNumQueries(self.CONSULTAS):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        # o cliente de criar_dados_base não tem venda
+        self.assertEqual(response.context['total_vendas'], 11)
+        self.assertEqual(response.context['total_valor'], Decimal('6000'))
+        self.assertEqual(response.context['total_repasse'], Decimal('1000'))
+        self.assertEqual(response.context['total_juros'], Decimal('5000'))
+        self.assertContains(response, 'R$ 500,00', count=10)
+
+    def test_totais_zerados_sem_vendas(self):
+        usuario, loja, _, cliente, _ = self.dados
+        AnaliseCreditoCliente.objects.bulk_create([AnaliseCreditoCliente(
+            cliente=cliente, produto=self.produto, numero_parcelas='6', loja=loja, criado_por=usuario,
+        )])
+        response = self.client.get(reverse('vendas:folha_solicitacao_relatorio'))
+        self.assertEqual(response.context['total_valor'], Decimal('0'))
+        self.assertContains(response, 'Total Juros: R$ 0,00')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RelatorioJobTest(RelatorioTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        venda, _ = criar_venda_credfacil(*self.dados, primeira_parcela=date.today() + timedelta(days=30))
+        ProdutoVenda.objects.bulk_create([
+            ProdutoVenda(venda=venda, produto=self.produto, valor_unitario=Decimal('600'), quantidade=1),
+        ])
+        self.url = reverse('vendas:relatorio_job_criar', args=['vendas'])
+
+    def executar(self, job):
+        from vendas.relatorios import executar_relatorio_job
+
+        # o worker roda fora de transação; aqui a conexão é a do próprio teste
+        with mock.patch('vendas.relatorios.close_old_connections'):
+            executar_relatorio_job(job.pk)
+        job.refresh_from_db()
+        return job
+
+    def test_get_nao_cria_job(self):
+        self.assertEqual(self.client.get(self.url, {'formato': 'xlsx'}).status_code, 405)
+        self.assertFalse(RelatorioJob.objects.exists())
+
+    def test_worker_gera_os_formatos_sem_executar_a_view(self):
+        self.client.post(self.url, {'formato': 'csv', 'csrfmiddlewaretoken': 'x'})
+        self.client.post(self.url)
+        csv, html = RelatorioJob.objects.order_by('pk')
+        self.assertEqual((csv.formato, csv.parametros), ('csv', {}))
+
+        csv, html = self.executar(csv), self.executar(html)
+        self.assertEqual((csv.status, html.status), ('concluido', 'concluido'))
+        self.assertIn('Cliente Teste', csv.arquivo.open('rb').read().decode('utf-8-sig'))
+        self.assertIn('Cliente Teste', html.arquivo.open('rb').read().decode())
+
+    def test_graficos_e_contas_a_receber(self):
+        from django.contrib.auth.models import Permission
+
+        self.dados[0].user_permissions.add(Permission.objects.get(codename='can_genarate_report_payments'))
+        hoje = date.today()
+        self.client.post(reverse('vendas:relatorio_job_criar', args=['graficos']), {'formato': 'xlsx'})
+        self.client.post(reverse('vendas:relatorio_job_criar', args=['contas_a_receber']), {
+            'data_inicial': hoje.isoformat(), 'data_final': (hoje + timedelta(days=90)).isoformat(), 'formato': 'csv',
+        })
+        graficos, contas = RelatorioJob.objects.order_by('pk')
+        self.assertEqual(graficos.formato, 'html')
+
+        graficos, contas = self.executar(graficos), self.executar(contas)
+        self.assertEqual((graficos.status, contas.status), ('concluido', 'concluido'))
+        self.assertIn('Cliente Teste', contas.arquivo.open('rb').read().decode('utf-8-sig'))
+
+        # a página continua saindo das mesmas funções
+        pagina = self.client.get(reverse('financeiro:relatorio_folha_contas_a_receber'), contas.parametros)
+        self.assertIn('Cliente Teste', b''.join(pagina.streaming_content).decode())
+
+    def test_contas_a_receber_em_lotes_por_pk(self):
+        from django.http import QueryDict
+        from financeiro.relatorios import filtrar_contas_a_receber, lotes_por_pk
+
+        for _ in range(4):
+            criar_venda_credfacil(*self.dados, primeira_parcela=date.today() + timedelta(days=30))
+        parametros = QueryDict(mutable=True)
+        parametros.update({'data_inicial': date.today().isoformat(), 'data_final': (date.today() + timedelta(days=90)).isoformat()})
+        contas = filtrar_contas_a_receber(parametros)
+        esperado = sorted(contas.values_list('pk', flat=True))
+        self.assertEqual(len(esperado), 5)
+
+        with self.assertNumQueries(2):
+            lotes = [[conta.pk for conta in lote] for lote in lotes_por_pk(contas, 3)]
+        self.assertEqual(lotes, [esperado[:3], esperado[3:]])
+
+    @override_settings(RELATORIO_CACHE_SEGUNDOS=600)
+    def test_copia_do_cache_nao_renova_a_janela(self):
+        def envelhecer(minutos):
+            for job in RelatorioJob.objects.all():
+                RelatorioJob.objects.filter(pk=job.pk).update(concluido_em=job.concluido_em - timedelta(minutes=minutos))
+
+        self.client.post(self.url, {'formato': 'csv'})
+        gerado = self.executar(RelatorioJob.objects.get())
+        envelhecer(9)
+
+        self.client.post(self.url, {'formato': 'csv'})
+        copia = RelatorioJob.objects.latest('pk')
+        gerado.refresh_from_db()
+        self.assertEqual(copia.status, 'concluido')
+        self.assertEqual((copia.arquivo.name, copia.concluido_em), (gerado.arquivo.name, gerado.concluido_em))
+
+        # dez minutos depois da geração o arquivo não serve mais, mesmo com a cópia recente
+        envelhecer(2)
+        self.client.post(self.url, {'formato': 'csv'})
+        self.assertEqual(RelatorioJob.objects.latest('pk').status, 'pendente')
+
+    def test_filtros_sem_resultado_viram_erro(self):
+        self.client.post(self.url, {'data_inicial': '2000-01-01', 'data_final': '2000-01-31'})
+        job = self.executar(RelatorioJob.objects.get())
+        self.assertEqual((job.status, job.erro), ('erro', 'Nenhuma venda encontrada com os filtros informados'))
+
+    def test_jobs_travados_voltam_para_a_fila(self):
+        self.client.post(self.url)
+        self.client.post(self.url, {'formato': 'csv'})
+        travado, esgotado = RelatorioJob.objects.order_by('pk')
+        antigo = timezone.now() - timedelta(hours=1)
+        RelatorioJob.objects.filter(pk=travado.pk).update(status='processando', iniciado_em=antigo, tentativas=1)
+        RelatorioJob.objects.filter(pk=esgotado.pk).update(
+            status='processando', iniciado_em=antigo, tentativas=RelatorioJob.TENTATIVAS_MAXIMAS,
+        )
+
+        self.assertEqual(RelatorioJob.recuperar_travados(), (1, 1))
+        travado.refresh_from_db()
+        esgotado.refresh_from_db()
+        self.assertEqual((travado.status, travado.iniciado_em), ('pendente', None))
+        self.assertEqual(esgotado.status, 'erro')
+
+
+class SituacaoCreditoCpfTest(DadosBaseMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.hoje = timezone.now().date()
+        # mesmo CPF cadastrado em outra loja
+        outra_loja = Loja.objects.create(nome='Outra Loja')
+        self.outro_cadastro = criar_cliente(outra_loja, cpf=self.cliente.cpf)
+        with self.captureOnCommitCallbacks(execute=True):
+            _, self.pagamento = criar_venda_credfacil(
+                self.usuario, self.loja, self.caixa, self.cliente, self.credfacil, self.hoje - timedelta(days=70)
+            )
+            _, self.outro_pagamento = criar_venda_credfacil(
+                self.usuario, outra_loja, Caixa.objects.create(loja=outra_loja), self.outro_cadastro,
+                self.credfacil, self.hoje + timedelta(days=5),
+            )
+
+    def apto_pela_consulta(self):
+        """Regra original do gerar_venda, com Count correlacionado por venda."""
+        from django.db.models import Count, Q
+
+        return not Venda.objects.filter(cliente__cpf=self.cliente.cpf, is_deleted=False).annotate(
+            parcelas_pagas=Count(
+                'pagamentos__parcelas_pagamento',
+                filter=Q(pagamentos__tipo_pagamento__nome__iexact='CREDFACIL', pagamentos__parcelas_pagamento__pago=True),
+                distinct=True,
+            )
+        ).filter(parcelas_pagas__lt=3).exists()
+
+    def pagar(self, pagamento, quantidade):
+        with self.captureOnCommitCallbacks(execute=True):
+            for parcela in pagamento.parcelas_pagamento.filter(pago=False).order_by('data_vencimento')[:quantidade]:
+                parcela.pago = True
+                parcela.save()
+
+    def situacao(self):
+        with self.assertNumQueries(1):
+            return SituacaoCreditoCpf.objects.get(pk=self.cliente.cpf)
+
+    def test_mantida_pelas_parcelas(self):
+        situacao = self.situacao()
+        self.assertEqual(situacao.vendas, 2)
+        self.assertEqual(situacao.vendas_em_aberto, 2)
+        self.assertEqual(situacao.menor_parcelas_pagas, 0)
+        self.assertEqual(situacao.parcelas_em_atraso, 3)
+        self.assertEqual(situacao.primeiro_vencimento_em_aberto, self.hoje - timedelta(days=70))
+        self.assertFalse(situacao.apto_nova_venda)
+
+        self.pagar(self.pagamento, 3)
+        self.assertEqual(self.situacao().parcelas_em_atraso, 0)
+        self.assertEqual(self.situacao().apto_nova_venda, self.apto_pela_consulta())
+        self.assertFalse(self.situacao().apto_nova_venda)
+
+        self.pagar(self.outro_pagamento, 3)
+        self.assertTrue(self.situacao().apto_nova_venda)
+        self.assertEqual(self.situacao().apto_nova_venda, self.apto_pela_consulta())
+
+    def test_venda_excluida_sai_da_situacao(self):
+        self.pagar(self.pagamento, 3)
+        venda = self.outro_pagamento.venda
+        venda.is_deleted = True
+        with self.captureOnCommitCallbacks(execute=True):
+            venda.save()
+        self.assertEqual(self.situacao().vendas, 1)
+        self.assertTrue(self.situacao().apto_nova_venda)
+
+    def test_troca_de_cpf_refaz_os_dois_cpfs(self):
+        novo_cpf = '98765432100'
+        self.outro_cadastro.cpf = novo_cpf
+        with self.captureOnCommitCallbacks(execute=True):
+            self.outro_cadastro.save()
+        self.assertEqual(self.situacao().vendas, 1)
+        self.assertEqual(SituacaoCreditoCpf.objects.get(pk=novo_cpf).vendas, 1)
+
+        # a venda volta para um cadastro com o CPF original
+        venda = self.outro_pagamento.venda
+        venda.cliente = self.cliente
+        with self.captureOnCommitCallbacks(execute=True):
+            venda.save()
+        self.assertEqual(self.situacao().vendas, 2)
+        self.assertFalse(SituacaoCreditoCpf.objects.filter(pk=novo_cpf).exists())
+
+    def test_reconstruir_e_obter(self):
+        esperado = self.situacao()
+        SituacaoCreditoCpf.objects.all().delete()
+        self.assertEqual(SituacaoCreditoCpf.obter(self.cliente.cpf).menor_parcelas_pagas, esperado.menor_parcelas_pagas)
+        SituacaoCreditoCpf.objects.all().delete()
+        self.assertEqual(SituacaoCreditoCpf.reconstruir(), 1)
+        self.assertEqual(self.situacao().parcelas_em_atraso, esperado.parcelas_em_atraso)
+        self.assertIsNone(SituacaoCreditoCpf.obter('00000000000'))
+
+    def test_calcular_sem_gravar(self):
+        esperado = self.situacao()
+        SituacaoCreditoCpf.objects.all().delete()
+        situacao = SituacaoCreditoCpf.calcular(self.cliente.cpf)
+        for campo in SituacaoCreditoCpf.CAMPOS_CALCULADOS:
+            self.assertEqual(getattr(situacao, campo), getattr(esperado, campo), campo)
+        self.assertFalse(SituacaoCreditoCpf.objects.exists())
+        self.assertIsNone(SituacaoCreditoCpf.calcular('00000000000'))
+
+
+class GerarParcelasTest(DadosBaseMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # os recálculos agendados no commit ficariam presos na transação do teste
+        with self.captureOnCommitCallbacks(execute=True):
+            self.venda = Venda.objects.create(
+                loja=self.loja, cliente=self.cliente, vendedor=self.usuario, caixa=self.caixa, repasse_logista=Decimal('100')
+            )
+
+    def test_venda_14x_com_um_insert_de_parcelas(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as consultas:
+            pagamento = Pagamento.objects.create(
+                loja=self.loja, venda=self.venda, tipo_pagamento=self.credfacil, valor=Decimal('1400'), parcelas=14,
+                data_primeira_parcela=date(2024, 1, 31),
+            )
+        inserts = [q['sql'] for q in consultas.captured_queries if q['sql'].startswith('INSERT INTO "vendas_parcela"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertFalse([q for q in consultas.captured_queries if q['sql'].startswith('DELETE')])
+
+        parcelas = list(pagamento.parcelas_pagamento.order_by('numero_parcela'))
+        self.assertEqual([p.numero_parcela for p in parcelas], list(range(1, 15)))
+        self.assertEqual(parcelas[1].data_vencimento, date(2024, 2, 29))
+        self.assertEqual(parcelas[13].data_vencimento, date(2025, 2, 28))
+        self.assertTrue(all(p.valor == Decimal('100') and p.loja_id == self.loja.pk for p in parcelas))
+
+    def test_simular_nao_grava(self):
+        pagamento = Pagamento(
+            loja=self.loja, venda=self.venda, tipo_pagamento=self.credfacil, valor=Decimal('600'), parcelas=6,
+            data_primeira_parcela=date(2024, 1, 15),
+        )
+        with self.assertNumQueries(0):
+            previa = pagamento.gerar_parcelas(simular=True)
+        self.assertEqual([p.data_vencimento.month for p in previa], [1, 2, 3, 4, 5, 6])
+        self.assertFalse(Parcela.objects.exists())
+
+    def test_editar_pagamento_refaz_as_parcelas_e_os_resumos(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            pagamento = Pagamento.objects.create(
+                loja=self.loja, venda=self.venda, tipo_pagamento=self.credfacil, valor=Decimal('600'), parcelas=6,
+                data_primeira_parcela=date.today() - timedelta(days=45),
+            )
+        self.assertEqual(SituacaoCreditoCpf.objects.get(pk=self.cliente.cpf).parcelas_em_atraso, 2)
+        self.assertEqual(ResumoRecebiveisMensal.objects.filter(estado='vencido').aggregate(total=Sum('quantidade'))['total'], 2)
+
+        pagamento.parcelas = 3
+        with self.captureOnCommitCallbacks(execute=True):
+            pagamento.save()
+        self.assertEqual(pagamento.parcelas_pagamento.count(), 3)
+        self.assertEqual(ResumoRecebiveisMensal.objects.aggregate(total=Sum('quantidade'))['total'], 3)
+
+
+class ResumoRecebiveisMensalTest(DadosBaseMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.hoje = timezone.now().date()
+
+    def criar_venda(self, primeira_parcela):
+        with self.captureOnCommitCallbacks(execute=True):
+            return criar_venda_credfacil(
+                self.usuario, self.loja, self.caixa, self.cliente, self.credfacil, primeira_parcela
+            )
+
+    def test_um_recalculo_por_transacao(self):
+        _, pagamento = self.criar_venda(self.hoje - timedelta(days=45))
+        with self.captureOnCommitCallbacks() as callbacks:
+            for parcela in pagamento.parcelas_pagamento.all():
+                parcela.pago = True
+                parcela.save()
+        # um para o resumo de recebíveis e um para a situação de crédito do CPF
+        agendados = [c for c in callbacks if c.__qualname__.startswith('_agendar_no_commit')]
+        self.assertEqual(len(agendados), 2)
+
+    def test_rollback_descarta_os_pendentes(self):
+        _, pagamento = self.criar_venda(self.hoje - timedelta(days=45))
+        primeira, segunda = pagamento.parcelas_pagamento.order_by('data_vencimento')[:2]
+        try:
+            with transaction.atomic():
+                primeira.pago = True
+                primeira.save()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+
+        with mock.patch.object(ResumoRecebiveisMensal, 'recalcular') as recalcular:
+            with self.captureOnCommitCallbacks(execute=True):
+                segunda.pago = True
+                segunda.save()
+        recalcular.assert_called_once_with({(self.loja.pk, segunda.data_vencimento)})
+
+    def test_troca_de_loja_refaz_as_duas_lojas(self):
+        venda, _ = self.criar_venda(self.hoje + timedelta(days=10))
+        outra_loja = Loja.objects.create(nome='Outra Loja')
+        self.assertTrue(ResumoRecebiveisMensal.objects.filter(loja=self.loja).exists())
+
+        venda.loja = outra_loja
+        with self.captureOnCommitCallbacks(execute=True):
+            venda.save()
+        self.assertFalse(ResumoRecebiveisMensal.objects.filter(loja=self.loja).exists())
+        self.assertEqual(
+            ResumoRecebiveisMensal.objects.filter(loja=outra_loja).aggregate(total=Sum('quantidade'))['total'], 6
+        )
+
+    def test_painel_nao_grava_o_resumo(self):
+        self.criar_venda(self.hoje - timedelta(days=45))
+        ResumoRecebiveisMensal.objects.update(data_referencia=self.hoje - timedelta(days=1))
+        self.client.force_login(self.usuario)
+        self.client.get(reverse('vendas:grafico'))
+        self.assertFalse(ResumoRecebiveisMensal.objects.filter(data_referencia=self.hoje).exists())
+
+        call_command('reconstruir_resumo_recebiveis', stdout=StringIO())
+        self.assertFalse(ResumoRecebiveisMensal.objects.exclude(data_referencia=self.hoje).exists())
+
+
+class LivroCaixaTotalTest(DadosBaseMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        LancamentoCaixaTotal.objects.create(loja=self.loja, motivo='Aporte', tipo_lancamento='1', valor=Decimal('100'))
+        # histórico anterior ao livro
+        MovimentoCaixaLoja.objects.all().delete()
+
+    def test_telas_nao_montam_o_livro(self):
+        self.usuario.is_superuser = True
+        self.usuario.save()
+        self.client.force_login(self.usuario)
+        sessao = self.client.session
+        sessao['loja_id'] = self.loja.pk
+        sessao.save()
+
+        resposta = self.client.get(reverse('vendas:caixa_total'))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertFalse(MovimentoCaixaLoja.objects.exists())
+
+    def test_caixa_fechado_reaberto_e_excluido_fora_da_tela(self):
+        from vendas.models import LancamentoCaixa
+
+        LancamentoCaixa.objects.create(caixa=self.caixa, motivo='Troco', tipo_lancamento='1', valor=Decimal('50'))
+        self.caixa.data_fechamento = date.today()
+        self.caixa.save()
+        self.assertEqual(MovimentoCaixaLoja.saldo_atual(self.loja), Decimal('150'))
+
+        self.caixa.data_fechamento = None
+        self.caixa.save()
+        self.assertEqual(MovimentoCaixaLoja.saldo_atual(self.loja), Decimal('100'))
+        self.caixa.refresh_from_db()
+        self.assertFalse(self.caixa.saldos_congelados)
+
+        self.caixa.data_fechamento = date.today()
+        self.caixa.save()
+        self.assertEqual(MovimentoCaixaLoja.saldo_atual(self.loja), Decimal('150'))
+        self.caixa.delete()
+        self.assertEqual(MovimentoCaixaLoja.saldo_atual(self.loja), Decimal('100'))
+
+    def test_comando_monta_apenas_lojas_sem_livro(self):
+        call_command('reconstruir_livro_caixa', '--novas', stdout=StringIO())
+        self.assertEqual(MovimentoCaixaLoja.saldo_atual(self.loja), Decimal('100'))
+
+        call_command('reconstruir_livro_caixa', '--novas', stdout=StringIO())
+        self.assertEqual(MovimentoCaixaLoja.objects.filter(loja=self.loja).count(), 1)
+
+
+class ExportacaoMixinTest(TestCase):
+    def test_exporta_o_queryset_da_view_por_padrao(self):
+        from django.views.generic import ListView
+        from vendas.exportacao import ExportacaoMixin
+
+        class LojasView(ExportacaoMixin, ListView):
+            queryset = Loja.objects.order_by('nome')
+            colunas_exportacao = (('Loja', 'nome'),)
+
+        Loja.objects.create(nome='Loja B')
+        Loja.objects.create(nome='Loja A')
+        resposta = LojasView().exportar('csv')
+        conteudo = b''.join(resposta.streaming_content).decode('utf-8-sig')
+        self.assertEqual(conteudo.split(), ['Loja', 'Loja', 'A', 'Loja', 'B'])
+
+    def test_view_sem_queryset_precisa_sobrescrever(self):
+        from django.core.exceptions import ImproperlyConfigured
+        from django.views.generic import TemplateView
+        from vendas.exportacao import ExportacaoMixin
+
+        class PainelView(ExportacaoMixin, TemplateView):
+            pass
+
+        with self.assertRaises(ImproperlyConfigured):
+            PainelView().exportar('csv')
+
+    def test_csv_grava_em_arquivo_so_de_escrita(self):
+        from vendas.exportacao import _escrever_csv
+
+        class SoEscrita:
+            # como o SpooledTemporaryFile do Python 3.10: sem readable()/writable() para o TextIOWrapper
+            def __init__(self):
+                self.partes = []
+
+            def write(self, dados):
+                self.partes.append(dados)
+
+        arquivo = SoEscrita()
+        _escrever_csv(arquivo, ['Loja', 'Valor'], [['São Paulo', Decimal('10.50')], ['Rio', None]])
+        self.assertTrue(all(isinstance(parte, bytes) for parte in arquivo.partes))
+        self.assertEqual(
+            b''.join(arquivo.partes).decode('utf-8'), '\ufeffLoja;Valor\r\nSão Paulo;10,50\r\nRio;\r\n'
+        )
+
+
+class GeracaoVendaMixin(DadosBaseMixin):
+    def setUp(self):
+        from django.contrib.auth.models import Permission
+        from estoque.models import EstoqueImei
+        from vendas.services import limpar_dados_fixos
+
+        limpar_dados_fixos()
+        super().setUp()
+        self.usuario.user_permissions.add(Permission.objects.get(codename='add_venda'))
+        Loja.objects.create(nome='CREDFÁCIL', porcentagem_desconto_6=Decimal('10'))
+        TipoPagamento.objects.create(nome='ENTRADA')
+        self.produto = Produto.objects.create(
+            nome='Moto', valor_repasse_logista=Decimal('100'), entrada_cliente=Decimal('200'),
+            valor_6_vezes=Decimal('1200'),
+        )
+        self.renavam = EstoqueImei.objects.create(loja=self.loja, produto=self.produto, renavam='12345678901')
+        self.analise = self.criar_analise(self.cliente)
+        # outro cliente com análise aprovada para o mesmo RENAVAM
+        self.outro_cliente = criar_cliente(self.loja, cpf='98765432100', nome='Outro Cliente')
+        self.outra_analise = self.criar_analise(self.outro_cliente)
+
+    def criar_analise(self, cliente):
+        return AnaliseCreditoCliente.objects.create(
+            loja=self.loja, cliente=cliente, produto=self.produto, renavam=self.renavam, status='A',
+            status_aplicativo='L', numero_parcelas='6', data_pagamento='15',
+        )
+
+    def login(self, client):
+        client.force_login(self.usuario)
+        sessao = client.session
+        sessao['loja_id'] = self.loja.pk
+        sessao.save()
+
+    def gerar(self, client, cliente=None):
+        return client.post(reverse('vendas:gerar_venda', args=[(cliente or self.cliente).pk]))
+
+
+class GerarVendaTest(GeracaoVendaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.login(self.client)
+
+    def test_gera_venda_item_pagamentos_e_parcelas(self):
+        self.gerar(self.client)
+
+        venda = Venda.objects.get(cliente=self.cliente)
+        self.renavam.refresh_from_db()
+        self.analise.refresh_from_db()
+        self.assertTrue(self.renavam.vendido)
+        self.assertEqual(self.analise.venda, venda)
+        self.assertEqual(venda.itens_venda.get().valor_unitario, Decimal('1200'))
+        credfacil = venda.pagamentos.get(tipo_pagamento__nome='CREDFACIL')
+        self.assertEqual(credfacil.porcentagem_desconto, Decimal('10'))
+        self.assertEqual(credfacil.parcelas_pagamento.count(), 6)
+        self.assertEqual(venda.pagamentos.get(tipo_pagamento__nome='ENTRADA').parcelas_pagamento.count(), 1)
+
+    def test_segunda_requisicao_nao_duplica_venda(self):
+        self.gerar(self.client)
+        self.gerar(self.client)
+        self.assertEqual(Venda.objects.filter(cliente=self.cliente).count(), 1)
+
+    def test_mesmo_renavam_em_duas_analises_gera_uma_venda(self):
+        self.gerar(self.client)
+        resposta = self.gerar(self.client, self.outro_cliente)
+        self.assertRedirects(resposta, reverse('vendas:cliente_list'), fetch_redirect_response=False)
+        self.assertEqual(Venda.objects.get().cliente, self.cliente)
+        self.outra_analise.refresh_from_db()
+        self.assertIsNone(self.outra_analise.venda)
+
+    def test_renavam_vendido_bloqueia_sem_gravar_nada(self):
+        self.renavam.vendido = True
+        self.renavam.save()
+        resposta = self.gerar(self.client)
+        self.assertRedirects(resposta, reverse('vendas:cliente_list'), fetch_redirect_response=False)
+        self.assertFalse(Venda.objects.exists())
+
+    def test_alteracao_da_loja_credfacil_limpa_cache(self):
+        from vendas.services import dados_fixos
+
+        self.assertEqual(dados_fixos()['descontos']['6'], Decimal('10'))
+        credfacil = Loja.objects.get(nome='CREDFÁCIL')
+        credfacil.porcentagem_desconto_6 = Decimal('12')
+        credfacil.save()
+        self.assertEqual(dados_fixos()['descontos']['6'], Decimal('12'))
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class GerarVendaConcorrenciaTest(GeracaoVendaMixin, TransactionTestCase):
+    REQUISICOES = 4
+
+    def test_requisicoes_paralelas_geram_uma_venda(self):
+        import threading
+        from django.db import connection
+        from django.test import Client
+
+        barreira = threading.Barrier(self.REQUISICOES)
+
+        def requisitar(cliente):
+            client = Client()
+            self.login(client)
+            barreira.wait()
+            try:
+                self.gerar(client, cliente)
+            finally:
+                connection.close()
+
+        # metade das requisições para cada análise: as duas disputam o mesmo RENAVAM
+        clientes = [self.cliente, self.outro_cliente] * (self.REQUISICOES // 2)
+        threads = [threading.Thread(target=requisitar, args=[cliente]) for cliente in clientes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(Venda.objects.count(), 1)
+        self.assertEqual(ProdutoVenda.objects.filter(renavam=self.renavam.renavam).count(), 1)
+        self.assertEqual(AnaliseCreditoCliente.objects.filter(venda__isnull=False).count(), 1)
+
+
+class NotificacaoPagamentoInformadoTest(DadosBaseMixin, TestCase):
+    ADMINS = 5
+
+    def setUp(self):
+        from django.contrib.auth.models import Group
+
+        super().setUp()
+        grupo = Group.objects.create(name='ADMINISTRADOR')
+        for i in range(self.ADMINS):
+            User.objects.create_user(username=f'admin{i}', email=f'admin{i}@teste.com', password='senha').groups.add(grupo)
+        _, pagamento = criar_venda_credfacil(
+            self.usuario, self.loja, self.caixa, self.cliente, self.credfacil, timezone.now().date()
+        )
+        self.parcela = pagamento.parcelas_pagamento.order_by('numero_parcela').first()
+
+    def informar_pagamento(self):
+        self.parcela.pagamento_efetuado_em = timezone.now().replace(second=0, microsecond=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.parcela.save()
+
+    def test_notificacoes_em_lote_depois_do_commit(self):
+        from notifications.models import Notification
+        from notificacao.utils import _enviar_lote
+
+        self.parcela.pagamento_efetuado_em = timezone.now()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.parcela.save()
+        self.assertFalse(Notification.objects.exists())
+
+        # destinatários + um único bulk_create, independente do número de admins
+        envio = [c for c in callbacks if getattr(c, 'func', None) is _enviar_lote]
+        self.assertEqual(len(envio), 1)
+        with self.assertNumQueries(2):
+            envio[0]()
+        self.assertEqual(Notification.objects.count(), self.ADMINS)
+
+    def test_nao_repete_notificacao_nao_lida(self):
+        from notifications.models import Notification
+
+        self.informar_pagamento()
+        self.informar_pagamento()
+        self.assertEqual(Notification.objects.count(), self.ADMINS)
+
+    def test_destinatarios_em_cache_e_invalidados(self):
+        from notificacao.utils import destinatarios
+
+        destinatarios('ADMINISTRADOR')
+        with self.assertNumQueries(0):
+            self.assertEqual(len(destinatarios('ADMINISTRADOR', 'ANALISTA')), self.ADMINS)
+
+        inativo, sem_grupo = User.objects.filter(groups__name='ADMINISTRADOR')[:2]
+        inativo.is_active = False
+        inativo.save()
+        self.assertEqual(len(destinatarios('ADMINISTRADOR')), self.ADMINS - 1)
+        sem_grupo.groups.clear()
+        self.assertEqual(len(destinatarios('ADMIN', contem=True)), self.ADMINS - 2)
+        self.assertNotIn(sem_grupo.pk, destinatarios('ADMINISTRADOR', incluir=inativo.pk))
+
+    def test_consumer_recebe_a_propria_notificacao(self):
+        from asgiref.sync import async_to_sync, sync_to_async
+        from channels.testing import WebsocketCommunicator
+        from notifications.models import Notification
+        from notificacao.consumers import NotificationConsumer
+
+        admin = User.objects.filter(groups__name='ADMINISTRADOR').first()
+
+        async def cenario():
+            comunicador = WebsocketCommunicator(NotificationConsumer.as_asgi(), '/ws/notifications/')
+            comunicador.scope['user'] = admin
+            await comunicador.connect()
+            await sync_to_async(self.informar_pagamento)()
+            dados = await comunicador.receive_json_from(timeout=2)
+            await comunicador.disconnect()
+            return dados
+
+        dados = async_to_sync(cenario)()
+        self.assertEqual(dados['notification_id'], Notification.objects.get(recipient=admin).pk)
+
+    def test_resumo_do_sino_refeito_a_cada_mudanca(self):
+        from notifications.models import Notification
+        from notificacao.utils import marcar_lida, resumo_notificacoes
+
+        admin = User.objects.filter(groups__name='ADMINISTRADOR').first()
+        resumo_notificacoes(admin)
+        self.informar_pagamento()
+        # outro horário informado gera outra descrição e, portanto, nova notificação
+        self.parcela.pagamento_efetuado_em -= timedelta(hours=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.parcela.save()
+
+        resumo = resumo_notificacoes(admin)
+        self.assertEqual(resumo['total'], 2)
+        self.assertEqual(resumo['ultimas'][0]['url'], self.parcela.pagamento.get_absolute_url())
+        with self.assertNumQueries(0):
+            self.assertEqual(resumo_notificacoes(admin), resumo)
+
+        marcar_lida(Notification.objects.get(pk=resumo['ultimas'][0]['id']))
+        self.assertEqual(resumo_notificacoes(admin)['total'], 1)
+
+        self.client.force_login(admin)
+        self.client.post(reverse('ler_todas'), {'next': '/'})
+        self.assertEqual(resumo_notificacoes(admin), {'total': 0, 'ultimas': []})
+        self.assertFalse(Notification.objects.filter(recipient=admin, unread=True).exists())
+
+
+class MenuItemsTest(TestCase):
+    def test_item_ativo_nao_vaza_para_o_menu_em_cache(self):
+        from django.test import RequestFactory
+        from core.context_processors import menu_items
+
+        usuario = User.objects.create_superuser(username='admin', email='admin@teste.com', password='senha')
+        fabrica = RequestFactory()
+
+        def menu(caminho):
+            request = fabrica.get(caminho)
+            request.user = usuario
+            return menu_items(request)['menu_items']
+
+        def ativos(secoes):
+            rotulos = []
+            for itens in secoes.values():
+                for item in itens:
+                    rotulos += [i['label'] for i in [item, *item.get('sub_items', [])] if i.get('active')]
+            return rotulos
+
+        self.assertEqual(ativos(menu(reverse('vendas:loja_list'))), ['Lojas'])
+        self.assertEqual(ativos(menu('/pagina-sem-menu/')), [])
+        self.assertEqual(ativos(menu(reverse('accounts:group_list'))), ['Usuários', 'Grupos'])
@@ -0,0 +1,62 @@
+"""Dados e mixins compartilhados pelos testes de vendas, estoque e financeiro."""
+from datetime import date
+from decimal import Decimal
+
+from accounts.models import User
+from produtos.models import Produto
+from vendas.models import Caixa, Cliente, ComprovantesCliente, Loja, Pagamento, TipoPagamento, Venda
+
+
+def criar_cliente(loja, cpf='123.456.789-00', nome='Cliente Teste', **kwargs):
+    dados = dict(
+        telefone='11999999999', nascimento=date(1990, 1, 1), rg='123', cep='00000000', endereco='Rua A',
+        bairro='Centro', cidade='Cidade',
+    )
+    dados.update(kwargs)
+    return Cliente.objects.create(
+        nome=nome, cpf=cpf, comprovantes=ComprovantesCliente.objects.create(), loja=loja, **dados
+    )
+
+
+def criar_dados_base():
+    usuario = User.objects.create_user(username='vendedor', password='senha')
+    loja = Loja.objects.create(nome='Loja Teste')
+    caixa = Caixa.objects.create(loja=loja)
+    cliente = criar_cliente(loja)
+    credfacil = TipoPagamento.objects.create(nome='CREDFACIL', parcelas=True)
+    return usuario, loja, caixa, cliente, credfacil
+
+
+def criar_venda_credfacil(usuario, loja, caixa, cliente, credfacil, primeira_parcela, parcelas=6, valor=600, **kwargs):
+    venda = Venda.objects.create(
+        loja=loja, cliente=cliente, vendedor=usuario, caixa=caixa, repasse_logista=Decimal('100'), **kwargs
+    )
+    pagamento = Pagamento.objects.create(
+        loja=loja, venda=venda, tipo_pagamento=credfacil, valor=Decimal(valor), parcelas=parcelas,
+        data_primeira_parcela=primeira_parcela,
+    )
+    return venda, pagamento
+
+
+class DadosBaseMixin:
+    """setUp com os dados de criar_dados_base(): a tupla em self.dados e cada item em seu atributo."""
+
+    def setUp(self):
+        super().setUp()
+        self.dados = criar_dados_base()
+        self.usuario, self.loja, self.caixa, self.cliente, self.credfacil = self.dados
+
+
+class RelatorioTestMixin(DadosBaseMixin):
+    """Usuário com permissão de relatório, logado com a loja na sessão, e um produto."""
+
+    def setUp(self):
+        from django.contrib.auth.models import Permission
+
+        super().setUp()
+        self.usuario.user_permissions.add(Permission.objects.get(codename='can_generate_report_sale'))
+        self.client.force_login(self.usuario)
+        sessao = self.client.session
+        sessao['loja_id'] = self.loja.pk
+        sessao.save()
+        self.produto = Produto.objects.create(nome='Moto', valor_repasse_logista=Decimal('100'))
@@ -71,6 +71,9 @@ urlpatterns = [
     path('vendas/relatorio/folha/', FolhaRelatorioVendasView.as_view(), name='folha_venda_relatorio'),
     path('vendas/solicitacao/folha/', FolhaRelatorioSolicitacoesView.as_view(), name='folha_solicitacao_relatorio'),
     path('vendas/solicitacao/', RelatorioSolicitacoesView.as_view(), name='form_solicitacao_relatorio'),
+    path('relatorios/segundo-plano/', RelatorioJobListView.as_view(), name='relatorio_job_list'),
+    path('relatorios/segundo-plano/<str:tipo>/gerar/', RelatorioJobCreateView.as_view(), name='relatorio_job_criar'),
+    path('relatorios/segundo-plano/<int:pk>/download/', relatorio_job_download, name='relatorio_job_download'),
     path('venda/contrato/<int:pk>/', contrato_view, name='gerar_contrato'),
     path('produtos-vendidos/', ProdutoVendidoListView.as_view(), name='produto_vendido_list'),
     path('pagamento/<int:pk>/confirmar-quitacao/', ConfirmarQuitacaoView.as_view(), name='confirmar_quitacao'),
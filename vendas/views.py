@@ -4,13 +4,12 @@ import re
 import sys
 import io
 import base64
-import calendar
 from datetime import datetime, date, timedelta
 from dateutil.relativedelta import relativedelta
 from decimal import Decimal
 from collections import defaultdict
 from io import BytesIO
-from django.db.models import Count, Q
+from django.db.models import Count, Q, Prefetch
 import qrcode
 from qrcode import QRCode
 from qrcode.constants import ERROR_CORRECT_M
@@ -22,7 +21,7 @@ from accounts.models import User
 from django.core.paginator import Paginator
 from django.db import transaction
 from django.db.models import Sum, Count
-from django.http import Http404, JsonResponse, HttpResponse
+from django.http import FileResponse, Http404, JsonResponse, HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
@@ -43,9 +42,16 @@ from vendas.forms import (
 )
 from .models import (
     AnaliseCreditoCliente, Caixa, Cliente, Loja, Pagamento, Parcela, ProdutoVenda, TipoPagamento, Venda,
-    LancamentoCaixa, LancamentoCaixaTotal
+    LancamentoCaixa, LancamentoCaixaTotal, MovimentoCaixaLoja, RelatorioJob, ResumoRecebiveisMensal, filtro_credfacil
 )
 from pypix import Pix
+from .exportacao import FORMATOS_EXPORTACAO, ExportacaoMixin, formato_exportacao
+from .relatorios import (
+    COLUNAS_SOLICITACOES, COLUNAS_VENDAS, PERMISSOES_RELATORIO, TEMPLATE_GRAFICOS, TEMPLATE_SOLICITACOES,
+    TEMPLATE_VENDAS, TIPOS_SOMENTE_HTML, contexto_graficos, contexto_solicitacoes, contexto_vendas,
+    exportacao_solicitacoes, exportacao_vendas, filtrar_solicitacoes, filtrar_vendas, nome_download,
+)
+from .services import ServicoGeracaoVenda, VendaNaoGerada
 #import q
 
 
@@ -77,75 +83,39 @@ class IndexView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
 
         loja = Loja.objects.get(id=self.request.session.get('loja_id'))
-        caixa_diario_loja = Caixa.objects.filter(loja=loja).order_by('-data_abertura').first()
-        caixa_total = Caixa.objects.all().filter(loja=loja)
-
-        valor_caixa_total = 0
-        for caixa in caixa_total:
-            valor_caixa_total += caixa.saldo_total_dinheiro
-            valor_caixa_total += caixa.entradas
-            valor_caixa_total -= caixa.saidas
+        caixa_diario_loja = Caixa.objects.filter(loja=loja).with_saldos().order_by('-data_abertura').first()
+        # Caixas fechados e lançamentos do caixa total já estão no livro da loja;
+        # somam-se apenas os caixas ainda abertos
+        saldos_abertos = Caixa.objects.filter(loja=loja, data_fechamento__isnull=True).saldo_acumulado()
+        valor_caixa_total = MovimentoCaixaLoja.saldo_atual(loja) + (
+            saldos_abertos['vendas'] + saldos_abertos['entradas'] - saldos_abertos['saidas']
+        )
 
         caixa_diario_lucro = 0
         if caixa_diario_loja:
             caixa_diario_lucro = (caixa_diario_loja.saldo_total_dinheiro + caixa_diario_loja.entradas) - caixa_diario_loja.saidas
 
-        entrada_caixa_total = LancamentoCaixaTotal.objects.filter(tipo_lancamento='1', loja=loja)
-        saida_caixa_total = LancamentoCaixaTotal.objects.filter(tipo_lancamento='2', loja=loja)
-
-        for entrada in entrada_caixa_total:
-            valor_caixa_total += entrada.valor
-
-        for saida in saida_caixa_total:
-            valor_caixa_total -= saida.valor
-
         if self.request.user.has_perm('vendas.can_view_your_dashboard'):
             vendas = Venda.objects.filter(loja=loja)
 
             total_vendas = vendas.count()
-            total_de_parcelas_vencidas = 0
-            total_de_parcelas_pagas = 0
-            total_de_parcelas_a_vencer = 0
-            total_pagas = 0
-            total_vencidas = 0
-            total_a_vencer = 0
-            total_geral_parcelas = 0
-
-            for venda in vendas: 
-                parcelas = list(Parcela.objects.filter(
-                    pagamento__venda=venda,
-                    pagamento__tipo_pagamento__nome='CREDFACIL',
-                    pagamento__desativado=False,
-                ).order_by('data_vencimento')[:3])
-
-                parcelas_vencidas = [p for p in parcelas if p.data_vencimento < timezone.now().date() and not p.pago and not p.pagamento_efetuado]
-                parcelas_pagas = [p for p in parcelas if p.pago and not p.pagamento_efetuado]
-                parcelas_a_vencer = [p for p in parcelas if p.data_vencimento >= timezone.now().date() and not p.pago and not p.pagamento_efetuado]
-
-                total_geral_parcelas += len(parcelas)
-
-                qtd_vencidas = len(parcelas_vencidas)
-                qtd_pagas = len(parcelas_pagas)
-                qtd_a_vencer = len(parcelas_a_vencer)
+            hoje = timezone.now().date()
 
-                total_de_parcelas_vencidas += qtd_vencidas
-                total_de_parcelas_pagas += qtd_pagas
-                total_de_parcelas_a_vencer += qtd_a_vencer
-
-                valor_vencidas = sum(p.valor for p in parcelas_vencidas)
-                valor_pagas = sum(p.valor for p in parcelas_pagas)
-                valor_a_vencer = sum(p.valor for p in parcelas_a_vencer)    
-
-                total_pagas += valor_pagas
-                total_vencidas += valor_vencidas
-                total_a_vencer += valor_a_vencer
+            # Considera apenas as 3 primeiras parcelas CREDFÁCIL de cada venda
+            resumo = Parcela.objects.credfacil().filter(
+                pagamento__venda__loja=loja,
+                pagamento__desativado=False,
+            ).primeiras_por_venda(3).resumo_recebiveis(hoje)
 
+            total_pagas = resumo['valor_pagas']
+            total_vencidas = resumo['valor_vencidas']
+            total_a_vencer = resumo['valor_a_vencer']
 
             context['total_vendas_loja'] = total_vendas # quantidade de vendas
-            context['total_de_parcelas_geral'] = total_geral_parcelas # quantidade total de parcelas
-            context['parcelas_vencidas'] = total_de_parcelas_vencidas # quantidade de parcelas vencidas
-            context['parcelas_pagas'] = total_de_parcelas_pagas # quantidade de parcelas pagas
-            context['parcelas_a_vencer'] = total_de_parcelas_a_vencer  # quantidade de parcelas a vencer
+            context['total_de_parcelas_geral'] = resumo['qtd_total'] # quantidade total de parcelas
+            context['parcelas_vencidas'] = resumo['qtd_vencidas'] # quantidade de parcelas vencidas
+            context['parcelas_pagas'] = resumo['qtd_pagas'] # quantidade de parcelas pagas
+            context['parcelas_a_vencer'] = resumo['qtd_a_vencer']  # quantidade de parcelas a vencer
 
             context['total_geral_parcelas'] = total_pagas + total_vencidas + total_a_vencer # valor total de parcelas
             context['total_pagas'] = total_pagas # valor total de parcelas pagas
@@ -153,31 +123,20 @@ class IndexView(LoginRequiredMixin, TemplateView):
             context['total_a_vencer'] = total_a_vencer # valor total de parcelas a vencer
 
             # --- CÁLCULO DOS CLIENTES DESATIVADOS ---
-            total_desativados_vencidas = 0
-            total_desativados_a_vencer = 0
-            qtd_desativados_vencidas = 0
-            qtd_desativados_a_vencer = 0
-
-            # Busca parcelas de clientes desativados (apenas não pagas)
-            parcelas_desativadas = Parcela.objects.filter(
+            # Parcelas de clientes desativados (apenas não pagas)
+            desativados = Parcela.objects.credfacil().filter(
                 pagamento__venda__loja=loja,
-                pagamento__tipo_pagamento__nome='CREDFACIL',
-                pagamento__desativado=True,
-                pago=False  # Apenas parcelas não pagas
-            )
+            ).resumo_desativados(hoje)
 
-            for parcela in parcelas_desativadas:
-                if parcela.data_vencimento < timezone.now().date():
-                    total_desativados_vencidas += parcela.valor
-                    qtd_desativados_vencidas += 1
-                else:
-                    total_desativados_a_vencer += parcela.valor
-                    qtd_desativados_a_vencer += 1
+            total_desativados_vencidas = desativados['valor_vencidas']
+            total_desativados_a_vencer = desativados['valor_a_vencer']
+            qtd_desativados_vencidas = desativados['qtd_vencidas']
+            qtd_desativados_a_vencer = desativados['qtd_a_vencer']
 
             # Total de pagamentos desativados
             total_pagamentos_desativados = Pagamento.objects.filter(
+                filtro_credfacil(),
                 venda__loja=loja,
-                tipo_pagamento__nome='CREDFACIL',
                 desativado=True
             ).count()
 
@@ -246,9 +205,9 @@ class CaixaListView(BaseView, PermissionRequiredMixin, ListView):
             query = query.filter(loja__id=loja)
             
         if data_filter:
-            return query.filter(data_abertura=data_filter)
+            return query.filter(data_abertura=data_filter).with_saldos()
         
-        return query.order_by('-criado_em')
+        return query.order_by('-criado_em').with_saldos()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -289,6 +248,7 @@ class CaixaListView(BaseView, PermissionRequiredMixin, ListView):
                 caixa = Caixa.objects.get(id=request.POST['fechar_caixa'],
                                           loja=request.session.get('loja_id'))
                 caixa.data_fechamento = today
+                # o sinal de post_save congela os totais e lança o saldo final no livro do caixa total
                 caixa.save(user=request.user)
                 messages.success(request, 'Caixa fechado com sucesso')
             except Caixa.DoesNotExist:
@@ -820,8 +780,7 @@ class ClienteConfirmInstalledView(PermissionRequiredMixin, View):
         analise_credito.save()
         
         # Enviar notificação para analistas
-        from notifications.signals import notify
-        from notificacao.utils import enviar_ws_para_usuario
+        from notificacao.utils import destinatarios, notificar_usuarios
         
         cliente_nome = cliente.nome if cliente else "Cliente"
         loja = cliente.loja
@@ -830,32 +789,17 @@ class ClienteConfirmInstalledView(PermissionRequiredMixin, View):
         description = f'Aguardando analista informar IMEI. Loja: {loja.nome.capitalize()}.'
         
         # Notificar analistas e administradores
-        usuarios_para_notificar = list(
-            User.objects.filter(groups__name__in=['ADMINISTRADOR', 'ANALISTA']).exclude(id=request.user.id)
+        usuarios_para_notificar = destinatarios('ADMINISTRADOR', 'ANALISTA', excluir=request.user.id)
+        notificar_usuarios(
+            usuarios_para_notificar,
+            analise_credito,
+            verb=verb,
+            description=description,
+            target=cliente,
+            target_url=cliente.get_absolute_url(),
+            type_notification='analise_credito_cliente',
         )
         
-        for user in usuarios_para_notificar:
-            notify.send(
-                analise_credito,
-                recipient=user,
-                verb=verb,
-                description=description,
-                target=cliente,
-            )
-
-            # WebSocket
-            ultima_notificacao = user.notifications.unread().order_by('-timestamp').first()
-            if ultima_notificacao:
-                enviar_ws_para_usuario(
-                    usuario=user,
-                    instance=analise_credito,
-                    notification_id=ultima_notificacao.id,
-                    verb=verb,
-                    description=description,
-                    target_url=cliente.get_absolute_url(),
-                    type_notification='analise_credito_cliente',
-                )
-        
         messages.success(request, "✅ Instalação confirmada! Aguardando analista informar IMEI.")
         return redirect('vendas:cliente_list')
     
@@ -881,241 +825,20 @@ class ClienteStatusAppUpdateView(PermissionRequiredMixin, View):
 
 
 
-def calcular_data_primeira_parcela(data_pagamento_str):
-    """
-    Retorna a data com o dia escolhido (05 ou 15) mais distante possível,
-    mas ainda dentro de até 40 dias após a data da compra.
-    """
-    hoje = timezone.now().date()
-    dia_escolhido = int(data_pagamento_str)
-    max_dias = 40
-    ano, mes = hoje.year, hoje.month
-
-    melhor_data = None
-    maior_diferenca = -1
-
-    # Verifica até 3 meses à frente
-    for i in range(3):
-        novo_mes = mes + i
-        novo_ano = ano + (novo_mes - 1) // 12
-        novo_mes = ((novo_mes - 1) % 12) + 1
-
-        # Verifica se o mês tem o dia escolhido
-        ultimo_dia_mes = calendar.monthrange(novo_ano, novo_mes)[1]
-        dia_real = min(dia_escolhido, ultimo_dia_mes)
-
-        data_candidata = date(novo_ano, novo_mes, dia_real)
-        dias_ate_parcela = (data_candidata - hoje).days
-
-        # Valida se está dentro do prazo
-        if 0 < dias_ate_parcela <= max_dias:
-            if dias_ate_parcela > maior_diferenca:
-                melhor_data = data_candidata
-                maior_diferenca = dias_ate_parcela
-
-    return melhor_data
-
-
-def criar_parcelas(pagamento, loja):
-    """
-    Gera cada vencimento mantendo o dia fixo (5 ou 15) sempre.
-    Se o dia não existir no mês, usa o último dia do mês.
-    """
-    Parcela.objects.filter(pagamento=pagamento).delete()
-    dia = pagamento.data_primeira_parcela.day
-
-    for n in range(1, pagamento.parcelas + 1):
-        # calcula ano/mes de cada parcela
-        month_offset = pagamento.data_primeira_parcela.month - 1 + (n - 1)
-        ano = pagamento.data_primeira_parcela.year + month_offset // 12
-        mes = month_offset % 12 + 1
-
-        # Sempre usa o dia escolhido (5 ou 15), ou o último dia se não existir
-        ultimo = calendar.monthrange(ano, mes)[1]
-        venc_dia = min(dia, ultimo)
-        data_venc = date(ano, mes, venc_dia)
-
-        Parcela.objects.create(
-            loja=loja,
-            pagamento=pagamento,
-            numero_parcela=n,
-            valor=pagamento.valor_parcela,
-            data_vencimento=data_venc,
-            criado_por=pagamento.criado_por,
-            modificado_por=pagamento.modificado_por
-        )
-        
-
-@transaction.atomic
 @permission_required('vendas.add_venda', raise_exception=True)
 def gerar_venda(request, cliente_id):
     if request.method != 'POST':
         return redirect('vendas:cliente_list')
 
     cliente = get_object_or_404(Cliente, id=cliente_id)
-    loja = get_object_or_404(Loja, id=request.session.get('loja_id'))
-    credfacil = get_object_or_404(Loja, nome__icontains='CREDFÁCIL')
-    
-    if not credfacil or not loja or not cliente:
-        messages.error(request, "❌ Loja ou cliente não encontrado.")
-        return redirect('vendas:cliente_list')
-
-    # --- Validação: clientes com mesmo CPF precisam ter ao menos 3 parcelas pagas em cada venda anterior ---
-    cpf_limpo = re.sub(r'\D', '', cliente.cpf)
-
-    vendas_com_poucas_parcelas = (
-        Venda.objects
-        .filter(cliente__cpf=cpf_limpo, is_deleted=False)
-        .annotate(
-            parcelas_pagas=Count(
-                'pagamentos__parcelas_pagamento',
-                filter=Q(
-                    pagamentos__tipo_pagamento__nome__iexact='CREDFACIL',
-                    pagamentos__parcelas_pagamento__pago=True
-                ),
-                distinct=True
-            )
-        )
-        .filter(parcelas_pagas__lt=3)
-    )
-
-    if vendas_com_poucas_parcelas.exists():
-        messages.error(
-            request,
-            "❌ Para gerar uma nova venda, cada venda anterior do mesmo CPF deve ter pelo menos 3 parcelas pagas."
-        )
-        return redirect('vendas:cliente_list')
-
-    # Valida análise de crédito
-    analise = cliente.analise_credito
-    if not analise or analise.status != 'A':
-        messages.error(request, "❌ Análise de crédito não aprovada para o cliente.")
-        return redirect('vendas:cliente_list')
-    if not analise.renavam:
-        messages.error(request, "❌ Nenhum RENAVAM associado à análise de crédito. Informe o RENAVAM antes de gerar a venda.")
-        return redirect('vendas:cliente_update', pk=cliente.pk)
-    if analise.status_aplicativo != 'L':
-        messages.error(request, "❌ RENAVAM e placa não foram informados pelo analista. Aguarde o analista informar esses dados.")
-        return redirect('vendas:cliente_update', pk=cliente.pk)
-    if analise.venda:
-        messages.error(request, "❌ Essa solicitação já foi convertida em venda.")
-        return redirect('vendas:cliente_list')
-
-    # Verifica caixa aberto para a loja da análise
-    caixa = Caixa.objects.filter(
-        loja=analise.loja,
-        data_fechamento__isnull=True
-    ).first()
-    if not caixa:
-        messages.error(request, f"❌ Nenhum caixa aberto encontrado para a loja {analise.loja.nome}.")
-        return redirect('vendas:cliente_list')
-    if not analise or analise.status != 'A':
-        messages.error(request, "❌ Análise de crédito não aprovada para o cliente.")
-        return redirect('vendas:cliente_list')
-    if not analise.renavam:
-        messages.error(request, "❌ Nenhum RENAVAM associado à análise de crédito. Informe o RENAVAM antes de gerar a venda.")
-        return redirect('vendas:cliente_update', pk=cliente.pk)
-    if analise.status_aplicativo != 'L':
-        messages.error(request, "❌ RENAVAM e placa não foram informados pelo analista. Aguarde o analista informar esses dados.")
-        return redirect('vendas:cliente_update', pk=cliente.pk)
-    if analise.venda:
-        messages.error(request, "❌ Essa solicitação já foi convertida em venda.")
-        return redirect('vendas:cliente_list')
-
-    produto = analise.produto
-    renavam = analise.renavam
-    if renavam.vendido:
-        messages.error(request, "❌ RENAVAM já vendido. Altere o RENAVAM para continuar.")
-        return redirect('vendas:cliente_list')
-
-    # Validação de estoque removida - o estoque será criado automaticamente com o RENAVAM informado
-
-    # Cria venda
-    venda = Venda.objects.create(
-        loja=analise.loja,  # Usa a loja da análise de crédito
-        cliente=cliente,
-        vendedor=request.user,
-        caixa=caixa,
-        repasse_logista=produto.valor_repasse_logista,
-        observacao=analise.observacao,
-        criado_por=request.user,
-        modificado_por=request.user,
-        criado_em=timezone.now(),
-        modificado_em=timezone.now()
-    )
-    analise.venda = venda
-    analise.save()
-    
-    porcentagem_desconto = 0
-    
-    # Define valores e número de parcelas
-    if analise.numero_parcelas == '4':
-        valor_credfacil = produto.valor_4_vezes
-        parcelas = 4
-        porcentagem_desconto = credfacil.porcentagem_desconto_4
-    elif analise.numero_parcelas == '6':
-        valor_credfacil = produto.valor_6_vezes
-        parcelas = 6
-        porcentagem_desconto = credfacil.porcentagem_desconto_6
-    elif analise.numero_parcelas == '8':
-        valor_credfacil = produto.valor_8_vezes
-        parcelas = 8
-        porcentagem_desconto = credfacil.porcentagem_desconto_8
-    elif analise.numero_parcelas == '10':
-        valor_credfacil = produto.valor_10_vezes
-        parcelas = 10
-        porcentagem_desconto = credfacil.porcentagem_desconto_10
-    elif analise.numero_parcelas == '12':
-        valor_credfacil = produto.valor_12_vezes
-        parcelas = 12
-        porcentagem_desconto = credfacil.porcentagem_desconto_12
-    elif analise.numero_parcelas == '14':
-        valor_credfacil = produto.valor_14_vezes
-        parcelas = 14
-        porcentagem_desconto = credfacil.porcentagem_desconto_14
-
-    # Cria ProdutoVenda
-    ProdutoVenda.objects.create(
-        loja=analise.loja,  # Usa a loja da análise de crédito
-        venda=venda,
-        produto=produto,
-        renavam=renavam.renavam,
-        valor_unitario=valor_credfacil,
-        quantidade=1,
-        valor_desconto=0
-    )
-
-    # Atualiza RENAVAM
-    renavam.vendido = True
-    renavam.data_venda = timezone.now()
-    renavam.save()
+    get_object_or_404(Loja, id=request.session.get('loja_id'))
 
-    # Pagamentos
-    tipo_entrada = TipoPagamento.objects.get(nome__iexact='ENTRADA')
-    tipo_credfacil = TipoPagamento.objects.get(nome__iexact='CREDFACIL')
-
-    pagamento_entrada = Pagamento.objects.create(
-        loja=analise.loja,  # Usa a loja da análise de crédito
-        venda=venda,
-        tipo_pagamento=tipo_entrada,
-        valor=produto.entrada_cliente,
-        parcelas=1,
-        data_primeira_parcela=timezone.now().date()
-    )
-
-    data1 = calcular_data_primeira_parcela(analise.data_pagamento)
-    pagamento_credfacil = Pagamento.objects.create(
-        loja=analise.loja,  # Usa a loja da análise de crédito
-        venda=venda,
-        tipo_pagamento=tipo_credfacil,
-        valor=valor_credfacil,
-        parcelas=parcelas,
-        data_primeira_parcela=data1,
-        porcentagem_desconto=porcentagem_desconto
-    )
-
-    criar_parcelas(pagamento_entrada, analise.loja)
-    criar_parcelas(pagamento_credfacil, analise.loja)
+    # análise e RENAVAM travados dentro da transação do serviço (ver vendas/services.py)
+    try:
+        ServicoGeracaoVenda(cliente, request.user).gerar()
+    except VendaNaoGerada as erro:
+        messages.error(request, str(erro))
+        return redirect(erro.destino, **erro.kwargs_destino)
 
     messages.success(request, f"✅ Venda criada para o cliente {cliente.nome}!")
     return redirect('vendas:cliente_list')
@@ -1711,9 +1434,6 @@ class CaixaTotalView(PermissionRequiredMixin, TemplateView):
         vendas_caixa = []
         entradas_caixa = []
         saidas_caixa = []
-        total_entrada = 0
-        total_saida = 0
-        total_venda =0
 
         for caixa in caixas:
             vendas = caixa.vendas.filter(is_deleted=False, pagamentos__tipo_pagamento__caixa=True)
@@ -1728,24 +1448,24 @@ class CaixaTotalView(PermissionRequiredMixin, TemplateView):
             if saidas:
                 saidas_caixa.append(saidas)
             
-            total_entrada += caixa.entradas
-            total_saida += caixa.saidas
-            total_venda += caixa.saldo_total_dinheiro
 
         entradas_caixa_total = LancamentoCaixaTotal.objects.filter(tipo_lancamento='1', loja=loja)
         saidas_caixa_total = LancamentoCaixaTotal.objects.filter(tipo_lancamento='2', loja=loja)
 
-        for entrada in entradas_caixa_total:
-            total_entrada += entrada.valor
-
-        for saida in saidas_caixa_total:
-            total_saida += saida.valor
-
         entradas_caixa.append(entradas_caixa_total)
         saidas_caixa.append(saidas_caixa_total)
 
-            
-        total = (total_entrada + total_venda) - total_saida
+        totais_caixas = caixas.saldo_acumulado()
+        totais_lancamentos = LancamentoCaixaTotal.objects.filter(loja=loja).aggregate(
+            entradas=Sum('valor', filter=Q(tipo_lancamento='1')),
+            saidas=Sum('valor', filter=Q(tipo_lancamento='2')),
+        )
+        total_entrada = totais_caixas['entradas'] + (totais_lancamentos['entradas'] or 0)
+        total_saida = totais_caixas['saidas'] + (totais_lancamentos['saidas'] or 0)
+        total_venda = totais_caixas['vendas']
+
+        # O saldo vem do livro da loja (saldo acumulado do último movimento)
+        total = MovimentoCaixaLoja.saldo_atual(loja)
 
         context = super().get_context_data(**kwargs)
         context['caixas'] = Caixa.objects.all()
@@ -1806,9 +1526,10 @@ class LojaListView(BaseView, PermissionRequiredMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Adiciona as informações de repasses para cada loja no contexto
+        # Adiciona as informações de repasses para cada loja no contexto (calculadas em lote)
+        status_por_loja = Loja.objects.filter(pk__in=[loja.pk for loja in context['lojas']]).repasses_status()
         for loja in context['lojas']:
-            repasses, atrasados = loja.get_repasses_status()
+            repasses, atrasados = status_por_loja[loja.pk]
             loja.repasses_info = {
                 'repasses': repasses,
                 'atrasados': atrasados
@@ -2035,14 +1756,7 @@ class FolhaCaixaPDFView(PermissionRequiredMixin, View):
             else:
                 saida_total += lancamento.valor
 
-        valor_venda_por_tipo_pagamento = {}
-
-        for venda in vendas:
-            for pagamento in venda.pagamentos.filter(tipo_pagamento__caixa=True):
-                if not pagamento.tipo_pagamento.nao_contabilizar:
-                    if pagamento.tipo_pagamento.nome not in valor_venda_por_tipo_pagamento:
-                        valor_venda_por_tipo_pagamento[pagamento.tipo_pagamento.nome] = 0
-                    valor_venda_por_tipo_pagamento[pagamento.tipo_pagamento.nome] += pagamento.valor
+        valor_venda_por_tipo_pagamento = caixa.valores_por_tipo_pagamento()
 
         caixa_valor_final = (caixa.saldo_total_dinheiro + caixa.entradas) - caixa.saidas
         valor_por_tipo_pagamento_total = sum(valor_venda_por_tipo_pagamento.values())
@@ -2074,8 +1788,9 @@ class FolhaProdutoPDFView(PermissionRequiredMixin, View):
         caixa = get_object_or_404(Caixa, id=pk)
 
         # Otimiza a query trazendo os relacionamentos necessários
-        vendas = caixa.vendas.filter(is_deleted=False).prefetch_related(
-            'itens_venda__produto', 'pagamentos'
+        vendas = caixa.vendas.filter(is_deleted=False).select_related('vendedor').prefetch_related(
+            Prefetch('itens_venda', queryset=ProdutoVenda.objects.com_custo().select_related('produto')),
+            'pagamentos__tipo_pagamento',
         )
 
         produtos_info = []
@@ -2260,242 +1975,110 @@ class RelatorioSolicitacoesView(PermissionRequiredMixin, FormView):
     
 from datetime import datetime, timedelta
 
-class FolhaRelatorioSolicitacoesView(PermissionRequiredMixin, TemplateView):
-    template_name = 'relatorios/relatorio_solicitacoes.html'
+class FolhaRelatorioSolicitacoesView(ExportacaoMixin, PermissionRequiredMixin, TemplateView):
+    template_name = TEMPLATE_SOLICITACOES
     permission_required = 'vendas.can_generate_report_sale'
+    nome_exportacao = 'relatorio_solicitacoes'
+    colunas_exportacao = COLUNAS_SOLICITACOES
 
-    def get(self, request, *args, **kwargs):
-        # --- Extrai parâmetros ---
-        data_inicial    = request.GET.get('data_inicial')
-        data_final      = request.GET.get('data_final')
-        produtos        = request.GET.getlist('produtos')
-        vendedores      = request.GET.getlist('vendedores')
-        loja_ids        = request.GET.getlist('lojas')
-        status_solicitacao = request.GET.get('status_solicitacao')
-        parcelas        = request.GET.get('parcelas')
-        analise_serasa  = request.GET.get('analise_serasa')
-        vr              = request.GET.get('venda_realizada', '').lower()
-
-        filtros = {}
-        user = request.user
-
-        # status_solicitacao
-        if status_solicitacao:
-            filtros['analise_credito__status__in'] = status_solicitacao.split(',')
-
-        # parcelas
-        if parcelas:
-            filtros['analise_credito__numero_parcelas__in'] = parcelas.split(',')
-
-        # serasa
-        if analise_serasa:
-            filtros['comprovantes__restricao__in'] = analise_serasa.split(',')
-
-        # venda realizada?
-        if vr in ('true', '1'):
-            filtros['analise_credito__venda__isnull'] = False
-        elif vr in ('false', '0'):
-            filtros['analise_credito__venda__isnull'] = True
-
-        # datas
-        if data_inicial and data_final:
-            di = datetime.strptime(data_inicial, '%Y-%m-%d')
-            df = datetime.strptime(data_final, '%Y-%m-%d') + timedelta(days=1)
-            filtros['criado_em__range'] = [
-                timezone.make_aware(di),
-                timezone.make_aware(df),
-            ]
-        elif data_inicial:
-            di = datetime.strptime(data_inicial, '%Y-%m-%d')
-            filtros['criado_em__gte'] = timezone.make_aware(di)
-        elif data_final:
-            df = datetime.strptime(data_final, '%Y-%m-%d')
-            filtros['criado_em__lte'] = timezone.make_aware(df)
-
-        # outros filtros simples
-        if vendedores:
-            filtros['analise_credito__criado_por__in'] = vendedores
-        if produtos:
-            filtros['analise_credito__produto__in'] = produtos
-
-        # Loja: se não selecionou, pega a loja do usuário logado
-        if loja_ids:
-            filtros['loja__id__in'] = loja_ids
-            self.loja = Loja.objects.filter(pk__in=loja_ids).first()
-        else:
-            loja_id = request.session.get('loja_id')
-            if request.user.has_perm('vendas.can_view_all_stores'):
-                # Usuário pode ver todas as lojas e não selecionou nenhuma: pega todas
-                all_lojas = Loja.objects.values_list('id', flat=True)
-                filtros['loja__id__in'] = list(all_lojas)
-                self.loja = None
-            elif loja_id:
-                filtros['loja__id'] = loja_id
-                self.loja = Loja.objects.filter(pk=loja_id).first()
-            else:
-                self.loja = None
+    def get_queryset_exportacao(self):
+        return exportacao_solicitacoes(self.solicitacoes)
 
-        # executa consulta
-        qs = Cliente.objects.filter(**filtros).distinct()
-        if not qs.exists():
+    def get(self, request, *args, **kwargs):
+        self.solicitacoes, self.loja = filtrar_solicitacoes(request.GET, request.user, request.session.get('loja_id'))
+        if not self.solicitacoes.exists():
             messages.warning(request, 'Nenhuma solicitação encontrada com os filtros informados')
             return redirect('vendas:form_solicitacao_relatorio')
 
-        # pré-carrega vendas para calcular totais
-        self.solicitacoes = qs.prefetch_related('vendas')
-        self.total_vendas = self.solicitacoes.count()
-
-        self.total_valor = sum(
-            venda.valor_total_venda
-            for cliente in self.solicitacoes
-            for venda in cliente.vendas.all()
-        )
-        self.total_repasse = sum(
-            venda.repasse_logista
-            for cliente in self.solicitacoes
-            for venda in cliente.vendas.all()
-        )
-        self.total_entrada = sum(
-            venda.valor_entrada_cliente
-            for cliente in self.solicitacoes
-            for venda in cliente.vendas.all()
-        )
-        self.total_juros = sum(
-            venda.juros
-            for cliente in self.solicitacoes
-            for venda in cliente.vendas.all()
-        )
-
-        # formata datas para exibição
-        self.data_inicial_str = (
-            datetime.strptime(data_inicial, '%Y-%m-%d').strftime('%d/%m/%Y')
-            if data_inicial else None
-        )
-        if data_final:
-            df_back = datetime.strptime(data_final, '%Y-%m-%d')
-            self.data_final_str = df_back.strftime('%d/%m/%Y')
-        else:
-            self.data_final_str = None
-
+        formato = formato_exportacao(request)
+        if formato:
+            return self.exportar(formato)
         return super().get(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        ctx.update({
-            'solicitacoes': self.solicitacoes,
-            'total_vendas': self.total_vendas,
-            'total_valor':   self.total_valor,
-            'total_entrada': self.total_entrada,
-            'total_repasse': self.total_repasse,
-            'total_juros':   self.total_juros,
-            'data_inicial':  self.data_inicial_str,
-            'data_final':    self.data_final_str,
-            'lojas':         Loja.objects.filter(id__in=self.request.GET.getlist('lojas')) if self.loja else Loja.objects.all(),
-        })
+        ctx.update(contexto_solicitacoes(self.solicitacoes, self.request.GET, self.loja))
         return ctx
 
 
-
-class FolhaRelatorioVendasView(PermissionRequiredMixin, TemplateView):
-    template_name = 'relatorios/folha_relatorio_vendas.html'
+class FolhaRelatorioVendasView(ExportacaoMixin, PermissionRequiredMixin, TemplateView):
+    template_name = TEMPLATE_VENDAS
     permission_required = 'vendas.can_generate_report_sale'
+    nome_exportacao = 'relatorio_vendas'
+    colunas_exportacao = COLUNAS_VENDAS
 
-    def get(self, request, *args, **kwargs):
-        # --- montamos filtros exatamente como antes ---
-        data_inicial = request.GET.get('data_inicial')
-        data_final = request.GET.get('data_final')
-        produtos = request.GET.getlist('produtos')
-        vendedores = request.GET.getlist('vendedores')
-        analise_serasa = request.GET.getlist('analise_serasa')
-        parcelas = request.GET.getlist('parcelas')
-        loja_ids = request.GET.getlist('lojas')
-
-        filtros = {}
-
-        # datas
-        if data_inicial and data_final:
-            di = datetime.strptime(data_inicial, '%Y-%m-%d')
-            df = datetime.strptime(data_final, '%Y-%m-%d') + timedelta(days=1)
-            filtros['data_venda__range'] = [
-                timezone.make_aware(di),
-                timezone.make_aware(df),
-            ]
-        elif data_inicial:
-            di = datetime.strptime(data_inicial, '%Y-%m-%d')
-            filtros['data_venda__gte'] = timezone.make_aware(di)
-        elif data_final:
-            df = datetime.strptime(data_final, '%Y-%m-%d')
-            filtros['data_venda__lte'] = timezone.make_aware(df)
-
-        # outros filtros simples
-        if vendedores:
-            filtros['vendedor__in'] = vendedores
-        if analise_serasa:
-            filtros['cliente__comprovantes__restricao__in'] = analise_serasa
-        if parcelas:
-            filtros['analises_credito_venda__numero_parcelas__in'] = parcelas
-        if produtos:
-            filtros['produtos__in'] = produtos
-
-        # Loja: se não selecionou, pega a loja do usuário logado
-        if loja_ids:
-            filtros['loja__id__in'] = loja_ids
-            self.loja = Loja.objects.filter(pk__in=loja_ids).first()
-        else:
-            loja_id = request.session.get('loja_id')
-            if request.user.has_perm('vendas.can_view_all_stores'):
-                # Usuário pode ver todas as lojas e não selecionou nenhuma: pega todas
-                all_lojas = Loja.objects.values_list('id', flat=True)
-                filtros['loja__id__in'] = list(all_lojas)
-                self.loja = None
-            elif loja_id:
-                filtros['loja__id'] = loja_id
-                self.loja = Loja.objects.filter(pk=loja_id).first()
-            else:
-                self.loja = None
+    def get_queryset_exportacao(self):
+        return exportacao_vendas(self.vendas)
 
-        # faz a query
-        self.vendas = Venda.objects.filter(**filtros).distinct()
+    def get(self, request, *args, **kwargs):
+        self.vendas, self.loja = filtrar_vendas(request.GET, request.user, request.session.get('loja_id'))
 
         # se não encontrou, redireciona antes de chamar get_context_data
         if not self.vendas.exists():
             messages.warning(request, 'Nenhuma venda encontrada com os filtros informados')
             return redirect('vendas:venda_relatorio')
 
-        # pré-calcula totais para usar no contexto
-        self.total_vendas = self.vendas.count()
-        self.total_juros = sum(v.juros for v in self.vendas)
-        self.total_valor = sum(v.valor_total_venda for v in self.vendas)
-        self.total_entrada = sum(v.valor_entrada_cliente for v in self.vendas)
-        self.total_repasse = sum(v.repasse_logista for v in self.vendas)
-
-        # guarda strings formatadas
-        self.data_inicial_str = datetime.strptime(data_inicial, '%Y-%m-%d').strftime("%d/%m/%Y") if data_inicial else None
-        if data_final:
-            df_back = datetime.strptime(data_final, '%Y-%m-%d')
-            self.data_final_str = df_back.strftime("%d/%m/%Y")
-        else:
-            self.data_final_str = None
-
+        formato = formato_exportacao(request)
+        if formato:
+            return self.exportar(formato)
         return super().get(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context.update({
-            'vendas': self.vendas,
-            'total_vendas': self.total_vendas,
-            'total_juros': self.total_juros,
-            'total_valor': self.total_valor,
-            'total_entrada': self.total_entrada,
-            'total_repasse': self.total_repasse,
-            'data_inicial': self.data_inicial_str,
-            'data_final': self.data_final_str,
-            'lojas': Loja.objects.filter(id__in=self.request.GET.getlist('lojas')) if self.loja else Loja.objects.all(),
-        })
+        context.update(contexto_vendas(self.vendas, self.request.GET, self.loja))
         return context
    
    
     
+class RelatorioJobCreateView(LoginRequiredMixin, View):
+    """Enfileira o relatório com os filtros do formulário para ser gerado pelo worker (só por POST)."""
+    http_method_names = ['post']
+
+    def post(self, request, tipo):
+        if tipo not in dict(RelatorioJob.TIPO_CHOICES):
+            raise Http404("Relatório não encontrado.")
+        permissao = PERMISSOES_RELATORIO[tipo]
+        if permissao and not request.user.has_perm(permissao):
+            messages.error(request, 'Você não tem permissão para gerar este relatório.')
+            return redirect('vendas:index')
+
+        formato = (request.POST.get('formato') or '').lower()
+        if tipo in TIPOS_SOMENTE_HTML or formato not in FORMATOS_EXPORTACAO:
+            formato = 'html'
+        job = RelatorioJob.solicitar(request.user, request.session.get('loja_id'), tipo, formato, request.POST)
+
+        if job.status == 'concluido':
+            messages.success(request, 'Um relatório idêntico foi gerado há pouco e já está disponível para download.')
+        else:
+            messages.success(request, 'Relatório enviado para processamento. Você será notificado quando estiver pronto.')
+        return redirect('vendas:relatorio_job_list')
+
+
+class RelatorioJobListView(LoginRequiredMixin, ListView):
+    model = RelatorioJob
+    template_name = 'relatorios/relatorio_job_list.html'
+    context_object_name = 'relatorios'
+    paginate_by = 10
+
+    def get_queryset(self):
+        return RelatorioJob.objects.filter(criado_por=self.request.user)
+
+
+@login_required
+def relatorio_job_download(request, pk):
+    job = get_object_or_404(RelatorioJob, pk=pk, criado_por=request.user)
+    if job.status != 'concluido' or not job.arquivo:
+        messages.warning(request, 'O relatório ainda não está disponível.')
+        return redirect('vendas:relatorio_job_list')
+
+    if job.formato == 'html':
+        return FileResponse(job.arquivo.open('rb'), content_type='text/html; charset=utf-8')
+    return FileResponse(
+        job.arquivo.open('rb'), as_attachment=True, filename=nome_download(job),
+        content_type=FORMATOS_EXPORTACAO[job.formato],
+    )
+    
+
 class ProdutoVendidoListView(PermissionRequiredMixin, ListView):
     model = ProdutoVenda
     template_name = 'produto_vendido/produto_vendido_list.html'
@@ -2762,6 +2345,8 @@ class InformarTodosPagamentosView(View):
             pagamento_efetuado=True,
             pagamento_efetuado_em=timezone.now()
         )
+        # update() não dispara sinais, então o resumo de recebíveis é agendado aqui
+        ResumoRecebiveisMensal.agendar_recalculo(ResumoRecebiveisMensal.buckets_de_pagamentos([pagamento.pk]))
 
         if updated_count > 0:
             messages.success(
@@ -2846,173 +2431,11 @@ class ConfirmarQuitacaoView(PermissionRequiredMixin, View):
     
     
 class GraficoTemplateView(TemplateView):
-    template_name = 'dash/index.html'
+    template_name = TEMPLATE_GRAFICOS
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        loja_get = self.request.GET.get('loja')
-        loja = Loja.objects.filter(id=loja_get) if loja_get else Loja.objects.all()
-
-        vendas = Venda.objects.filter(is_deleted=False, loja__in=loja)
-        parcelas_qs = Parcela.objects.filter(
-            pagamento__venda__in=vendas,
-            pagamento__tipo_pagamento__nome='CREDFACIL'
-        ).select_related('pagamento', 'pagamento__venda')
-
-        parcelas_por_venda = defaultdict(list)
-
-        for parcela in parcelas_qs:
-            parcelas_por_venda[parcela.pagamento.venda_id].append(parcela)
-
-        total_vendas = vendas.count()
-        total_de_parcelas_vencidas = total_de_parcelas_pagas = total_de_parcelas_a_vencer = 0
-        total_pagas = total_vencidas = total_a_vencer = total_geral_parcelas = 0
-
-        valores_por_loja = defaultdict(lambda: {
-            'total_pagas': 0, 'total_vencidas': 0, 'total_a_vencer': 0,
-            'total_desativados_vencidas': 0, 'total_desativados_a_vencer': 0,
-        })
-
-        # --- DASH POR MÊS ---
-        # Estrutura: {loja_nome: {YYYY-MM: {'pago': x, 'vencido': y, 'a_vencer': z}}}
-        dash_mensal_lojas = defaultdict(lambda: defaultdict(lambda: {'pago': 0, 'vencido': 0, 'a_vencer': 0}))
-
-        for venda in vendas:
-            loja_nome = venda.loja.nome if venda.loja else 'Desconhecida'
-            parcelas = parcelas_por_venda.get(venda.id, [])
-
-            parcelas_vencidas = [p for p in parcelas if p.data_vencimento < timezone.now().date() and not p.pago and not p.pagamento_efetuado]
-            parcelas_pagas = [p for p in parcelas if p.pago and not p.pagamento_efetuado]
-            parcelas_a_vencer = [p for p in parcelas if p.data_vencimento >= timezone.now().date() and not p.pago and not p.pagamento_efetuado]
-
-            total_geral_parcelas += len(parcelas)
-            qtd_vencidas, qtd_pagas, qtd_a_vencer = len(parcelas_vencidas), len(parcelas_pagas), len(parcelas_a_vencer)
-
-            total_de_parcelas_vencidas += qtd_vencidas
-            total_de_parcelas_pagas += qtd_pagas
-            total_de_parcelas_a_vencer += qtd_a_vencer
-
-            valor_vencidas = sum(p.valor for p in parcelas_vencidas)
-            valor_pagas = sum(p.valor for p in parcelas_pagas)
-            valor_a_vencer = sum(p.valor for p in parcelas_a_vencer)
-
-            total_vencidas += valor_vencidas
-            total_pagas += valor_pagas
-            total_a_vencer += valor_a_vencer
-
-            valores_por_loja[loja_nome]['total_a_vencer'] += valor_a_vencer
-            valores_por_loja[loja_nome]['total_vencidas'] += valor_vencidas
-            valores_por_loja[loja_nome]['total_pagas'] += valor_pagas
-
-            # Calcular desativados por loja
-            parcelas_desativadas_loja = Parcela.objects.filter(
-                pagamento__venda=venda,
-                pagamento__tipo_pagamento__nome='CREDFACIL',
-                pagamento__desativado=True,
-                pago=False
-            )
-
-            for parcela_desativada in parcelas_desativadas_loja:
-                if parcela_desativada.data_vencimento < timezone.now().date():
-                    valores_por_loja[loja_nome]['total_desativados_vencidas'] += parcela_desativada.valor
-                else:
-                    valores_por_loja[loja_nome]['total_desativados_a_vencer'] += parcela_desativada.valor
-
-            # DASH MENSAL: soma por mês/ano
-            for p in parcelas:
-                mes_ano = p.data_vencimento.strftime('%Y-%m')
-                if p.pago and not p.pagamento_efetuado:
-                    dash_mensal_lojas[loja_nome][mes_ano]['pago'] += float(p.valor)
-                elif p.data_vencimento < timezone.now().date() and not p.pago and not p.pagamento_efetuado:
-                    dash_mensal_lojas[loja_nome][mes_ano]['vencido'] += float(p.valor)
-                elif p.data_vencimento >= timezone.now().date() and not p.pago and not p.pagamento_efetuado:
-                    dash_mensal_lojas[loja_nome][mes_ano]['a_vencer'] += float(p.valor)
-
-        for loja_nome, valores in valores_por_loja.items():
-            total_geral = valores['total_pagas'] + valores['total_vencidas'] + valores['total_a_vencer'] + valores['total_desativados_vencidas'] + valores['total_desativados_a_vencer']
-            valores['pct_pagas'] = round((valores['total_pagas'] / total_geral) * 100, 2) if total_geral else 0
-            valores['pct_vencidas'] = round((valores['total_vencidas'] / total_geral) * 100, 2) if total_geral else 0
-            valores['pct_desativados'] = round(((valores['total_desativados_vencidas'] + valores['total_desativados_a_vencer']) / total_geral) * 100, 2) if total_geral else 0
-
-        # Prepara dash mensal para o template (serializável)
-        dash_mensal_json = {}
-        for loja_nome, meses in dash_mensal_lojas.items():
-            dash_mensal_json[loja_nome] = []
-            for mes_ano in sorted(meses.keys()):
-                dash_mensal_json[loja_nome].append({
-                    'mes': mes_ano,
-                    'pago': meses[mes_ano]['pago'],
-                    'vencido': meses[mes_ano]['vencido'],
-                    'a_vencer': meses[mes_ano]['a_vencer'],
-                })
-
-        # --- CÁLCULO DOS CLIENTES DESATIVADOS ---
-        total_desativados_vencidas = 0
-        total_desativados_a_vencer = 0
-        qtd_desativados_vencidas = 0
-        qtd_desativados_a_vencer = 0
-
-        # Busca parcelas de clientes desativados (apenas não pagas)
-        parcelas_desativadas = Parcela.objects.filter(
-            pagamento__venda__in=vendas,
-            pagamento__tipo_pagamento__nome='CREDFACIL',
-            pagamento__desativado=True,
-            pago=False  # Apenas parcelas não pagas
-        )
-
-        for parcela in parcelas_desativadas:
-            if parcela.data_vencimento < timezone.now().date():
-                total_desativados_vencidas += parcela.valor
-                qtd_desativados_vencidas += 1
-            else:
-                total_desativados_a_vencer += parcela.valor
-                qtd_desativados_a_vencer += 1
-
-        # Total de pagamentos desativados
-        total_pagamentos_desativados = Pagamento.objects.filter(
-            venda__in=vendas,
-            tipo_pagamento__nome='CREDFACIL',
-            desativado=True
-        ).count()
-
-        # --- CÁLCULO DO VALOR TOTAL DE REPASSES ---
-        total_repasses = 0
-        repasses_por_loja = defaultdict(lambda: 0)
-        
-        # Buscar todos os produtos vendidos das vendas filtradas
-        produtos_vendidos = ProdutoVenda.objects.filter(
-            venda__in=vendas
-        ).select_related('produto', 'venda__loja')
-        
-        for produto_venda in produtos_vendidos:
-            valor_repasse = produto_venda.produto.valor_repasse_logista or 0
-            total_repasses += valor_repasse
-            loja_nome = produto_venda.venda.loja.nome if produto_venda.venda.loja else 'Desconhecida'
-            repasses_por_loja[loja_nome] += valor_repasse
-
-        context.update({
-            'loja_get': int(loja_get) if loja_get else None,
-            'lojas': Loja.objects.all(),
-            'total_vendas_loja': total_vendas,
-            'total_de_parcelas_geral': total_geral_parcelas,
-            'parcelas_vencidas': total_de_parcelas_vencidas,
-            'parcelas_pagas': total_de_parcelas_pagas,
-            'parcelas_a_vencer': total_de_parcelas_a_vencer,
-            'valor_total_parcelas': total_pagas + total_vencidas + total_a_vencer,
-            'total_pagas': total_pagas,
-            'total_vencidas': total_vencidas,
-            'total_a_vencer': total_a_vencer,
-            'total_desativados_vencidas': total_desativados_vencidas,
-            'total_desativados_a_vencer': total_desativados_a_vencer,
-            'qtd_desativados_vencidas': qtd_desativados_vencidas,
-            'qtd_desativados_a_vencer': qtd_desativados_a_vencer,
-            'total_pagamentos_desativados': total_pagamentos_desativados,
-            'total_repasses': total_repasses,
-            'repasses_por_loja': dict(repasses_por_loja),
-            'dados_lojas': json.dumps(valores_por_loja, default=str),
-            'dash_mensal_lojas': json.dumps(dash_mensal_json, default=str) if loja_get else None,
-        })
-
+        context.update(contexto_graficos(self.request.GET.get('loja')))
         return context
 
 @permission_required('vendas.change_analisecreditocliente', raise_exception=True)
@@ -3084,8 +2507,7 @@ def informar_imei_analise(request, pk):
         messages.success(request, 'RENAVAM e placa informados com sucesso! Venda liberada para geração pelo vendedor.')
         
         # Enviar notificação para analistas e administradores
-        from notifications.signals import notify
-        from notificacao.utils import enviar_ws_para_usuario
+        from notificacao.utils import destinatarios, notificar_usuarios
         
         cliente_nome = analise.cliente.nome if analise.cliente else "Cliente"
         renavam_info = f'RENAVAM {renavam_informado}' if renavam_informado else 'RENAVAM não informado'
@@ -3094,32 +2516,17 @@ def informar_imei_analise(request, pk):
         description = f'{renavam_info} da loja {loja.nome.capitalize()}. Venda liberada para geração pelo vendedor.'
         
         # Notificar analistas e administradores
-        usuarios_para_notificar = list(
-            User.objects.filter(groups__name__in=['ADMINISTRADOR', 'ANALISTA']).exclude(id=request.user.id)
+        usuarios_para_notificar = destinatarios('ADMINISTRADOR', 'ANALISTA', excluir=request.user.id)
+        notificar_usuarios(
+            usuarios_para_notificar,
+            analise,
+            verb=verb,
+            description=description,
+            target=analise.cliente,
+            target_url=analise.cliente.get_absolute_url(),
+            type_notification='analise_credito_cliente',
         )
         
-        for user in usuarios_para_notificar:
-            notify.send(
-                analise,
-                recipient=user,
-                verb=verb,
-                description=description,
-                target=analise.cliente,
-            )
-
-            # WebSocket
-            ultima_notificacao = user.notifications.unread().order_by('-timestamp').first()
-            if ultima_notificacao:
-                enviar_ws_para_usuario(
-                    usuario=user,
-                    instance=analise,
-                    notification_id=ultima_notificacao.id,
-                    verb=verb,
-                    description=description,
-                    target_url=analise.cliente.get_absolute_url(),
-                    type_notification='analise_credito_cliente',
-                )
-        
         return redirect('vendas:cliente_list')
     
     # GET request - mostrar formulário
@@ -3156,8 +2563,7 @@ class AnalistaConfirmInstalledView(PermissionRequiredMixin, View):
         analise_credito.save()
         
         # Enviar notificação para vendedores
-        from notifications.signals import notify
-        from notificacao.utils import enviar_ws_para_usuario
+        from notificacao.utils import destinatarios, notificar_usuarios
         
         cliente_nome = cliente.nome if cliente else "Cliente"
         loja = cliente.loja
@@ -3166,32 +2572,17 @@ class AnalistaConfirmInstalledView(PermissionRequiredMixin, View):
         description = f'RENAVAM {analise_credito.renavam.renavam} da loja {loja.nome.capitalize()}. Venda liberada para geração.'
         
         # Notificar vendedores e outros analistas
-        usuarios_para_notificar = list(
-            User.objects.filter(groups__name__in=['VENDEDOR', 'ADMINISTRADOR', 'ANALISTA']).exclude(id=request.user.id)
+        usuarios_para_notificar = destinatarios('VENDEDOR', 'ADMINISTRADOR', 'ANALISTA', excluir=request.user.id)
+        notificar_usuarios(
+            usuarios_para_notificar,
+            analise_credito,
+            verb=verb,
+            description=description,
+            target=cliente,
+            target_url=cliente.get_absolute_url(),
+            type_notification='analise_credito_cliente',
         )
         
-        for user in usuarios_para_notificar:
-            notify.send(
-                analise_credito,
-                recipient=user,
-                verb=verb,
-                description=description,
-                target=cliente,
-            )
-
-            # WebSocket
-            ultima_notificacao = user.notifications.unread().order_by('-timestamp').first()
-            if ultima_notificacao:
-                enviar_ws_para_usuario(
-                    usuario=user,
-                    instance=analise_credito,
-                    notification_id=ultima_notificacao.id,
-                    verb=verb,
-                    description=description,
-                    target_url=cliente.get_absolute_url(),
-                    type_notification='analise_credito_cliente',
-                )
-        
         messages.success(request, "✅ Instalação confirmada pelo analista! Venda liberada para geração.")
         return redirect('vendas:cliente_list')
 
@@ -3307,8 +2698,7 @@ def informar_renavam_placa_analise(request, pk):
         messages.success(request, 'RENAVAM e placa informados com sucesso! Venda liberada para geração pelo vendedor.')
         
         # Enviar notificação para analistas e administradores
-        from notifications.signals import notify
-        from notificacao.utils import enviar_ws_para_usuario
+        from notificacao.utils import destinatarios, notificar_usuarios
         
         cliente_nome = analise.cliente.nome if analise.cliente else "Cliente"
         renavam_info = f'RENAVAM {renavam_limpo}' if renavam_limpo else 'RENAVAM não informado'
@@ -3317,32 +2707,17 @@ def informar_renavam_placa_analise(request, pk):
         description = f'{renavam_info} - Placa: {placa_veiculo.upper()} da loja {loja.nome.capitalize()}. Venda liberada para geração pelo vendedor.'
         
         # Notificar analistas e administradores
-        usuarios_para_notificar = list(
-            User.objects.filter(groups__name__in=['ADMINISTRADOR', 'ANALISTA']).exclude(id=request.user.id)
+        usuarios_para_notificar = destinatarios('ADMINISTRADOR', 'ANALISTA', excluir=request.user.id)
+        notificar_usuarios(
+            usuarios_para_notificar,
+            analise,
+            verb=verb,
+            description=description,
+            target=analise.cliente,
+            target_url=analise.cliente.get_absolute_url(),
+            type_notification='analise_credito_cliente',
         )
         
-        for user in usuarios_para_notificar:
-            notify.send(
-                analise,
-                recipient=user,
-                verb=verb,
-                description=description,
-                target=analise.cliente,
-            )
-
-            # WebSocket
-            ultima_notificacao = user.notifications.unread().order_by('-timestamp').first()
-            if ultima_notificacao:
-                enviar_ws_para_usuario(
-                    usuario=user,
-                    instance=analise,
-                    notification_id=ultima_notificacao.id,
-                    verb=verb,
-                    description=description,
-                    target_url=analise.cliente.get_absolute_url(),
-                    type_notification='analise_credito_cliente',
-                )
-        
         return redirect('vendas:cliente_list')
     
     # GET request - mostrar formulário